@@ -0,0 +1,251 @@
+"""
+Headless HTTP/JSON search service
+
+    python api.py [--port 8888] [--processes 1] [--db papers.db] [--refresh] [--metrics]
+                  [--serving DIR]
+
+GET /search?q=...[&venue=&year=&categories=cs.CL,cs.LG&cursor=rank,id[,shards]&limit=]
+GET /search/semantic?q=...[&venue=&year=&limit=&mode=hybrid|vector]
+GET /search/all?q=...[&categories=&limit=]    local index and arXiv, merged
+GET /facets?q=...[&venue=&year=&categories=]   result counts per venue and per year
+GET /suggest?q=...[&k=8]                      search-as-you-type completions
+GET /papers/<id>/abstract
+GET /count
+GET /health
+GET /metrics[?format=json]                   Prometheus text, or JSON with slow queries and errors
+
+Every process keeps one PaperDB (connection pool and result cache) and runs
+database work on a thread pool, so slow queries never block the event loop.
+Responses carry an ETag derived from the database contents and the request,
+and a conditional GET that matches is answered 304 without touching SQLite.
+
+With --serving (or SERVING_DIR), processes read the generations published
+to that directory instead (see db/serving.py), and --refresh makes the first
+process also refresh papers.db and publish it there.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes
+
+import metrics
+from config import (API_PORT, API_WORKERS, API_MAX_LIMIT, DB_PATH, PAPERS_PER_PAGE, SUGGEST_TOP_K,
+                    SERVING_DIR)
+from db.paper_db import PaperDB
+from db.suggest import Suggester
+from search import UnifiedSearch
+
+
+class APIHandler(tornado.web.RequestHandler):
+
+    def initialize(self, db: PaperDB, executor: ThreadPoolExecutor):
+        self.db = db
+        self.executor = executor
+
+    def set_default_headers(self):
+        self.set_header('Content-Type', 'application/json; charset=utf-8')
+
+    def write_error(self, status_code: int, **kwargs):
+        reason = self._reason
+        if 'exc_info' in kwargs:
+            error = kwargs['exc_info'][1]
+            if isinstance(error, tornado.web.HTTPError) and error.log_message:
+                reason = error.log_message
+        self.finish(json.dumps({'error': reason}))
+
+    def get_int_argument(self, name: str, default=None):
+        value = self.get_argument(name, None)
+        if value in (None, ''):
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400, f'{name} must be an integer')
+
+    async def respond(self, compute, versioned: bool = True):
+        """
+        Answer with compute() as JSON, run on the worker pool, unless the
+        client already holds the current version of this response
+        Responses that depend on more than the database pass versioned=False
+        and get Tornado's default ETag, a hash of the body
+        """
+        loop = asyncio.get_running_loop()
+        if versioned:
+            version = await loop.run_in_executor(self.executor, self.db.data_version)
+            digest = hashlib.sha1(f'{version} {self.request.uri}'.encode('utf-8')).hexdigest()
+            self.set_header('Etag', f'"{digest[:20]}"')
+            if self.check_etag_header():
+                self.set_status(304)
+                return
+        try:
+            result = await loop.run_in_executor(self.executor, compute)
+        except sqlite3.OperationalError as e:
+            # compile_query quotes everything a client sends, so these are the
+            # server's: a locked or busy database is worth retrying shortly
+            busy = 'locked' in str(e) or 'busy' in str(e)
+            raise tornado.web.HTTPError(503 if busy else 500, f'database error: {e}')
+        if result is None:
+            raise tornado.web.HTTPError(404)
+        self.write(json.dumps(result))
+
+
+class SearchHandler(APIHandler):
+    async def get(self):
+        query = self.get_argument('q')
+        venue = self.get_argument('venue', None) or None
+        year = self.get_int_argument('year')
+        limit = min(max(self.get_int_argument('limit', PAPERS_PER_PAGE), 1), API_MAX_LIMIT)
+        categories = [c for c in self.get_argument('categories', '').split(',') if c] or None
+        cursor = self.get_argument('cursor', None)
+        if cursor:
+            try:
+                rank, paper_id, *index = cursor.split(',')
+                if index not in ([], ['shards']):
+                    raise ValueError(cursor)
+                cursor = (float(rank), int(paper_id), *index)
+            except ValueError:
+                raise tornado.web.HTTPError(400, 'cursor must be "rank,id" or "rank,id,shards"')
+        await self.respond(lambda: self.db.search_papers_page(
+            query, venue, year, cursor=cursor, limit=limit, categories=categories))
+
+
+class SemanticSearchHandler(APIHandler):
+    async def get(self):
+        query = self.get_argument('q')
+        venue = self.get_argument('venue', None) or None
+        year = self.get_int_argument('year')
+        limit = min(max(self.get_int_argument('limit', PAPERS_PER_PAGE), 1), API_MAX_LIMIT)
+        mode = self.get_argument('mode', 'hybrid')
+        if mode not in ('hybrid', 'vector'):
+            raise tornado.web.HTTPError(400, 'mode must be "hybrid" or "vector"')
+        await self.respond(lambda: self.db.search_papers_semantic(
+            query, venue, year, limit=limit, hybrid=mode == 'hybrid'))
+
+
+class UnifiedSearchHandler(APIHandler):
+    async def get(self):
+        query = self.get_argument('q')
+        limit = min(max(self.get_int_argument('limit', PAPERS_PER_PAGE), 1), API_MAX_LIMIT)
+        categories = [c for c in self.get_argument('categories', '').split(',') if c] or None
+        # Remote results change independently of the database
+        await self.respond(lambda: UnifiedSearch(self.db).search(query, categories, limit),
+                           versioned=False)
+
+
+class FacetsHandler(APIHandler):
+    async def get(self):
+        query = self.get_argument('q', '')
+        venue = self.get_argument('venue', None) or None
+        year = self.get_int_argument('year')
+        categories = [c for c in self.get_argument('categories', '').split(',') if c] or None
+        await self.respond(lambda: self.db.get_facets(query, venue, year, categories))
+
+
+class SuggestHandler(APIHandler):
+    def get(self):
+        # In-memory and well under a millisecond: answered on the event loop
+        query = self.get_argument('q')
+        k = min(max(self.get_int_argument('k', SUGGEST_TOP_K), 1), API_MAX_LIMIT)
+        self.write(json.dumps({'suggestions': Suggester.for_db(self.db).suggest(query, k)}))
+
+
+class AbstractHandler(APIHandler):
+    async def get(self, paper_id: str):
+        def lookup():
+            paper = self.db.get_paper(int(paper_id))
+            return {'id': paper['id'], 'abstract': paper['abstract'] or ''} if paper else None
+        await self.respond(lookup)
+
+
+class CountHandler(APIHandler):
+    async def get(self):
+        await self.respond(lambda: {'papers': self.db.get_paper_count()})
+
+
+class HealthHandler(APIHandler):
+    def get(self):
+        self.write(json.dumps({
+            'status': 'ok',
+            'connections': self.db.get_connection_stats(),
+            'cache': self.db.get_cache_stats()
+        }))
+
+
+class MetricsHandler(APIHandler):
+    def get(self):
+        # Per process: with --processes N each worker reports its own
+        if self.get_argument('format', 'prometheus') == 'json':
+            self.write(json.dumps(metrics.snapshot()))
+        else:
+            self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.write(metrics.prometheus())
+
+
+def make_app(db: PaperDB, executor: ThreadPoolExecutor) -> tornado.web.Application:
+    handler_args = {'db': db, 'executor': executor}
+    return tornado.web.Application([
+        (r'/search', SearchHandler, handler_args),
+        (r'/search/semantic', SemanticSearchHandler, handler_args),
+        (r'/search/all', UnifiedSearchHandler, handler_args),
+        (r'/facets', FacetsHandler, handler_args),
+        (r'/suggest', SuggestHandler, handler_args),
+        (r'/papers/([0-9]+)/abstract', AbstractHandler, handler_args),
+        (r'/count', CountHandler, handler_args),
+        (r'/health', HealthHandler, handler_args),
+        (r'/metrics', MetricsHandler, handler_args),
+    ])
+
+
+async def serve(sockets, db_path: str, refresh: bool, serving_dir: Optional[str] = None):
+    if serving_dir is not None:
+        from db.serving import ServingDB
+        if refresh:
+            # Publishes to serving_dir after every burst of refreshes
+            PaperDB(db_path, serving_dir=serving_dir).start_background_fetch()
+        db = ServingDB(serving_dir)
+    else:
+        db = PaperDB(db_path)
+        if refresh:
+            db.start_background_fetch()
+    executor = ThreadPoolExecutor(API_WORKERS, thread_name_prefix='api-worker')
+    # Load the suggestion index before taking requests
+    await asyncio.get_running_loop().run_in_executor(executor, Suggester.for_db, db)
+    server = HTTPServer(make_app(db, executor), xheaders=True)
+    server.add_sockets(sockets)
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cerebro search API')
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--processes', type=int, default=1,
+                        help='worker processes sharing the port (0 = one per CPU)')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--refresh', action='store_true',
+                        help='also run the background refresh of conference papers')
+    parser.add_argument('--metrics', action='store_true',
+                        help='collect stage timings and slow queries for /metrics')
+    parser.add_argument('--serving', default=SERVING_DIR, metavar='DIR',
+                        help='serve the immutable generations published to DIR')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+
+    # Bind before forking so all processes accept on the same socket; each
+    # opens its own database connections afterwards
+    sockets = bind_sockets(args.port)
+    task_id = fork_processes(args.processes) if args.processes != 1 else None
+    # Only one process writes refreshed papers
+    asyncio.run(serve(sockets, args.db, args.refresh and not task_id, args.serving))
+
+
+if __name__ == '__main__':
+    main()
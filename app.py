@@ -3,9 +3,22 @@ import urllib.request
 import xml.etree.ElementTree as ET
 from datetime import datetime
 from db.paper_db import PaperDB
-from config import VENUE_GROUPS
-from utils import initialize_session_state, display_papers, view_abstract, display_arxiv_papers
+from config import VENUE_GROUPS, ARXIV_VENUE, ARXIV_CATEGORIES, SERVING_DIR
+from db.suggest import Suggester
+from utils import (initialize_session_state, display_papers, view_abstract, display_arxiv_papers,
+                   display_unified_results, display_suggestions)
 from parsers.arxiv_parser import ArXivParser
+from search import UnifiedSearch
+
+
+@st.cache_resource
+def get_db():
+    """One PaperDB (and with it one connection pool and result cache) per process"""
+    if SERVING_DIR is not None:
+        # Read-only: papers are fetched and published by the ingesting process
+        from db.serving import ServingDB
+        return ServingDB(SERVING_DIR)
+    return PaperDB()
 
 
 def main():
@@ -13,7 +26,7 @@ def main():
         page_title="Cerebro - Search Engine for AI Conferences", page_icon="🧠", layout="centered")
 
     if 'db' not in st.session_state:
-        st.session_state.db = PaperDB()
+        st.session_state.db = get_db()
 
     if 'loaded' not in st.session_state:
         loading = st.empty()
@@ -23,7 +36,6 @@ def main():
                 needs_init = st.session_state.db.needs_initialization()
                 if needs_init:
                     st.session_state.db.load_initial_papers(progress_bar)
-                    st.session_state.db._init_search_index()
                 progress_bar.empty()
                 st.session_state.db.start_background_fetch()
                 st.session_state.loaded = True
@@ -49,7 +61,10 @@ def main():
     with col2:
         st.title("Cerebro AI Paper Search")
 
-    if st.session_state.arxiv_query_submitted:
+    # With harvested arXiv metadata the tab searches the local index instead of the API
+    arxiv_mirror = st.session_state.db.has_arxiv_mirror()
+
+    if st.session_state.arxiv_query_submitted and not arxiv_mirror:
         st.session_state.arxiv_papers = arxiv_parser.fetch_papers(
             st.session_state.current_arxiv_query,
             st.session_state.current_arxiv_categories,
@@ -57,41 +72,75 @@ def main():
         )
         st.session_state.arxiv_query_submitted = False
 
-    tabs = st.tabs(["Conference Papers", "arXiv Papers"])
+    tabs = st.tabs(["Conference Papers", "arXiv Papers", "All Sources"])
 
     with tabs[0]:
         search_query = st.text_input("", placeholder=f"🔍 Search across {st.session_state.db.get_paper_count()} papers...",
                                      key="search_query", label_visibility="collapsed")
+        if search_query:
+            # Served from the in-memory suggestion index, not the FTS index
+            display_suggestions(
+                [suggestion for suggestion in Suggester.for_db(st.session_state.db).suggest(search_query, 4)
+                 if suggestion['query'] != search_query],
+                "search_query")
 
         all_venues = []
         for venues in VENUE_GROUPS.values():
             all_venues.extend(venues)
 
+        # Label each filter option with its number of results, given the other filter
+        try:
+            facets = st.session_state.db.get_facets(
+                search_query, st.session_state.get("conf_venue"), st.session_state.get("conf_year"))
+        except Exception:
+            facets = None  # malformed query; the search below reports it
+
+        def facet_label(dimension):
+            if facets is None:
+                return str
+            counts, everything = facets[dimension + 's'], facets['any_' + dimension]
+            return lambda option: f"{option} ({everything if option == 'All' else counts.get(option, 0)})"
+
         col1, col2 = st.columns([1, 1])
         with col1:
             venue = st.selectbox(
-                "Conference", ["All"] + all_venues, key="conf_venue")
+                "Conference", ["All"] + all_venues, key="conf_venue",
+                format_func=facet_label('venue'))
         with col2:
             year = st.selectbox(
-                "Year", ["All"] + list(range(2024, 2009, -1)), key="conf_year")
+                "Year", ["All"] + list(range(2024, 2009, -1)), key="conf_year",
+                format_func=facet_label('year'))
+        # Offered once `make embed` has built the vector index
+        semantic = st.session_state.db.vector_index() is not None and st.checkbox(
+            "Re-rank by meaning", key="conf_semantic",
+            help="Blend keyword relevance with similarity of abstracts (first page only)")
 
         if search_query:
             venue_filter = None if venue == "All" else venue
             year_filter = None if year == "All" else year
+            search_key = (search_query, venue_filter, year_filter, semantic)
+            if st.session_state.get('search_key') != search_key:
+                st.session_state.search_key = search_key
+                st.session_state.current_page = 1
+                st.session_state.page_cursors = [None]
             try:
-                results = st.session_state.db.search_papers(
-                    search_query, venue_filter, year_filter)
-                st.session_state.filtered_papers = results
+                if semantic:
+                    st.session_state.search_page = st.session_state.db.search_papers_semantic(
+                        search_query, venue_filter, year_filter)
+                else:
+                    st.session_state.search_page = st.session_state.db.search_papers_page(
+                        search_query, venue_filter, year_filter,
+                        cursor=st.session_state.page_cursors[st.session_state.current_page - 1])
             except Exception as e:
                 st.error(f"Search error: {str(e)}")
-                st.session_state.filtered_papers = []
+                st.session_state.search_page = None
 
         display_papers()
 
     with tabs[1]:
         arxiv_query = st.text_input("Search arXiv papers", key="arxiv_query")
         categories = st.multiselect("Select Categories",
-                                    ["cs.AI", "cs.LG", "cs.CL", "cs.CV"],
+                                    ARXIV_CATEGORIES,
                                     default=["cs.AI"],
                                     key="category_select")
 
@@ -101,9 +150,29 @@ def main():
             st.session_state.arxiv_query_submitted = True
             st.rerun()
 
-        display_arxiv_papers(st.session_state.arxiv_papers)
-
-        if st.session_state.arxiv_papers:
+        if arxiv_mirror:
+            st.session_state.arxiv_query_submitted = False
+            arxiv_query = st.session_state.current_arxiv_query
+            arxiv_categories = st.session_state.current_arxiv_categories
+            if arxiv_query and arxiv_categories:
+                search_key = (arxiv_query, tuple(arxiv_categories))
+                if st.session_state.get('arxiv_search_key') != search_key:
+                    st.session_state.arxiv_search_key = search_key
+                    st.session_state.arxiv_current_page = 1
+                    st.session_state.arxiv_page_cursors = [None]
+                try:
+                    st.session_state.arxiv_search_page = st.session_state.db.search_papers_page(
+                        arxiv_query, ARXIV_VENUE,
+                        cursor=st.session_state.arxiv_page_cursors[st.session_state.arxiv_current_page - 1],
+                        categories=arxiv_categories)
+                except Exception as e:
+                    st.error(f"Search error: {str(e)}")
+                    st.session_state.arxiv_search_page = None
+            display_papers("arxiv_")
+        else:
+            display_arxiv_papers(st.session_state.arxiv_papers)
+
+        if st.session_state.arxiv_papers and not arxiv_mirror:
             col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
             with col1:
                 if st.session_state.arxiv_start > 0:
@@ -118,6 +187,20 @@ def main():
                     st.session_state.arxiv_query_submitted = True
                     st.rerun()
 
+    with tabs[2]:
+        unified_query = st.text_input("", placeholder="🔍 Search conference papers and arXiv at once...",
+                                      key="unified_query", label_visibility="collapsed")
+        if unified_query:
+            result = UnifiedSearch(st.session_state.db, arxiv_parser).search(
+                unified_query, limit=20)
+            display_unified_results(result)
+
+    cache_stats = st.session_state.db.get_cache_stats()
+    st.sidebar.caption(
+        f"Search cache: {cache_stats['hit_rate']:.0%} hit rate "
+        f"({cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['entries']} entries)")
+
     st.markdown(
         "Made by [Nafis Neehal](https://nafis-neehal.github.io/)")
 
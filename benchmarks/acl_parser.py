@@ -0,0 +1,99 @@
+"""
+Parity check and throughput benchmark for the ACL Anthology parser backends
+
+    python -m benchmarks.acl_parser [--papers 5000] [--rounds 3]
+
+Every saved fixture (benchmarks/fixtures/acl_*.html) must parse to identical
+output with the lxml and BeautifulSoup backends; throughput is measured on a
+large synthetic event page built by replicating the fixture entries.
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+from parsers.acl_parser import ACLPaperParser, lxml_html
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# Paper entries and their abstract cards inside an event volume
+_ENTRY_RE = re.compile(
+    r'<p class="d-sm-flex.*?</p>\s*(?:<div class="card[^"]*abstract-collapse".*?</div></div>)?',
+    re.S)
+
+
+def load_fixtures():
+    return {path.name: path.read_text(encoding='utf-8')
+            for path in sorted(FIXTURES_DIR.glob("acl_*.html"))}
+
+
+def build_large_page(html_content: str, papers: int) -> str:
+    """Replicate a fixture's entries (with unique abstract ids) up to ~papers entries"""
+    entries = _ENTRY_RE.findall(html_content)
+    blocks = []
+    copy = 0
+    while len(blocks) * len(entries) < papers:
+        blocks.append(''.join(entries).replace(
+            'acl-main--', f'acl-main-c{copy}--'))
+        copy += 1
+    body_start = html_content.index(entries[0])
+    body_end = html_content.index(entries[-1]) + len(entries[-1])
+    return html_content[:body_start] + '\n'.join(blocks) + html_content[body_end:]
+
+
+def check_parity(parser: ACLPaperParser, fixtures: dict) -> bool:
+    ok = True
+    for name, html_content in fixtures.items():
+        fast = parser._parse_papers_lxml(html_content, "ACL", 2020)
+        reference = parser._parse_papers_bs4(html_content, "ACL", 2020)
+        if fast != reference:
+            ok = False
+            print(f"PARITY MISMATCH in {name}")
+            for got, expected in zip(fast, reference):
+                if got != expected:
+                    print(f"  lxml: {got}\n  bs4:  {expected}")
+                    break
+            if len(fast) != len(reference):
+                print(f"  {len(fast)} papers (lxml) vs {len(reference)} (bs4)")
+        else:
+            print(f"parity ok: {name} ({len(fast)} papers)")
+    return ok
+
+
+def measure(parse, html_content: str, rounds: int) -> float:
+    """Best-of-rounds throughput in papers per second"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        count = len(parse(html_content, "ACL", 2020))
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--papers", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    if lxml_html is None:
+        print("lxml is not installed; nothing to compare")
+        return 1
+
+    acl = ACLPaperParser()
+    fixtures = load_fixtures()
+    if not check_parity(acl, fixtures):
+        return 1
+
+    page = build_large_page(next(iter(fixtures.values())), args.papers)
+    fast = measure(acl._parse_papers_lxml, page, args.rounds)
+    reference = measure(acl._parse_papers_bs4, page, args.rounds)
+    print(f"lxml: {fast:,.0f} papers/s")
+    print(f"bs4:  {reference:,.0f} papers/s")
+    print(f"speedup: {fast / reference:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
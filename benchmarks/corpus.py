@@ -0,0 +1,238 @@
+"""
+Synthetic paper corpus for benchmarks
+
+    python -m benchmarks.corpus [--papers 10000] [--seed 0] [--db path]
+
+Papers are generated per venue-year from a seed, so any venue-year can be
+regenerated on its own (the fixture server renders pages from it) and a
+corpus of a given size and seed is the same on every machine. The shape
+follows the real data where it matters for the hot paths: title and
+abstract words are Zipf-distributed over field terms with a long tail,
+abstract lengths are log-normal with some abstracts missing, and a few
+prolific authors write many papers while most write one or two.
+"""
+import argparse
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from config import ACL_VENUES, ML_VENUES, INGEST_YEARS
+
+CORPUS_DIR = Path(__file__).parent / ".corpus"
+
+# Frequent terms first: the head of the Zipf distribution
+_FIELD_TERMS = '''
+    language model models learning neural data task tasks training network
+    networks text translation machine large performance based approach results
+    representations representation generation dataset method methods attention
+    evaluation transformer semantic knowledge information multilingual deep
+    pretrained fine-tuning tuning question answering retrieval reasoning graph
+    benchmark context contextual word words sentence sentences embeddings
+    embedding supervised unsupervised self-supervised cross-lingual low-resource
+    zero-shot few-shot transfer domain adaptation classification detection
+    analysis parsing dependency syntactic structure structured prediction
+    summarization dialogue conversational response generative adversarial
+    reinforcement policy reward agents agent optimization gradient stochastic
+    convergence bayesian inference variational probabilistic latent diffusion
+    image vision visual multimodal speech audio recognition entity entities
+    relation extraction named coreference resolution event events temporal
+    sentiment emotion social media news documents document long efficient
+    scalable sparse robust robustness adversarial attacks bias fairness
+    interpretability explanations explainable causal counterfactual theory
+    bounds generalization regularization kernel sequence sequences encoder
+    decoder recurrent convolutional memory instruction prompting prompt
+    in-context chain-of-thought alignment preference human feedback safety
+    hallucination factuality faithfulness metrics automatic annotation corpus
+    corpora lexical morphological phonological grammar grammatical linguistic
+    linguistics typology languages english chinese arabic german hindi
+    code program synthesis mathematical math problems planning tool tools
+    contrastive clustering metric distillation compression quantization
+    pruning mixture experts federated privacy differential continual
+    lifelong curriculum active meta-learning hypernetwork architecture search
+    graph-based message passing node link heterogeneous hierarchical
+    multi-task multi-hop open-domain commonsense factual claims verification
+    misinformation hate speech toxicity moderation clinical biomedical medical
+    legal scientific citation papers scholarly educational students essay
+    readability simplification paraphrase style transfer controllable
+    story narrative poetry humor sarcasm argument argumentation stance
+    discourse coherence cohesion pragmatics implicature negation uncertainty
+    calibration confidence estimation ranking reranking dense passage
+    search queries query users user personalized recommendation
+'''.split()
+
+_FIRST_NAMES = '''
+    Wei Yang Jing Li Hao Xin Yu Jie Ming Lei Anna Maria David Michael John
+    Sarah Emily Daniel James Robert Laura Julia Thomas Peter Mark Anne Sofia
+    Ahmed Fatima Omar Layla Ravi Priya Arjun Ananya Rahul Deepa Kenji Yuki
+    Haruto Sakura Min-jun Ji-woo Seo-yeon Hyun Ivan Olga Dmitri Elena Lucas
+    Mateo Camila Valentina Diego Pablo Lucia Chloe Noah Ethan Olivia Emma
+    Liam Mia Hannah Jonas Lukas Felix Clara Ines Joao Tiago Beatriz Kofi
+    Amara Chidi Ngozi Tunde Zainab Mehmet Elif Ali Zeynep Noa Yael Eitan
+'''.split()
+
+_SURNAMES = '''
+    Wang Li Zhang Liu Chen Yang Huang Zhao Wu Zhou Xu Sun Ma Zhu Hu Guo Lin
+    He Gao Luo Smith Johnson Williams Brown Jones Garcia Miller Davis Martinez
+    Lopez Gonzalez Wilson Anderson Taylor Moore Jackson Martin Lee Thompson
+    White Harris Clark Lewis Robinson Walker Young Allen King Wright Scott
+    Kumar Sharma Singh Gupta Patel Reddy Iyer Rao Nair Das Kim Park Choi
+    Jung Kang Cho Yoon Tanaka Suzuki Takahashi Watanabe Ito Nakamura Sato
+    Muller Schmidt Schneider Fischer Weber Meyer Wagner Becker Rossi Russo
+    Ferrari Esposito Bianchi Dubois Moreau Laurent Petrov Ivanov Smirnov
+    Novak Kowalski Nowak Silva Santos Oliveira Pereira Costa Okafor Mensah
+    Yilmaz Kaya Demir Cohen Levi Mizrahi Hassan Haddad Khalil Nguyen Tran
+'''.split()
+
+_TAIL_WORDS = 50000
+_AUTHOR_POOL = 200000
+_STOPWORDS = ['for', 'of', 'with', 'in', 'and', 'via', 'on', 'from', 'to']
+
+# Relative papers per venue-year, and yearly growth of the field
+_VENUE_WEIGHTS = dict({venue: 1.0 for venue in ACL_VENUES + ML_VENUES},
+                      ACL=6.0, EMNLP=6.0, NAACL=3.0, Findings=5.0, WS=8.0,
+                      NEURIPS=10.0, ICML=6.0, ICLR=5.0, CL=0.3, TACL=0.4)
+_YEAR_GROWTH = 1.15
+
+
+def _build_vocabulary() -> Tuple[List[str], np.ndarray]:
+    """Field terms followed by a long tail of made-up words, and cumulative Zipf weights"""
+    rng = np.random.default_rng(0)
+    syllables = [consonant + vowel for consonant in 'bcdfghklmnprstvz' for vowel in 'aeiou']
+    tail = set()
+    while len(tail) < _TAIL_WORDS:
+        parts = rng.integers(0, len(syllables), size=rng.integers(2, 5))
+        word = ''.join(syllables[part] for part in parts)
+        if word not in _FIELD_TERMS:
+            tail.add(word)
+    words = list(dict.fromkeys(_FIELD_TERMS)) + sorted(tail)
+    weights = 1.0 / (np.arange(len(words)) + 2.7) ** 1.05
+    return words, np.cumsum(weights) / weights.sum()
+
+
+_WORDS, _WORD_CDF = _build_vocabulary()
+_AUTHOR_WEIGHTS = np.cumsum(1.0 / (np.arange(_AUTHOR_POOL) + 10.0) ** 1.2)
+_AUTHOR_WEIGHTS /= _AUTHOR_WEIGHTS[-1]
+
+
+def _author_name(index: int) -> str:
+    first = _FIRST_NAMES[index % len(_FIRST_NAMES)]
+    rest = index // len(_FIRST_NAMES)
+    # Shifted by the first name, so the most prolific authors do not all share a surname
+    surname = _SURNAMES[(rest + index % len(_FIRST_NAMES)) % len(_SURNAMES)]
+    # Beyond first x last name combinations, a middle initial keeps names distinct
+    middle = rest // len(_SURNAMES)
+    if middle:
+        return f'{first} {chr(ord("A") + (middle - 1) % 26)}. {surname}'
+    return f'{first} {surname}'
+
+
+def iter_venue_years(papers: int) -> Iterator[Tuple[str, int, int]]:
+    """(venue, year, count) shares of a corpus of papers papers, summing to exactly papers"""
+    cells = [(venue, year) for venue in _VENUE_WEIGHTS for year in INGEST_YEARS]
+    weights = np.array([_VENUE_WEIGHTS[venue] * _YEAR_GROWTH ** (year - INGEST_YEARS[0])
+                        for venue, year in cells])
+    shares = weights / weights.sum() * papers
+    counts = np.floor(shares).astype(np.int64)
+    # Largest remainders get the papers lost to rounding
+    counts[np.argsort(counts - shares)[:papers - counts.sum()]] += 1
+    for (venue, year), count in zip(cells, counts):
+        if count:
+            yield venue, year, int(count)
+
+
+def _sample_words(rng: np.random.Generator, count: int) -> List[str]:
+    return [_WORDS[i] for i in np.searchsorted(_WORD_CDF, rng.random(count))]
+
+
+def generate_papers(venue: str, year: int, count: int, seed: int = 0) -> Iterator[Dict[str, str]]:
+    """count paper dicts for one venue-year, the same for the same arguments"""
+    rng = np.random.default_rng([seed, zlib.crc32(f'{venue}-{year}'.encode('utf-8'))])
+    title_lengths = rng.integers(4, 13, size=count)
+    abstract_lengths = np.minimum(rng.lognormal(5.0, 0.4, size=count), 600).astype(np.int64)
+    abstract_lengths[rng.random(count) < 0.15] = 0
+    author_counts = 1 + np.minimum(rng.poisson(3.0, size=count), 30)
+    author_ids = np.searchsorted(_AUTHOR_WEIGHTS, rng.random(author_counts.sum()))
+    author_offsets = np.concatenate(([0], np.cumsum(author_counts)))
+
+    for i in range(count):
+        words = _sample_words(rng, int(title_lengths[i]))
+        # A joining word in most titles, as in "X for Y"
+        if len(words) > 3 and rng.random() < 0.7:
+            words.insert(int(rng.integers(1, len(words) - 1)), _STOPWORDS[int(rng.integers(len(_STOPWORDS)))])
+        title = ' '.join(word if word in _STOPWORDS else word.capitalize() for word in words)
+
+        abstract = ''
+        if abstract_lengths[i]:
+            words = _sample_words(rng, int(abstract_lengths[i]))
+            sentences = [' '.join(words[start:start + 18]).capitalize() + '.'
+                         for start in range(0, len(words), 18)]
+            abstract = ' '.join(sentences)
+
+        authors = [_author_name(int(index))
+                   for index in dict.fromkeys(author_ids[author_offsets[i]:author_offsets[i + 1]])]
+        yield {
+            'title': title,
+            'authors': ', '.join(authors),
+            'event': f'{venue}-{year}',
+            'paper_url': f'https://example.org/{venue.lower()}-{year}/{i}.pdf',
+            'abstract': abstract
+        }
+
+
+def build_database(path, papers: int, seed: int = 0, progress_callback=None) -> int:
+    """Store a synthetic corpus in a fresh database at path; returns how many papers"""
+    from db.paper_db import PaperDB
+
+    db = PaperDB(path)
+    db.mark_initialized()
+    stored = 0
+    for venue, year, count in iter_venue_years(papers):
+        db._store_papers(venue, year, generate_papers(venue, year, count, seed))
+        stored += count
+        if progress_callback:
+            progress_callback(stored, papers)
+    return stored
+
+
+def corpus_database(papers: int, seed: int = 0) -> Path:
+    """Path of a cached corpus database of this size and seed, built on first use"""
+    path = CORPUS_DIR / f'corpus-{papers}-{seed}.db'
+    if not path.exists():
+        CORPUS_DIR.mkdir(exist_ok=True)
+        building = path.with_name(path.name + '.building')
+        for stale in CORPUS_DIR.glob(building.name + '*'):
+            stale.unlink()
+        build_database(building, papers, seed)
+        from db.connection import ConnectionManager
+        with ConnectionManager.for_path(building).writer() as conn:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        building.rename(path)
+        for leftover in CORPUS_DIR.glob(building.name + '-*'):
+            leftover.unlink()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--papers', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', help='build here instead of in the benchmark corpus cache')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.db:
+        progress = lambda done, total: print(f'  {done}/{total} papers', end='\r', flush=True)
+        build_database(args.db, args.papers, args.seed, progress)
+        path = args.db
+    else:
+        path = corpus_database(args.papers, args.seed)
+    print(f'\n{args.papers} papers in {path} ({time.perf_counter() - start:.1f}s)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
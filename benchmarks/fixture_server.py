@@ -0,0 +1,188 @@
+"""
+Local stand-in for the ACL Anthology and the ML conference sites
+
+    python -m benchmarks.fixture_server [--papers 10000] [--port 8765]
+
+Serves event pages and orals/posters dumps in the markup of the recorded
+fixtures (benchmarks/fixtures), filled with the synthetic corpus of
+benchmarks/corpus.py, so ingestion can be benchmarked end to end without
+the network. Responses carry an ETag and conditional requests are answered
+304, as the real sites do.
+"""
+import argparse
+import copy
+import hashlib
+import html
+import json
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+from benchmarks.acl_parser import FIXTURES_DIR, _ENTRY_RE
+from benchmarks.corpus import generate_papers, iter_venue_years
+from config import ACL_VENUES
+from parsers.acl_parser import ACLPaperParser
+from parsers.ml_parser import MLConferencePaperParser
+
+_ACL_PATH_RE = re.compile(r'^/events/([a-z0-9]+)-([0-9]{4})/$')
+_ML_PATH_RE = re.compile(r'^/static/virtual/data/([a-z]+)-([0-9]{4})-orals-posters\.json$')
+
+_ACL_ENTRY = '''<p class="d-sm-flex align-items-stretch"><span class="d-block mr-2 text-nowrap list-button-row"><a class="badge badge-primary align-middle mr-1" href="https://aclanthology.org/{key}.pdf" data-toggle="tooltip" data-placement="top" title="Open PDF">pdf</a>
+<a class="badge badge-secondary align-middle mr-1" href="/{key}.bib" data-toggle="tooltip" data-placement="top" title="Export to BibTeX">bib</a>{abstract_badge}</span><span class="d-block"><strong><a class="align-middle" href="/{key}/">{title}</a></strong><br>{authors}</span></p>
+'''
+_ACL_ABSTRACT_BADGE = '''
+<a class="badge badge-info align-middle mr-1" href="#abstract-{anchor}" data-toggle="collapse" aria-expanded="false" aria-controls="abstract-{key}" title="Show Abstract">abs</a>'''
+_ACL_ABSTRACT = '''<div class="card bg-light mb-2 mb-lg-3 collapse abstract-collapse" id="abstract-{anchor}"><div class="card-body p-3 small">{abstract}</div></div>
+'''
+
+
+def _acl_author(name: str) -> str:
+    slug = re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+    return f'<a href="/people/{slug[0]}/{slug}/">{html.escape(name)}</a>'
+
+
+class FixtureServer:
+    """
+    HTTP server on a background thread answering with the synthetic corpus
+    of papers papers and seed; use as a context manager
+    """
+
+    def __init__(self, papers: int, seed: int = 0, port: int = 0):
+        self.seed = seed
+        self.counts = {(venue, year): count for venue, year, count in iter_venue_years(papers)}
+        acl = ACLPaperParser()
+        self.acl_venues = {acl._sanitize_venue_name(venue): venue for venue in ACL_VENUES}
+        self.ml_origins = MLConferencePaperParser().conference_urls
+
+        page = (FIXTURES_DIR / 'acl_event.html').read_text(encoding='utf-8')
+        entries = _ENTRY_RE.findall(page)
+        self._acl_head = page[:page.index(entries[0])]
+        self._acl_tail = page[page.index(entries[-1]) + len(entries[-1]):]
+        dump = json.loads((FIXTURES_DIR / 'ml_orals_posters.json').read_text(encoding='utf-8'))
+        self._ml_template = dump['results'][0]
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._answer(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        self.requests = 0
+        self._thread = None
+
+    def mirrors(self) -> Dict[str, str]:
+        """Origins of the real sites, each mapped to this server (for CachedFetcher)"""
+        origins = {ACLPaperParser().base_url: self.url}
+        origins.update({origin: self.url for origin in self.ml_origins.values()})
+        return origins
+
+    def __enter__(self) -> 'FixtureServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        name='fixture-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _route(self, path: str):
+        """(venue, year, renderer) for a request path, or None"""
+        match = _ACL_PATH_RE.match(path)
+        if match and match.group(1) in self.acl_venues:
+            return self.acl_venues[match.group(1)], int(match.group(2)), self.render_acl
+        match = _ML_PATH_RE.match(path)
+        if match and match.group(1).upper() in self.ml_origins:
+            return match.group(1).upper(), int(match.group(2)), self.render_ml
+        return None
+
+    def _answer(self, request: BaseHTTPRequestHandler):
+        self.requests += 1
+        route = self._route(request.path.split('?')[0])
+        if route is None or (route[0], route[1]) not in self.counts:
+            request.send_error(404)
+            return
+        venue, year, render = route
+        # Pages are a function of the corpus, so the ETag is known before rendering
+        etag = '"%s"' % hashlib.sha1(f'{self.seed} {venue} {year} {self.counts[venue, year]}'
+                                     .encode('utf-8')).hexdigest()[:20]
+        if request.headers.get('If-None-Match') == etag:
+            request.send_response(304)
+            request.send_header('ETag', etag)
+            request.end_headers()
+            return
+        body = render(venue, year)
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/json' if render == self.render_ml
+                            else 'text/html; charset=utf-8')
+        request.send_header('Content-Length', str(len(body)))
+        request.send_header('ETag', etag)
+        request.end_headers()
+        request.wfile.write(body)
+
+    def _papers(self, venue: str, year: int):
+        return generate_papers(venue, year, self.counts.get((venue, year), 0), self.seed)
+
+    def render_acl(self, venue: str, year: int) -> bytes:
+        """An event page in the recorded markup, one entry and abstract card per paper"""
+        volume = f'{year}.{ACLPaperParser()._sanitize_venue_name(venue)}-main'
+        parts = [self._acl_head]
+        for number, paper in enumerate(self._papers(venue, year), 1):
+            key = f'{volume}.{number}'
+            anchor = key.replace('.', '--', 2)
+            parts.append(_ACL_ENTRY.format(
+                key=key,
+                title=html.escape(paper['title']),
+                authors='\n| '.join(_acl_author(name) for name in paper['authors'].split(', ')),
+                abstract_badge=_ACL_ABSTRACT_BADGE.format(anchor=anchor, key=key)
+                if paper['abstract'] else ''))
+            if paper['abstract']:
+                parts.append(_ACL_ABSTRACT.format(anchor=anchor, abstract=html.escape(paper['abstract'])))
+        parts.append(self._acl_tail)
+        return ''.join(parts).encode('utf-8')
+
+    def render_ml(self, venue: str, year: int) -> bytes:
+        """An orals/posters dump in the recorded format, one result per paper"""
+        results = []
+        for number, paper in enumerate(self._papers(venue, year), 1):
+            entry = copy.copy(self._ml_template)
+            entry['id'] = entry['sourceid'] = year * 100000 + number
+            entry['uid'] = hashlib.md5(f'{venue}-{year}-{number}'.encode('utf-8')).hexdigest()
+            entry['name'] = paper['title']
+            entry['abstract'] = paper['abstract']
+            entry['authors'] = [{'id': number * 10 + i, 'fullname': name,
+                                 'url': None, 'institution': ''}
+                                for i, name in enumerate(paper['authors'].split(', '))]
+            entry['virtualsite_url'] = f'/virtual/{year}/poster/{entry["id"]}'
+            results.append(entry)
+        return json.dumps({'count': len(results), 'next': None, 'previous': None,
+                           'results': results}).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--papers', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    with FixtureServer(args.papers, args.seed, args.port) as server:
+        print(f'Serving {args.papers} synthetic papers at {server.url}')
+        print('HTTP_MIRRORS = ' + json.dumps(server.mirrors()))
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""
+Ingestion and search benchmark suite, compared against a stored baseline
+
+    python -m benchmarks.run [--scale small|medium|large] [--papers N]
+                             [--scenarios ingest,search] [--save-baseline]
+
+Scales are synthetic corpora of 10k, 100k and 1M papers (benchmarks/corpus.py);
+ingestion fetches from a local stand-in of the real sites
+(benchmarks/fixture_server.py), so no run touches the network. Every scenario
+runs in a fresh process, which makes its peak RSS its own. Results are
+compared with benchmarks/baseline.json for the same scale, and the run fails
+when a metric is worse than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.corpus import _WORDS, corpus_database
+
+BASELINE_PATH = Path(__file__).parent / 'baseline.json'
+SCALES = {'small': 10000, 'medium': 100000, 'large': 1000000}
+
+# Differences smaller than these are noise whatever the ratio, by metric suffix
+_NOISE_FLOOR = {'_ms': 0.5, '_s': 0.05, '_mb': 5.0}
+
+# (query, venue, year): common, mid-frequency and rare words, conjunctions,
+# phrases, prefixes, column and author qualifiers, exclusions and filters
+QUERIES = [
+    (_WORDS[0], None, None),
+    (_WORDS[1], None, None),
+    (_WORDS[40], None, None),
+    (_WORDS[150], None, None),
+    (_WORDS[2000], None, None),
+    (_WORDS[20000], None, None),
+    ('neural translation', None, None),
+    ('language model training data', None, None),
+    ('"language model"', None, None),
+    ('trans*', None, None),
+    ('title:summarization', None, None),
+    ('author:"Wei Wang"', None, None),
+    ('language -model', None, None),
+    ('summarization OR dialogue', None, None),
+    ('model', 'ACL', 2020),
+    ('learning', 'NEURIPS', None),
+    ('', 'EMNLP', 2022),
+]
+
+
+def _percentiles(latencies: List[float], prefix: str = '') -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {f'{prefix}p50_ms': p50, f'{prefix}p95_ms': p95, f'{prefix}p99_ms': p99}
+
+
+def _timed(function: Callable, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def _largest(server, venues) -> tuple:
+    return max(((venue, year) for venue, year in server.counts if venue in venues),
+               key=lambda venue_year: server.counts[venue_year])
+
+
+def scenario_parse_acl(papers: int, seed: int, workdir: Path, rounds: int) -> Dict[str, float]:
+    """ACLPaperParser._parse_papers over the largest ACL event page of the corpus"""
+    from benchmarks.fixture_server import FixtureServer
+    from config import ACL_VENUES
+    from parsers.acl_parser import ACLPaperParser
+
+    server = FixtureServer(papers, seed)
+    venue, year = _largest(server, ACL_VENUES)
+    page = server.render_acl(venue, year).decode('utf-8')
+    parser = ACLPaperParser()
+    best = min(_timed(parser._parse_papers, page, venue, year) for _ in range(rounds))
+    return {'papers': server.counts[venue, year], 'page_ms': best * 1000,
+            'papers_per_s': server.counts[venue, year] / best}
+
+
+def scenario_parse_ml(papers: int, seed: int, workdir: Path, rounds: int) -> Dict[str, float]:
+    """MLConferencePaperParser._extract_paper_info, and the streaming parse of a whole dump"""
+    from benchmarks.fixture_server import FixtureServer
+    from config import ML_VENUES
+    from parsers.fetcher import FetchResult
+    from parsers.ml_parser import MLConferencePaperParser
+
+    server = FixtureServer(papers, seed)
+    venue, year = _largest(server, ML_VENUES)
+    dump = workdir / 'dump.json'
+    dump.write_bytes(server.render_ml(venue, year))
+    results = json.loads(dump.read_bytes())['results']
+    parser = MLConferencePaperParser()
+
+    def extract():
+        for paper_data in results:
+            parser._extract_paper_info(paper_data, venue, year)
+
+    def stream():
+        for _ in parser.iter_papers(FetchResult(str(dump), None, True, 200, dump), venue, year):
+            pass
+
+    count = len(results)
+    return {'papers': count,
+            'extract_papers_per_s': count / min(_timed(extract) for _ in range(rounds)),
+            'stream_papers_per_s': count / min(_timed(stream) for _ in range(rounds))}
+
+
+def scenario_ingest(papers: int, seed: int, workdir: Path, rounds: int) -> Dict[str, float]:
+    """_fetch_and_store_papers for every venue-year into a fresh database, then a revalidation pass"""
+    from benchmarks.fixture_server import FixtureServer
+    from db.paper_db import PaperDB
+    from parsers.fetcher import CachedFetcher, set_fetcher
+
+    with FixtureServer(papers, seed) as server:
+        set_fetcher(CachedFetcher(workdir / 'http_cache', server.mirrors()))
+        db = PaperDB(workdir / 'ingest.db')
+        latencies = []
+        start = time.perf_counter()
+        for venue, year in server.counts:
+            latencies.append(_timed(db._fetch_and_store_papers, venue, year))
+        elapsed = time.perf_counter() - start
+        # Unchanged sources: every fetch is a 304 and nothing is parsed or written
+        revalidate = sum(_timed(db._fetch_and_store_papers, venue, year) for venue, year in server.counts)
+    return dict(papers_per_s=papers / elapsed, ingest_s=elapsed, revalidate_s=revalidate,
+                **_percentiles(latencies, 'venue_year_'))
+
+
+def scenario_fts_rebuild(papers: int, seed: int, workdir: Path, rounds: int) -> Dict[str, float]:
+    """Rebuilding the full-text index from the papers table"""
+    from db.connection import ConnectionManager
+
+    path = workdir / 'rebuild.db'
+    shutil.copy(corpus_database(papers, seed), path)
+    connections = ConnectionManager.for_path(path)
+    best = float('inf')
+    for _ in range(max(1, rounds // 2)):
+        with connections.writer() as conn:
+            start = time.perf_counter()
+            conn.execute("INSERT INTO papers_search(papers_search) VALUES('rebuild')")
+        best = min(best, time.perf_counter() - start)
+    return {'rebuild_s': best, 'papers_per_s': papers / best}
+
+
+def _query_latencies(run: Callable, rounds: int) -> List[float]:
+    latencies = []
+    for _ in range(rounds):
+        for query, venue, year in QUERIES:
+            latencies.append(_timed(run, query, venue, year))
+    return latencies
+
+
+def scenario_search(papers: int, seed: int, workdir: Path, rounds: int) -> Dict[str, float]:
+    """First pages of search_papers_page for the query mix, bypassing the result cache"""
+    from db.paper_db import PaperDB
+
+    db = PaperDB(corpus_database(papers, seed))
+    latencies = _query_latencies(db._search_papers_page, rounds)
+    return dict(queries_per_s=len(latencies) / sum(latencies), **_percentiles(latencies))
+
+
+def scenario_search_sharded(papers: int, seed: int, workdir: Path, rounds: int) -> Dict[str, float]:
+    """The search scenario against index shards searched by a process pool, after building them"""
+    from db.paper_db import PaperDB
+    from db.shards import ShardedIndex
+
+    path = workdir / 'sharded.db'
+    shutil.copy(corpus_database(papers, seed), path)
+    db = PaperDB(path)
+    shards = ShardedIndex.for_db(db)
+    build = _timed(shards.build)
+    # Start the workers outside the measurements
+    db._search_papers_page(*QUERIES[0])
+    latencies = _query_latencies(db._search_papers_page, rounds)
+    shards.close()
+    return dict(build_s=build, queries_per_s=len(latencies) / sum(latencies), **_percentiles(latencies))
+
+
+def scenario_facets(papers: int, seed: int, workdir: Path, rounds: int) -> Dict[str, float]:
+    """get_facets for the query mix, bypassing the result cache"""
+    from db.paper_db import PaperDB
+
+    db = PaperDB(corpus_database(papers, seed))
+    latencies = _query_latencies(db._get_facets, rounds)
+    return dict(queries_per_s=len(latencies) / sum(latencies), **_percentiles(latencies))
+
+
+def scenario_suggest(papers: int, seed: int, workdir: Path, rounds: int) -> Dict[str, float]:
+    """Building the suggestion index, and completing every prefix of the query mix"""
+    from db.paper_db import PaperDB
+    from db.suggest import Suggester
+
+    db = PaperDB(corpus_database(papers, seed))
+    start = time.perf_counter()
+    suggester = Suggester(db)
+    build = time.perf_counter() - start
+    prefixes = [query[:length] for query, _, _ in QUERIES for length in range(1, len(query) + 1)]
+    latencies = [_timed(suggester.suggest, prefix) for _ in range(rounds) for prefix in prefixes]
+    return dict(build_s=build, **_percentiles(latencies))
+
+
+SCENARIOS = {
+    'parse_acl': scenario_parse_acl,
+    'parse_ml': scenario_parse_ml,
+    'ingest': scenario_ingest,
+    'fts_rebuild': scenario_fts_rebuild,
+    'search': scenario_search,
+    'search_sharded': scenario_search_sharded,
+    'facets': scenario_facets,
+    'suggest': scenario_suggest,
+}
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process"""
+    # ru_maxrss survives exec on Linux, so a spawned child would report its
+    # parent's peak; the high-water mark in /proc starts afresh
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _run_scenario(name: str, papers: int, seed: int, rounds: int) -> Dict[str, float]:
+    """Run in a child process: the scenario's metrics plus the process's peak RSS"""
+    with tempfile.TemporaryDirectory(prefix=f'bench-{name}-') as workdir:
+        metrics = SCENARIOS[name](papers, seed, Path(workdir), rounds)
+    metrics['peak_rss_mb'] = _peak_rss_mb()
+    return {metric: round(float(value), 4) for metric, value in metrics.items()}
+
+
+def run_scenario(name: str, papers: int, seed: int, rounds: int) -> Dict[str, float]:
+    """Run one scenario in a fresh process"""
+    # Not a multiprocessing.Pool, whose daemonic workers cannot start the shard search pool
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_run_scenario, name, papers, seed, rounds).result()
+
+
+def compare(metric: str, value: float, baseline: float, tolerance: float):
+    """(relative change, whether it is a regression); positive changes are improvements"""
+    if metric.endswith('_per_s'):
+        change = (value - baseline) / baseline if baseline else 0.0
+    elif metric.endswith(tuple(_NOISE_FLOOR)):
+        change = (baseline - value) / baseline if baseline else 0.0
+        floor = next(floor for suffix, floor in _NOISE_FLOOR.items() if metric.endswith(suffix))
+        if abs(value - baseline) < floor:
+            return change, False
+    else:
+        return None, False  # a count, not a measurement
+    return change, change < -tolerance
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--papers', type=int, help='corpus size, overriding --scale')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='comma-separated subset of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--baseline', default=str(BASELINE_PATH))
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the baseline for this scale')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='largest relative slowdown not reported as a regression')
+    args = parser.parse_args()
+
+    papers = args.papers or SCALES[args.scale]
+    scale = args.scale if not args.papers else f'{papers}'
+    names = [name for name in args.scenarios.split(',') if name]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    baseline_path = Path(args.baseline)
+    baselines = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    baseline = baselines.get(scale, {})
+    if baseline and (baseline.get('papers'), baseline.get('seed')) != (papers, args.seed):
+        baseline = {}
+
+    print(f'Corpus: {papers} papers (seed {args.seed})')
+    start = time.perf_counter()
+    corpus_database(papers, args.seed)
+    print(f'  ready in {time.perf_counter() - start:.1f}s')
+
+    results = {}
+    regressions = []
+    print(f'\n{"scenario":<12} {"metric":<24} {"value":>12} {"baseline":>12} {"change":>8}')
+    for name in names:
+        results[name] = run_scenario(name, papers, args.seed, args.rounds)
+        for metric, value in results[name].items():
+            expected = baseline.get('results', {}).get(name, {}).get(metric)
+            line = f'{name:<12} {metric:<24} {value:>12,.2f}'
+            if expected is not None:
+                change, regressed = compare(metric, value, expected, args.tolerance)
+                line += f' {expected:>12,.2f}'
+                if change is not None:
+                    line += f' {change:>+8.0%}' + ('  REGRESSION' if regressed else '')
+                if regressed:
+                    regressions.append(f'{name}.{metric}')
+            print(line)
+
+    if args.save_baseline:
+        previous = baselines.get(scale, {}).get('results', {})
+        baselines[scale] = {
+            'papers': papers,
+            'seed': args.seed,
+            'machine': f'{platform.machine()} {platform.system()} Python {platform.python_version()}',
+            'recorded_at': time.strftime('%Y-%m-%d'),
+            'results': dict(previous, **results),
+        }
+        baseline_path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        print(f'\nBaseline for {scale} saved to {baseline_path}')
+    elif not baseline:
+        print(f'\nNo baseline for {scale}; record one with --save-baseline')
+
+    if regressions:
+        print(f'\n{len(regressions)} regressions beyond {args.tolerance:.0%}: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
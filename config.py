@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 # Configuration constants
 PAPERS_PER_PAGE = 10
 
@@ -15,3 +17,184 @@ VENUE_GROUPS = {
     "ACL": ACL_VENUES,
     "ML": ML_VENUES
 }
+
+# Years crawled when the database is first populated
+INGEST_YEARS = range(2010, 2025)
+
+# Concurrent ingestion: fetch/parse pool sizes and per-host request limits
+INGEST_FETCH_WORKERS = 8
+INGEST_PARSE_WORKERS = 2
+INGEST_QUEUE_BATCHES = 16  # parsed batches waiting for the writer
+HOST_CONCURRENCY = {
+    "aclanthology.org": 4,
+    "neurips.cc": 2,
+    "icml.cc": 2,
+    "iclr.cc": 2
+}
+DEFAULT_HOST_CONCURRENCY = 2
+
+# Seconds to wait on a single HTTP request
+HTTP_TIMEOUT = 30
+
+# Rows written per executemany/transaction when storing papers
+WRITE_BATCH_SIZE = 500
+
+# SQLite database file and connection tuning
+DB_PATH = "papers.db"
+SQLITE_READ_POOL_SIZE = 8
+SQLITE_STATEMENT_CACHE = 256
+SQLITE_BUSY_TIMEOUT_MS = 30000
+SQLITE_PRAGMAS = {
+    "cache_size": -64000,       # negative = KiB, i.e. 64 MB page cache
+    "mmap_size": 268435456,     # 256 MB
+    "temp_store": "MEMORY",
+    "synchronous": "NORMAL"
+}
+
+# Result counts are exact up to this many matches, reported as "N+" beyond it
+SEARCH_COUNT_CAP = 1000
+
+# Process-wide search result cache
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+QUERY_CACHE_TTL = 600  # seconds
+
+# Filtered searches matching at most this many papers scan the venue/year
+# index first and probe the FTS index by rowid
+FILTER_FIRST_MAX_ROWS = 5000
+
+# Shared HTTP fetch layer: retries, connection pool and on-disk response cache
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5  # seconds, doubled on every retry
+HTTP_POOL_SIZE = 16
+HTTP_CACHE_DIR = ".http_cache"
+HTTP_STREAM_CHUNK_SIZE = 1024 * 1024  # bytes per chunk when streaming large files
+HTTP_PENDING_MAX_AGE = 24 * 3600  # seconds before an uncommitted body is swept
+# Origins to fetch from a stand-in instead, e.g. {"https://aclanthology.org": "http://localhost:8000"}
+HTTP_MIRRORS = {}
+
+# Background refresh: how long a crawl of a venue-year stays fresh, by how
+# far the year lies in the past, and how often to look for due venue-years
+REFRESH_INTERVALS = {
+    "current": timedelta(hours=6),   # this year and next
+    "recent": timedelta(days=1),     # last year
+    "archive": timedelta(days=30)    # everything older
+}
+REFRESH_CHECK_INTERVAL = 600  # seconds
+
+# arXiv API: results are fetched in blocks and UI pages are served from them
+ARXIV_BLOCK_SIZE = 100
+ARXIV_CACHE_MAX_BLOCKS = 256
+ARXIV_CACHE_TTL = 900  # seconds
+
+# Local arXiv mirror: categories kept from bulk harvests, and the default
+# source (an OAI-PMH endpoint, or a directory of feed/dump files)
+ARXIV_VENUE = "arXiv"
+ARXIV_CATEGORIES = ["cs.AI", "cs.LG", "cs.CL", "cs.CV"]
+ARXIV_HARVEST_SOURCE = "http://export.arxiv.org/oai2"
+
+# Unified search: each source is queried concurrently and dropped from the
+# merged results if it has not answered within its budget (seconds)
+SEARCH_SOURCE_TIMEOUTS = {
+    "local": 1.0,
+    "arxiv": 2.5
+}
+SEARCH_SOURCE_WEIGHTS = {
+    "local": 1.0,
+    "arxiv": 0.8
+}
+# Threads per source; a source whose threads are all still busy with earlier
+# searches (e.g. a slow upstream API) is skipped rather than queued for
+SEARCH_FANOUT_WORKERS = {
+    "local": 8,
+    "arxiv": 4
+}
+DEFAULT_SEARCH_FANOUT_WORKERS = 2
+
+# Headless search API (api.py)
+API_PORT = 8888
+API_WORKERS = 8  # threads running database work per process
+API_MAX_LIMIT = 100  # largest page size a client may request
+
+# Full-text index: tokenizer, prefix index lengths for type-ahead queries,
+# and bm25 weights of the indexed columns (titles count most)
+FTS_TOKENIZE = "porter unicode61 remove_diacritics 2"
+FTS_PREFIX = "2 3"
+SEARCH_BM25_WEIGHTS = {
+    "title": 10.0,
+    "abstract": 1.0,
+    "authors": 3.0
+}
+
+# Sharded full-text search (db/shards.py): the index split over SEARCH_SHARDS
+# databases, by paper id (modulo the shard count) or by venue group, searched in
+# parallel by a pool of SEARCH_SHARD_WORKERS processes (None: one per shard,
+# at most one per core). Used for paged searches once built
+SEARCH_SHARDS = 4
+SEARCH_SHARD_BY = "id"  # or "venue_group"
+SEARCH_SHARD_WORKERS = None
+SEARCH_SHARD_TIMEOUT = 10.0  # seconds before a shard query is given up on
+
+# Corpus snapshots (db/snapshot.py): Parquet files of every table, read and
+# written this many rows at a time
+SNAPSHOT_COMPRESSION = "zstd"
+SNAPSHOT_BATCH_ROWS = 50000
+
+# Read-only serving (db/serving.py): the ingesting process publishes immutable
+# copies of the database to generations of SERVING_DIR, which readers map into
+# memory and switch to once CURRENT names a new one. None serves papers.db itself
+SERVING_DIR = None  # e.g. "serving"
+SERVING_MMAP_SIZE = 8 * 1024 ** 3  # SQLite caps this at its compile-time maximum (2 GB by default)
+SERVING_CHECK_INTERVAL = 2.0  # seconds between looks at CURRENT
+SERVING_RETIRE_DELAY = 60.0  # seconds a replaced generation stays open for calls still using it
+SERVING_PUBLISH_INTERVAL = 300  # seconds; refreshes publish once the queue drains, or this often
+SERVING_KEEP_GENERATIONS = 3  # published generations kept on disk, the current one included
+
+# Search-as-you-type suggestions (db/suggest.py)
+SUGGEST_TOP_K = 8
+SUGGEST_PRECOMPUTED_PREFIX = 3  # prefixes up to this length have their top-k precomputed
+SUGGEST_MIN_COUNT = 2  # title words/phrases must occur in this many papers
+SUGGEST_REFRESH_INTERVAL = 600  # seconds between rebuilds after new papers arrive
+
+# Semantic search (db/vectors.py): hashed TF-IDF embeddings, randomly
+# projected to VECTOR_DIM, with an IVF index of sqrt(n) k-means lists
+VECTOR_DIM = 256
+VECTOR_HASH_BUCKETS = 2 ** 16
+VECTOR_SEED = 1234
+VECTOR_BATCH_SIZE = 512  # papers embedded per step
+VECTOR_NPROBE = 8  # IVF lists searched per query
+VECTOR_KMEANS_SAMPLE = 20000
+VECTOR_KMEANS_ITERATIONS = 12
+VECTOR_HYBRID_CANDIDATES = 200  # full-text matches re-ranked by similarity
+VECTOR_HYBRID_ALPHA = 0.6  # weight of cosine similarity against bm25 when re-ranking
+
+# Related papers (db/related.py): nearest neighbours of every paper by
+# embedding, computed offline in blocks of papers x chunks of the corpus
+RELATED_TOP_N = 10
+RELATED_MIN_SCORE = 0.2  # cosine similarity below which papers are not related
+RELATED_BLOCK_SIZE = 1024  # papers whose neighbours are found per step
+RELATED_CHUNK_SIZE = 8192  # corpus vectors compared per matrix product
+
+# Near-duplicate detection (db/dedup.py): MinHash signatures of titles and
+# abstracts, split into DEDUP_BANDS bands for LSH candidate lookup
+DEDUP_PERMUTATIONS = 60  # per signature; a multiple of DEDUP_BANDS
+DEDUP_BANDS = 12
+DEDUP_TITLE_SHINGLE = 5  # characters
+DEDUP_ABSTRACT_SHINGLE = 3  # words
+DEDUP_MIN_TITLE_CHARS = 20  # shorter titles ("Preface") only match with their abstracts
+DEDUP_TITLE_THRESHOLD = 0.8  # title similarity, if abstracts do not disagree...
+DEDUP_ABSTRACT_AGREE = 0.5  # ...i.e. one is missing or they are at least this similar
+DEDUP_ABSTRACT_THRESHOLD = 0.7  # abstract similarity that suffices on its own
+DEDUP_MAX_BUCKET = 50  # LSH buckets holding more papers are too generic to use
+# Which member of a cluster is shown: lowest rank first, then the oldest row
+DEDUP_VENUE_RANK = {"Findings": 1, "WS": 2, "arXiv": 3}
+
+# Instrumentation (metrics.py): stage timings, per-venue counters and a log of
+# slow queries with their plans, served by the API at /metrics. Off by
+# default, and then every hook returns after one check
+METRICS_ENABLED = False
+METRICS_SLOW_QUERY_MS = 200  # queries at least this slow are logged with their plan
+METRICS_LOG_SIZE = 100  # slow queries and errors kept, oldest dropped first
+METRICS_WINDOW = 1024  # recent durations per series kept for percentiles
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)  # seconds
+METRICS_DUMP_PATH = None  # e.g. "metrics.json": written every METRICS_DUMP_INTERVAL seconds
+METRICS_DUMP_INTERVAL = 60
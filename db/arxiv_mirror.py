@@ -0,0 +1,154 @@
+import argparse
+import itertools
+import sys
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from config import ARXIV_VENUE, ARXIV_CATEGORIES, ARXIV_HARVEST_SOURCE, WRITE_BATCH_SIZE, DB_PATH
+from db.authors import sync_paper_authors
+
+# Revise an already mirrored paper in place (titles change between versions)
+UPDATE_ARXIV_SQL = f'''
+    UPDATE OR IGNORE papers
+    SET title = :title, authors = :authors, year = :year,
+        abstract = :abstract, last_updated = :now
+    WHERE venue = '{ARXIV_VENUE}' AND paper_url = :paper_url
+        AND (title IS NOT :title OR authors IS NOT :authors OR abstract IS NOT :abstract)
+'''
+
+INSERT_ARXIV_SQL = f'''
+    INSERT INTO papers
+    (title, authors, venue, year, paper_url, abstract, last_updated)
+    SELECT :title, :authors, '{ARXIV_VENUE}', :year, :paper_url, :abstract, :now
+    WHERE NOT EXISTS (
+        SELECT 1 FROM papers WHERE venue = '{ARXIV_VENUE}' AND paper_url = :paper_url)
+    ON CONFLICT(title, venue, year) DO NOTHING
+'''
+
+
+class ArXivMirror:
+    """
+    Bulk harvest of arXiv metadata into the papers table, where the FTS
+    triggers index it next to the conference papers. Each source resumes
+    where its last harvest stopped: a finished harvest records the newest
+    datestamp it saw, and an interrupted one the cursor of the last stored page
+    """
+
+    def __init__(self, db, categories: Optional[List[str]] = None):
+        self.db = db
+        self.categories = set(ARXIV_CATEGORIES if categories is None else categories)
+
+    def get_state(self, source_name: str) -> Optional[Dict[str, Any]]:
+        with self.db.connections.reader() as conn:
+            row = conn.execute('SELECT * FROM harvest_state WHERE source = ?',
+                               (source_name,)).fetchone()
+            return dict(row) if row else None
+
+    def _save_state(self, source_name: str, datestamp: Optional[str], cursor: Optional[str],
+                    max_datestamp: Optional[str], records: int):
+        with self.db.connections.writer() as conn:
+            conn.execute('''
+                INSERT INTO harvest_state
+                (source, datestamp, cursor, max_datestamp, last_harvested, record_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source) DO UPDATE SET
+                    datestamp = excluded.datestamp,
+                    cursor = excluded.cursor,
+                    max_datestamp = excluded.max_datestamp,
+                    last_harvested = excluded.last_harvested,
+                    record_count = record_count + excluded.record_count
+            ''', (source_name, datestamp, cursor, max_datestamp,
+                  datetime.now().isoformat(), records))
+
+    def harvest(self, source,
+                progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+        """
+        Store every record of the source in the mirrored categories that is
+        newer than the last harvest; returns {pages, records, changed}
+        progress_callback(records, changed) is invoked after every page
+        """
+        state = self.get_state(source.name) or {}
+        since = state.get('datestamp')
+        cursor = state.get('cursor')
+        max_datestamp = state.get('max_datestamp') if cursor else None
+        stats = {'pages': 0, 'records': 0, 'changed': 0}
+
+        for records, next_cursor in source.pages(since, cursor):
+            records = (record for record in records
+                       if self.categories.intersection(record['categories']))
+            page_records = 0
+            while True:
+                batch = list(itertools.islice(records, WRITE_BATCH_SIZE))
+                if not batch:
+                    break
+                page_records += len(batch)
+                stats['changed'] += self._store_records(batch)
+                newest = max(record['datestamp'] for record in batch)
+                max_datestamp = max(max_datestamp or newest, newest)
+            stats['pages'] += 1
+            stats['records'] += page_records
+            # Stored pages are not fetched again if the harvest is interrupted
+            self._save_state(source.name, since, next_cursor, max_datestamp, page_records)
+            if progress_callback:
+                progress_callback(stats['records'], stats['changed'])
+
+        # Finished: the next harvest asks for records from the newest datestamp on
+        self._save_state(source.name, max_datestamp or since, None, None, 0)
+        if stats['changed']:
+            self.db.link_duplicates()
+        return stats
+
+    def _store_records(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Upsert one batch of records with their authors and categories"""
+        now = datetime.now().isoformat()
+        rows = [dict(record, now=now) for record in records]
+        stored = []
+        with self.db.connections.writer() as conn:
+            changed = conn.executemany(UPDATE_ARXIV_SQL, rows).rowcount
+            changed += conn.executemany(INSERT_ARXIV_SQL, rows).rowcount
+            if changed:
+                categories = {row['paper_url']: row['categories'] for row in rows}
+                stored = conn.execute(
+                    'SELECT id, title, abstract, authors, venue, year, paper_url FROM papers'
+                    ' WHERE venue = ? AND last_updated = ?', (ARXIV_VENUE, now)).fetchall()
+                sync_paper_authors(conn, ((paper[0], paper[3]) for paper in stored))
+                conn.executemany('DELETE FROM paper_categories WHERE paper_id = ?',
+                                 ((paper[0],) for paper in stored))
+                conn.executemany(
+                    'INSERT OR IGNORE INTO paper_categories (paper_id, category) VALUES (?, ?)',
+                    ((paper[0], category) for paper in stored
+                     for category in categories.get(paper[6], ())))
+        if changed:
+            self.db._route_to_shards([paper[:6] for paper in stored], now)
+            self.db.query_cache.invalidate()
+        return changed
+
+
+def main():
+    from db.paper_db import PaperDB
+    from parsers.arxiv_feed import get_source
+
+    parser = argparse.ArgumentParser(
+        description="Harvest arXiv metadata into the local paper database")
+    parser.add_argument("source", nargs="?", default=ARXIV_HARVEST_SOURCE,
+                        help="OAI-PMH endpoint URL, or a directory/file of feed pages or dumps")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    mirror = ArXivMirror(PaperDB(args.db))
+    source = get_source(args.source)
+    state = mirror.get_state(source.name)
+    if state and state['cursor']:
+        print(f"Resuming interrupted harvest of {source.name} after {state['cursor']}")
+    elif state and state['datestamp']:
+        print(f"Harvesting {source.name} from {state['datestamp']}")
+
+    stats = mirror.harvest(source, lambda records, changed: print(
+        f"  {records} records, {changed} new or updated", flush=True))
+    print(f"Done: {stats['pages']} pages, {stats['records']} records, "
+          f"{stats['changed']} new or updated")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
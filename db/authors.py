@@ -0,0 +1,25 @@
+import sqlite3
+from typing import Iterable, List, Tuple
+
+
+def split_authors(authors: str) -> List[str]:
+    """Split a comma-joined author string into individual names"""
+    return [name.strip() for name in (authors or '').split(',') if name.strip()]
+
+
+def sync_paper_authors(conn: sqlite3.Connection, papers: Iterable[Tuple[int, str]]):
+    """Replace the authors/paper_authors rows for (paper_id, authors) pairs"""
+    links = []
+    paper_ids = []
+    for paper_id, authors in papers:
+        paper_ids.append((paper_id,))
+        links.extend((paper_id, position, name)
+                     for position, name in enumerate(split_authors(authors)))
+
+    conn.executemany('DELETE FROM paper_authors WHERE paper_id = ?', paper_ids)
+    conn.executemany('INSERT OR IGNORE INTO authors (name) VALUES (?)',
+                     ((name,) for _, _, name in links))
+    conn.executemany('''
+        INSERT INTO paper_authors (paper_id, author_id, position)
+        SELECT ?, id, ? FROM authors WHERE name = ?
+    ''', links)
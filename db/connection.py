@@ -0,0 +1,152 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from config import (SQLITE_READ_POOL_SIZE, SQLITE_STATEMENT_CACHE,
+                    SQLITE_BUSY_TIMEOUT_MS, SQLITE_PRAGMAS, SERVING_MMAP_SIZE)
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+class ConnectionManager:
+    """
+    Long-lived SQLite connections for one database file
+    - a pool of read-only connections, each used by one thread at a time
+    - a single writer connection serialized by a lock
+    Managers are shared process-wide, so connections survive Streamlit reruns.
+    An immutable database (a published serving generation) is read without
+    locking or change detection, mapped into memory, and never written
+    """
+
+    @classmethod
+    def for_path(cls, db_path, immutable: bool = False) -> 'ConnectionManager':
+        """
+        Get the shared manager for a database file, creating it on first use
+        Raises ValueError if the file is open already with the other immutable
+        setting: writes would go unseen by an immutable reader of the file
+        """
+        key = str(Path(db_path).resolve())
+        with _managers_lock:
+            if key not in _managers:
+                _managers[key] = cls(db_path, immutable=immutable)
+            elif _managers[key].immutable != immutable:
+                opened = 'immutable' if _managers[key].immutable else 'writable'
+                raise ValueError(f'{db_path} is already open {opened} in this process')
+            return _managers[key]
+
+    @classmethod
+    def discard(cls, db_path):
+        """Close and forget the shared manager of a database file, if there is one"""
+        with _managers_lock:
+            manager = _managers.pop(str(Path(db_path).resolve()), None)
+        if manager is not None:
+            manager.close()
+
+    def __init__(self, db_path, pool_size: int = SQLITE_READ_POOL_SIZE,
+                 pragmas: Optional[Dict[str, Any]] = None, immutable: bool = False):
+        self.db_path = Path(db_path)
+        self.pool_size = pool_size
+        self.immutable = immutable
+        if pragmas is None:
+            pragmas = dict(SQLITE_PRAGMAS, mmap_size=SERVING_MMAP_SIZE) if immutable else SQLITE_PRAGMAS
+        self.pragmas = dict(pragmas)
+        self._idle = []
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()
+        self._writer = None
+        self._writer_lock = threading.RLock()
+        self._stats = {'hits': 0, 'misses': 0,
+                       'discarded': 0, 'writer_acquisitions': 0}
+
+    def _configure(self, conn: sqlite3.Connection):
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+
+    def _open_reader(self) -> sqlite3.Connection:
+        mode = 'ro&immutable=1' if self.immutable else 'ro'
+        conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode={mode}", uri=True,
+                               timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False,
+                               cached_statements=SQLITE_STATEMENT_CACHE)
+        conn.row_factory = sqlite3.Row
+        self._configure(conn)
+        return conn
+
+    def _open_writer(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False,
+                               cached_statements=SQLITE_STATEMENT_CACHE)
+        conn.execute("PRAGMA journal_mode=WAL")
+        self._configure(conn)
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        with self._pool_lock:
+            if self._idle:
+                self._stats['hits'] += 1
+                return self._idle.pop()
+            self._stats['misses'] += 1
+        return self._open_reader()
+
+    def _checkin(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._pool_lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+            self._stats['discarded'] += 1
+        conn.close()
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection; nested use on one thread reuses it"""
+        held = getattr(self._local, 'reader', None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._checkout()
+        self._local.reader = conn
+        try:
+            yield conn
+        finally:
+            self._local.reader = None
+            self._checkin(conn)
+
+    @contextmanager
+    def writer(self):
+        """Hold the writer connection; commits on success, rolls back on error"""
+        if self.immutable:
+            raise sqlite3.OperationalError(f'{self.db_path} is immutable and cannot be written')
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = self._open_writer()
+            self._stats['writer_acquisitions'] += 1
+            with self._writer:
+                yield self._writer
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Pool hit/miss counters and current pool occupancy"""
+        with self._pool_lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        """Close every pooled connection and the writer"""
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
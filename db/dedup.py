@@ -0,0 +1,275 @@
+"""
+Near-duplicate papers across venues and sources
+
+    python -m db.dedup [--db papers.db] [--rebuild]
+
+The same paper often appears more than once: under ACL and Findings, in a
+workshop, or on arXiv with a slightly different title. Every paper gets a
+MinHash signature over character shingles of its normalized title and one
+over word shingles of its abstract. Signatures are cut into bands, and only
+papers sharing a band (an LSH bucket) are compared. The band keys are kept in
+paper_bands, so new papers look up their buckets there and are linked in time
+linear in their number instead of against every stored paper.
+Linked papers form clusters in paper_clusters; the canonical member of each
+stands for the whole cluster in search results.
+"""
+import argparse
+import re
+import sys
+import unicodedata
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config import (DB_PATH, WRITE_BATCH_SIZE, DEDUP_PERMUTATIONS, DEDUP_BANDS,
+                    DEDUP_TITLE_SHINGLE, DEDUP_ABSTRACT_SHINGLE, DEDUP_MIN_TITLE_CHARS,
+                    DEDUP_TITLE_THRESHOLD, DEDUP_ABSTRACT_AGREE, DEDUP_ABSTRACT_THRESHOLD,
+                    DEDUP_MAX_BUCKET, DEDUP_VENUE_RANK)
+
+_NON_ALNUM_RE = re.compile(r'[^0-9a-z]+')
+
+# Fixed hash functions, so stored signatures stay comparable between runs
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(1, _PRIME, size=DEDUP_PERMUTATIONS, dtype=np.int64)
+_B = _rng.integers(0, _PRIME, size=DEDUP_PERMUTATIONS, dtype=np.int64)
+_ROWS = DEDUP_PERMUTATIONS // DEDUP_BANDS
+_BAND_MIX = _rng.integers(1, 1 << 62, size=_ROWS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_BAND_SALT = np.arange(2 * DEDUP_BANDS, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+
+
+def normalize_title(title: str) -> str:
+    """Case-, accent- and punctuation-insensitive form of a title (or any text)"""
+    title = unicodedata.normalize('NFKD', title or '')
+    title = ''.join(c for c in title if not unicodedata.combining(c))
+    return _NON_ALNUM_RE.sub(' ', title.lower()).strip()
+
+
+def _minhash(shingles: List[str]) -> np.ndarray:
+    """The low 16 bits of each permutation's minimum; plenty for estimating similarity"""
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                         dtype=np.int64, count=len(shingles)) % _PRIME
+    return ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0).astype(np.uint16)
+
+
+def sign(title: str, abstract: Optional[str]) -> bytes:
+    """Title signature, followed by the abstract's if it is long enough to shingle"""
+    title = normalize_title(title)
+    shingles = [title[i:i + DEDUP_TITLE_SHINGLE]
+                for i in range(max(1, len(title) - DEDUP_TITLE_SHINGLE + 1))]
+    signature = _minhash(shingles).tobytes()
+    words = normalize_title(abstract).split()
+    if len(words) >= 2 * DEDUP_ABSTRACT_SHINGLE:
+        shingles = [' '.join(words[i:i + DEDUP_ABSTRACT_SHINGLE])
+                    for i in range(len(words) - DEDUP_ABSTRACT_SHINGLE + 1)]
+        signature += _minhash(shingles).tobytes()
+    return signature
+
+
+def _band_keys(signatures: np.ndarray) -> np.ndarray:
+    """(n, 2 * DEDUP_BANDS) bucket keys: title bands, then abstract bands"""
+    bands = signatures.reshape(len(signatures), 2 * DEDUP_BANDS, _ROWS).astype(np.uint64)
+    # Arithmetic wraps modulo 2**64, which is what a hash wants
+    return (bands * _BAND_MIX).sum(axis=2) ^ _BAND_SALT
+
+
+def _unpack(blobs: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    """(n, 2k) signatures from stored ones, zero-padded, and which have an abstract part"""
+    k = DEDUP_PERMUTATIONS
+    signatures = np.zeros((len(blobs), 2 * k), dtype=np.uint16)
+    has_abstract = np.zeros(len(blobs), dtype=bool)
+    for position, blob in enumerate(blobs):
+        values = np.frombuffer(blob, dtype=np.uint16)
+        signatures[position, :len(values)] = values
+        has_abstract[position] = len(values) == 2 * k
+    return signatures, has_abstract
+
+
+def _band_rows(ids: List[int], blobs: List[bytes]) -> List[Tuple[int, int]]:
+    """(band key, paper id) rows of the buckets each paper belongs to"""
+    signatures, has_abstract = _unpack(blobs)
+    # SQLite integers are signed
+    keys = _band_keys(signatures).view(np.int64)
+    valid = np.ones(keys.shape, dtype=bool)
+    valid[~has_abstract, DEDUP_BANDS:] = False  # an empty abstract is no evidence
+    owners = np.broadcast_to(np.asarray(ids, dtype=np.int64)[:, None], keys.shape)
+    return list(zip(keys[valid].tolist(), owners[valid].tolist()))
+
+
+def _chunks(ids: np.ndarray) -> Iterable[List[int]]:
+    """ids in lists short enough to bind as one IN (...)"""
+    for start in range(0, len(ids), WRITE_BATCH_SIZE):
+        yield ids[start:start + WRITE_BATCH_SIZE].tolist()
+
+
+class Deduplicator:
+    """
+    Signs papers stored since the last run and links them to their near
+    duplicates. Links are only ever added; rebuild() starts over
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def _pending(self) -> List[Tuple[int, str, str, str]]:
+        """Papers never signed, or changed since they were"""
+        with self.db.connections.reader() as conn:
+            return [tuple(row) for row in conn.execute('''
+                SELECT p.id, p.title, p.abstract, p.last_updated
+                FROM papers p LEFT JOIN paper_signatures s ON s.paper_id = p.id
+                WHERE s.paper_id IS NULL OR s.signed_at IS NOT p.last_updated
+            ''')]
+
+    def _load(self, paper_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Signatures of the given papers: ids, (n, 2k) signatures, has-abstract flags, title lengths"""
+        rows = []
+        with self.db.connections.reader() as conn:
+            for chunk in _chunks(paper_ids):
+                rows.extend(conn.execute('''
+                    SELECT s.paper_id, s.signature, length(p.title)
+                    FROM paper_signatures s JOIN papers p ON p.id = s.paper_id
+                    WHERE s.paper_id IN (%s) ORDER BY s.paper_id
+                ''' % ', '.join('?' * len(chunk)), chunk).fetchall())
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        signatures, has_abstract = _unpack([row[1] for row in rows])
+        title_lengths = np.array([row[2] for row in rows], dtype=np.int64)
+        return ids, signatures, has_abstract, title_lengths
+
+    def _candidates(self, new_ids: np.ndarray) -> np.ndarray:
+        """(m, 2) ids of papers sharing a bucket, at least one of them new"""
+        rows = set()
+        with self.db.connections.reader() as conn:
+            for chunk in _chunks(new_ids):
+                rows.update(tuple(row) for row in conn.execute('''
+                    SELECT band_key, paper_id FROM paper_bands WHERE band_key IN (
+                        SELECT band_key FROM paper_bands WHERE paper_id IN (%s))
+                ''' % ', '.join('?' * len(chunk)), chunk))
+        rows = np.array(sorted(rows), dtype=np.int64).reshape(-1, 2)
+        keys, owners = rows[:, 0], rows[:, 1]
+        is_new = np.isin(owners, new_ids)
+
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+        sizes = np.diff(np.concatenate((starts, [len(keys)])))
+        pairs = set()
+        for start, size in zip(starts[(sizes > 1) & (sizes <= DEDUP_MAX_BUCKET)],
+                               sizes[(sizes > 1) & (sizes <= DEDUP_MAX_BUCKET)]):
+            members = owners[start:start + size]
+            new = is_new[start:start + size]
+            for i, first in enumerate(members):
+                for j in range(i + 1, size):
+                    if new[i] or new[j]:
+                        pairs.add((min(first, members[j]), max(first, members[j])))
+        return np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+
+    @staticmethod
+    def _verify(pairs: np.ndarray, signatures: np.ndarray, has_abstract: np.ndarray,
+                title_lengths: np.ndarray) -> np.ndarray:
+        """Mask of the candidate pairs similar enough to be the same paper"""
+        k = DEDUP_PERMUTATIONS
+        first, second = signatures[pairs[:, 0]], signatures[pairs[:, 1]]
+        title = (first[:, :k] == second[:, :k]).mean(axis=1)
+        abstract = (first[:, k:] == second[:, k:]).mean(axis=1)
+        both = has_abstract[pairs[:, 0]] & has_abstract[pairs[:, 1]]
+        long_titles = title_lengths[pairs].min(axis=1) >= DEDUP_MIN_TITLE_CHARS
+        same_title = (title >= DEDUP_TITLE_THRESHOLD) & np.where(
+            both, abstract >= DEDUP_ABSTRACT_AGREE, long_titles)
+        return same_title | (both & (abstract >= DEDUP_ABSTRACT_THRESHOLD))
+
+    def _link(self, pairs: Iterable[Tuple[int, int]]) -> int:
+        """Merge the clusters of each linked pair; returns how many clusters changed"""
+        with self.db.connections.writer() as conn:
+            def canonical(paper_id):
+                row = conn.execute('SELECT canonical_id FROM paper_clusters WHERE paper_id = ?',
+                                   (paper_id,)).fetchone()
+                return row[0] if row else paper_id
+
+            parent = {}
+
+            def find(root):
+                while parent.get(root, root) != root:
+                    root = parent[root]
+                return root
+
+            for first, second in pairs:
+                first, second = find(canonical(first)), find(canonical(second))
+                if first != second:
+                    parent[max(first, second)] = min(first, second)
+
+            clusters = {}
+            for root in parent:
+                clusters.setdefault(find(root), {find(root)}).add(root)
+            for roots in clusters.values():
+                members = set(roots)
+                for root in roots:
+                    members.update(paper_id for (paper_id,) in conn.execute(
+                        'SELECT paper_id FROM paper_clusters WHERE canonical_id = ?', (root,)))
+                venues = conn.execute('SELECT id, venue FROM papers WHERE id IN (%s)'
+                                      % ', '.join('?' * len(members)), list(members)).fetchall()
+                # Main venues over Findings, workshops and preprints, then the oldest row
+                chosen = min(venues, key=lambda row: (DEDUP_VENUE_RANK.get(row[1], 0), row[0]))[0]
+                conn.executemany('DELETE FROM paper_clusters WHERE paper_id = ?',
+                                 ((paper_id,) for paper_id in members))
+                conn.executemany(
+                    'INSERT INTO paper_clusters (paper_id, canonical_id) VALUES (?, ?)',
+                    ((paper_id, chosen) for paper_id in members if paper_id != chosen))
+        if clusters:
+            self.db.query_cache.invalidate()
+        return len(clusters)
+
+    def update(self) -> Dict[str, int]:
+        """Sign new or changed papers and link them to their duplicates; returns counts"""
+        pending = self._pending()
+        if not pending:
+            return {'signed': 0, 'pairs': 0, 'clusters': 0}
+        for start in range(0, len(pending), WRITE_BATCH_SIZE):
+            batch = pending[start:start + WRITE_BATCH_SIZE]
+            rows = [(paper_id, sign(title, abstract), last_updated)
+                    for paper_id, title, abstract, last_updated in batch]
+            bands = _band_rows([row[0] for row in rows], [row[1] for row in rows])
+            with self.db.connections.writer() as conn:
+                conn.executemany('INSERT OR REPLACE INTO paper_signatures '
+                                 '(paper_id, signature, signed_at) VALUES (?, ?, ?)', rows)
+                # A changed paper leaves the buckets of its old signature
+                conn.executemany('DELETE FROM paper_bands WHERE paper_id = ?',
+                                 ((row[0],) for row in rows))
+                conn.executemany('INSERT OR IGNORE INTO paper_bands (band_key, paper_id) '
+                                 'VALUES (?, ?)', bands)
+
+        new_ids = np.array(sorted(row[0] for row in pending), dtype=np.int64)
+        pairs = self._candidates(new_ids)
+        if len(pairs):
+            ids, signatures, has_abstract, title_lengths = self._load(np.unique(pairs))
+            positions = np.searchsorted(ids, pairs)
+            pairs = pairs[self._verify(positions, signatures, has_abstract, title_lengths)]
+        clusters = self._link((int(first), int(second)) for first, second in pairs)
+        return {'signed': len(pending), 'pairs': len(pairs), 'clusters': clusters}
+
+    def rebuild(self) -> Dict[str, int]:
+        """Forget every signature and link, and sign and link all papers afresh"""
+        with self.db.connections.writer() as conn:
+            conn.execute('DELETE FROM paper_signatures')
+            conn.execute('DELETE FROM paper_bands')
+            conn.execute('DELETE FROM paper_clusters')
+        self.db.query_cache.invalidate()
+        return self.update()
+
+
+def main():
+    from db.paper_db import PaperDB
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--rebuild', action='store_true',
+                        help='drop existing signatures and clusters first')
+    args = parser.parse_args()
+
+    dedup = Deduplicator(PaperDB(args.db))
+    stats = dedup.rebuild() if args.rebuild else dedup.update()
+    print(f"Signed {stats['signed']} papers; {stats['pairs']} duplicate pairs "
+          f"in {stats['clusters']} updated clusters")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
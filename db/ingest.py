@@ -0,0 +1,163 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+from urllib.parse import urlparse
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+from config import (INGEST_FETCH_WORKERS, INGEST_PARSE_WORKERS, INGEST_QUEUE_BATCHES,
+                    HOST_CONCURRENCY, DEFAULT_HOST_CONCURRENCY, WRITE_BATCH_SIZE)
+
+
+class IngestionEngine:
+    """
+    Pipelined ingestion of (venue, year) jobs:
+    - a bounded pool of fetch workers, throttled per host; venue-years whose
+      source is unchanged since the last crawl skip parsing and writing
+    - a separate pool of parse workers, handing papers to the writer in batches
+    - a single writer (the calling thread) that stores papers and reports progress
+    """
+
+    def __init__(self, db, fetch_workers: int = INGEST_FETCH_WORKERS,
+                 parse_workers: int = INGEST_PARSE_WORKERS,
+                 host_limits: Optional[Dict[str, int]] = None):
+        self.db = db
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers
+        self.host_limits = dict(
+            HOST_CONCURRENCY if host_limits is None else host_limits)
+        self._host_semaphores = {}
+        self._lock = threading.Lock()
+        self._abandoned = threading.Event()
+        self._downloads = {}  # (venue, year) -> (parser, result) being parsed and stored
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        """Get the semaphore limiting concurrent requests to the URL's host"""
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_semaphores:
+                limit = self.host_limits.get(host, DEFAULT_HOST_CONCURRENCY)
+                self._host_semaphores[host] = threading.BoundedSemaphore(limit)
+            return self._host_semaphores[host]
+
+    def _put(self, results: Queue, item) -> bool:
+        """Queue an item for the writer; gives up (returning False) once the run is abandoned"""
+        while not self._abandoned.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _fetch(self, venue: str, year: int, parse_pool: ThreadPoolExecutor,
+               results: Queue):
+        """Download a venue-year and hand the content over to the parse pool"""
+        from utils import get_parser_for_venue
+        try:
+            parser = get_parser_for_venue(venue)
+            with self._host_semaphore(parser.get_url(venue, year)), metrics.span('fetch', venue=venue):
+                result = parser.download(venue, year)
+            metrics.count('bytes', result.size, venue=venue)
+            if not result.changed and self.db.has_papers(venue, year):
+                self._put(results, (venue, year, None, None, True))
+                return
+            self._downloads[(venue, year)] = (parser, result)
+            parse_pool.submit(self._parse, parser, result,
+                              venue, year, results)
+        except Exception as e:
+            self._put(results, (venue, year, None, e, True))
+
+    def _parse(self, parser, result, venue: str, year: int, results: Queue):
+        """Parse downloaded content and queue the papers for the writer batch by batch"""
+        try:
+            papers = metrics.timed_iter('parse', lambda: parser.iter_papers(result, venue, year),
+                                        venue=venue)
+            while True:
+                batch = list(itertools.islice(papers, WRITE_BATCH_SIZE))
+                if not batch:
+                    break
+                if not self._put(results, (venue, year, batch, None, False)):
+                    return
+            self._put(results, (venue, year, [], None, True))
+        except Exception as e:
+            self._put(results, (venue, year, None, e, True))
+
+    def run(self, jobs: List[Tuple[str, int]],
+            progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+        """
+        Ingest all jobs and block until every one is stored or has failed
+        progress_callback(done, total) is invoked from the calling thread
+        """
+        total = len(jobs)
+        stats = {'jobs': total, 'papers': 0, 'unchanged': 0, 'failed': 0}
+        # Bounded, so parsers wait for the writer instead of piling up batches
+        results = Queue(maxsize=INGEST_QUEUE_BATCHES)
+        changed = {}
+        failed_writes = {}
+        self._abandoned.clear()
+        self._downloads.clear()
+
+        with ThreadPoolExecutor(self.fetch_workers, thread_name_prefix="ingest-fetch") as fetch_pool, \
+                ThreadPoolExecutor(self.parse_workers, thread_name_prefix="ingest-parse") as parse_pool:
+            for venue, year in jobs:
+                fetch_pool.submit(self._fetch, venue, year,
+                                  parse_pool, results)
+            try:
+                self._write(total, results, stats, changed, failed_writes, progress_callback)
+            except BaseException:
+                # Parsers blocked on the full queue would keep the pools from shutting down
+                self._abandoned.set()
+                fetch_pool.shutdown(wait=False, cancel_futures=True)
+                parse_pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+        return stats
+
+    def _write(self, total: int, results: Queue, stats: Dict[str, int], changed: Dict,
+               failed_writes: Dict, progress_callback: Optional[Callable[[int, int], None]]):
+        """Store queued batches and record each venue-year's crawl as it finishes"""
+        done = 0
+        while done < total:
+            venue, year, papers, error, finished = results.get()
+            if papers and error is None:
+                # Keep draining the queue even if a write fails, so producers never block
+                try:
+                    changed[(venue, year)] = changed.get((venue, year), 0) + \
+                        self.db._store_papers(venue, year, papers)
+                    stats['papers'] += len(papers)
+                except Exception as e:
+                    failed_writes[(venue, year)] = e
+            if not finished:
+                continue
+
+            error = error or failed_writes.pop((venue, year), None)
+            download = self._downloads.pop((venue, year), None)
+            if error is not None:
+                stats['failed'] += 1
+                print(f"Error fetching papers for {venue}-{year}: {str(error)}")
+                # Most failures were counted by the fetch, parse or write span they escaped
+                metrics.error('ingest', error, venue=venue)
+                changed.pop((venue, year), None)
+                crawl = {'failed': True}
+            elif papers is None:
+                stats['unchanged'] += 1
+                crawl = {}
+            else:
+                crawl = {'changed': changed.pop((venue, year), 0) > 0}
+                # Every batch is stored: cache the download, so the next crawl can skip it
+                try:
+                    parser, result = download
+                    parser.commit(result)
+                except Exception as e:
+                    print(f"Error caching the download of {venue}-{year}: {str(e)}")
+            try:
+                self.db._record_crawl(venue, year, **crawl)
+            except Exception as e:
+                # Without its crawl state the venue-year is only refreshed again sooner
+                print(f"Error recording the crawl of {venue}-{year}: {str(e)}")
+                metrics.error('crawl_state', e, venue=venue)
+            done += 1
+            if progress_callback:
+                progress_callback(done, total)
@@ -0,0 +1,283 @@
+import sqlite3
+
+from config import FTS_TOKENIZE, FTS_PREFIX
+from db.authors import sync_paper_authors
+
+# Current definition of the full-text index; also used to create it in new databases
+PAPERS_SEARCH_SQL = f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS papers_search
+    USING FTS5(title, abstract, authors, content='papers', content_rowid='id',
+               tokenize='{FTS_TOKENIZE}', prefix='{FTS_PREFIX}')
+'''
+
+
+def _normalize_venues_and_authors(conn: sqlite3.Connection):
+    """
+    v1: store the bare venue name next to the year instead of "{venue}-{year}",
+    index (venue, year) and move authors into authors/paper_authors
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS authors (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS paper_authors (
+            paper_id INTEGER NOT NULL REFERENCES papers(id),
+            author_id INTEGER NOT NULL REFERENCES authors(id),
+            position INTEGER NOT NULL,
+            PRIMARY KEY (paper_id, position)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_paper_authors_author
+            ON paper_authors(author_id, paper_id)
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS papers_ad_authors AFTER DELETE ON papers BEGIN
+            DELETE FROM paper_authors WHERE paper_id = old.id;
+        END
+    ''')
+    conn.execute('''
+        UPDATE papers
+        SET venue = substr(venue, 1, length(venue) - length(year) - 1)
+        WHERE venue LIKE '%-' || year
+    ''')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_papers_venue_year ON papers(venue, year)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_papers_year ON papers(year)')
+    sync_paper_authors(conn, conn.execute('SELECT id, authors FROM papers'))
+
+
+def _add_crawl_state(conn: sqlite3.Connection):
+    """v2: per venue-year crawl bookkeeping for the refresh scheduler"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_state (
+            venue TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            last_fetched TIMESTAMP,
+            last_changed TIMESTAMP,
+            paper_count INTEGER NOT NULL DEFAULT 0,
+            failure_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (venue, year)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO crawl_state (venue, year, last_fetched, last_changed, paper_count)
+        SELECT venue, year, MAX(last_updated), MAX(last_updated), COUNT(*)
+        FROM papers GROUP BY venue, year
+    ''')
+
+
+def _add_arxiv_mirror(conn: sqlite3.Connection):
+    """v3: categories of harvested arXiv papers and per-source harvest progress"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS paper_categories (
+            paper_id INTEGER NOT NULL REFERENCES papers(id),
+            category TEXT NOT NULL,
+            PRIMARY KEY (paper_id, category)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_paper_categories_category
+            ON paper_categories(category, paper_id)
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS papers_ad_categories AFTER DELETE ON papers BEGIN
+            DELETE FROM paper_categories WHERE paper_id = old.id;
+        END
+    ''')
+    # arXiv papers are identified by their abstract page, not their (revisable) title
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_papers_arxiv_url
+            ON papers(paper_url) WHERE venue = 'arXiv'
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS harvest_state (
+            source TEXT PRIMARY KEY,
+            datestamp TEXT,
+            cursor TEXT,
+            max_datestamp TEXT,
+            last_harvested TIMESTAMP,
+            record_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def _stem_and_prefix_index(conn: sqlite3.Connection):
+    """v4: rebuild the full-text index with the porter tokenizer and prefix indexes"""
+    sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'papers_search'").fetchone()[0]
+    if 'prefix=' in sql:
+        return  # created by this version already
+    # The sync triggers refer to the index by name and keep working
+    conn.execute('DROP TABLE papers_search')
+    conn.execute(PAPERS_SEARCH_SQL)
+    conn.execute("INSERT INTO papers_search(papers_search) VALUES('rebuild')")
+
+
+def _add_related(conn: sqlite3.Connection):
+    """v5: precomputed related papers and the venue-years they have been computed for"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS related (
+            paper_id INTEGER NOT NULL REFERENCES papers(id),
+            neighbor_id INTEGER NOT NULL REFERENCES papers(id),
+            score REAL NOT NULL,
+            PRIMARY KEY (paper_id, neighbor_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS papers_ad_related AFTER DELETE ON papers BEGIN
+            DELETE FROM related WHERE paper_id = old.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS related_state (
+            venue TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            paper_count INTEGER NOT NULL,
+            computed_at TIMESTAMP,
+            PRIMARY KEY (venue, year)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _add_duplicate_clusters(conn: sqlite3.Connection):
+    """v6: MinHash signatures of papers and the near-duplicate clusters they link"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS paper_signatures (
+            paper_id INTEGER PRIMARY KEY REFERENCES papers(id),
+            signature BLOB NOT NULL,
+            signed_at TIMESTAMP
+        )
+    ''')
+    # Only duplicates are listed, each with the canonical paper standing for its cluster
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS paper_clusters (
+            paper_id INTEGER PRIMARY KEY REFERENCES papers(id),
+            canonical_id INTEGER NOT NULL REFERENCES papers(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_paper_clusters_canonical
+            ON paper_clusters(canonical_id)
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS papers_ad_dedup AFTER DELETE ON papers BEGIN
+            DELETE FROM paper_signatures WHERE paper_id = old.id;
+            DELETE FROM paper_clusters WHERE paper_id = old.id;
+        END
+    ''')
+
+
+def _add_venue_year_stats(conn: sqlite3.Connection):
+    """v7: paper counts per venue-year, kept current by triggers"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS venue_year_stats (
+            venue TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            paper_count INTEGER NOT NULL,
+            PRIMARY KEY (venue, year)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS papers_ai_stats AFTER INSERT ON papers BEGIN
+            INSERT INTO venue_year_stats (venue, year, paper_count) VALUES (new.venue, new.year, 1)
+            ON CONFLICT(venue, year) DO UPDATE SET paper_count = paper_count + 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS papers_ad_stats AFTER DELETE ON papers BEGIN
+            UPDATE venue_year_stats SET paper_count = paper_count - 1
+            WHERE venue = old.venue AND year = old.year;
+            DELETE FROM venue_year_stats
+            WHERE venue = old.venue AND year = old.year AND paper_count <= 0;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS papers_au_stats AFTER UPDATE OF venue, year ON papers
+        WHEN old.venue IS NOT new.venue OR old.year IS NOT new.year BEGIN
+            UPDATE venue_year_stats SET paper_count = paper_count - 1
+            WHERE venue = old.venue AND year = old.year;
+            DELETE FROM venue_year_stats
+            WHERE venue = old.venue AND year = old.year AND paper_count <= 0;
+            INSERT INTO venue_year_stats (venue, year, paper_count) VALUES (new.venue, new.year, 1)
+            ON CONFLICT(venue, year) DO UPDATE SET paper_count = paper_count + 1;
+        END
+    ''')
+    conn.execute('DELETE FROM venue_year_stats')
+    conn.execute('''
+        INSERT INTO venue_year_stats (venue, year, paper_count)
+        SELECT venue, year, COUNT(*) FROM papers GROUP BY venue, year
+    ''')
+
+
+def _add_related_watermark(conn: sqlite3.Connection):
+    """
+    v8: the newest paper change each venue-year's related papers account for,
+    so edits that keep the paper count are recomputed too
+    """
+    conn.execute('ALTER TABLE related_state ADD COLUMN last_updated TIMESTAMP')
+    # Computed so far from the papers as they are now, as the counts assumed
+    conn.execute('''
+        UPDATE related_state SET last_updated = (
+            SELECT MAX(p.last_updated) FROM papers p
+            WHERE p.venue = related_state.venue AND p.year = related_state.year)
+    ''')
+
+
+def _add_signature_bands(conn: sqlite3.Connection):
+    """
+    v9: the LSH band keys of every signature, so new papers look up the
+    papers sharing a bucket instead of re-banding all signatures
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS paper_bands (
+            band_key INTEGER NOT NULL,
+            paper_id INTEGER NOT NULL REFERENCES papers(id),
+            PRIMARY KEY (band_key, paper_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_paper_bands_paper ON paper_bands(paper_id)')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS papers_ad_bands AFTER DELETE ON papers BEGIN
+            DELETE FROM paper_bands WHERE paper_id = old.id;
+        END
+    ''')
+    # Papers are signed and banded again by the next update; their links are kept
+    conn.execute('DELETE FROM paper_signatures')
+
+
+# Applied in order; PRAGMA user_version records how many have run.
+# Migrations run inside a transaction, so they must not use executescript
+MIGRATIONS = [
+    _normalize_venues_and_authors,
+    _add_crawl_state,
+    _add_arxiv_mirror,
+    _stem_and_prefix_index,
+    _add_related,
+    _add_duplicate_clusters,
+    _add_venue_year_stats,
+    _add_related_watermark,
+    _add_signature_bands,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn: sqlite3.Connection):
+    """Bring a database created by any earlier version up to SCHEMA_VERSION"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        # Each migration and its version bump commit or roll back together
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('BEGIN')
+        try:
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {target}')
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
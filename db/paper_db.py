@@ -4,23 +4,70 @@ import json
 from datetime import datetime
 from pathlib import Path
 import threading
-from queue import Queue
-import streamlit as st
-from typing import List, Dict, Any
-from config import VENUE_GROUPS
+import itertools
+import time
+from queue import PriorityQueue
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
+import metrics
+from config import (VENUE_GROUPS, INGEST_YEARS, WRITE_BATCH_SIZE, DB_PATH,
+                    PAPERS_PER_PAGE, SEARCH_COUNT_CAP, FILTER_FIRST_MAX_ROWS, ARXIV_VENUE,
+                    SEARCH_BM25_WEIGHTS, VECTOR_HYBRID_CANDIDATES, VECTOR_HYBRID_ALPHA,
+                    RELATED_TOP_N, SERVING_DIR, SERVING_PUBLISH_INTERVAL)
+from db.authors import sync_paper_authors
+from db.connection import ConnectionManager
+from db.migrations import migrate, PAPERS_SEARCH_SQL
+from db.query import compile_query
+from db.query_cache import QueryCache
+from db.ingest import IngestionEngine
+from db.scheduler import RefreshScheduler
+from db.dedup import Deduplicator
+from db.related import RelatedPapers
+from db.vectors import VectorIndex
+from db.shards import ShardedIndex
+
+# Insert new papers, update changed ones in place so ids (and FTS rowids) stay stable
+UPSERT_PAPER_SQL = '''
+    INSERT INTO papers
+    (title, authors, venue, year, paper_url, abstract, last_updated)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(title, venue, year) DO UPDATE SET
+        authors = excluded.authors,
+        paper_url = excluded.paper_url,
+        abstract = excluded.abstract,
+        last_updated = excluded.last_updated
+    WHERE authors IS NOT excluded.authors
+        OR paper_url IS NOT excluded.paper_url
+        OR abstract IS NOT excluded.abstract
+'''
 
 
 class PaperDB:
 
-    def __init__(self):
-        self.db_path = Path("papers.db")
-        self._init_db()
-        self.fetch_queue = Queue()
+    def __init__(self, db_path=DB_PATH, read_only: bool = False, serving_dir=SERVING_DIR):
+        """
+        read_only opens an immutable published copy (see db/serving.py) as it is;
+        with a serving_dir, background refreshes are published to it
+        """
+        self.db_path = Path(db_path)
+        self.read_only = read_only
+        self.serving_dir = serving_dir
+        self.connections = ConnectionManager.for_path(self.db_path, immutable=read_only)
+        self.query_cache = QueryCache.for_path(self.db_path)
+        if not read_only:
+            self._init_db()
+        self.fetch_queue = PriorityQueue()
         self.fetch_thread = None
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        self._queue_seq = itertools.count()
+        self.scheduler = RefreshScheduler(self)
+        self._data_version = None
+        self._data_version_lock = threading.Lock()
+        self._unpublished = False
+        self._published_at = time.monotonic()
 
     def _init_db(self):
-        conn = self._get_connection()
-        try:
+        with self.connections.writer() as conn:
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS papers (
                     id INTEGER PRIMARY KEY,
@@ -41,70 +88,97 @@ class PaperDB:
                     last_updated TIMESTAMP
                 )
             ''')
-            conn.execute('''
-                CREATE VIRTUAL TABLE IF NOT EXISTS papers_search 
-                USING FTS5(title, abstract, authors, content='papers', content_rowid='id')
-            ''')
-            conn.commit()
-        finally:
-            conn.close()
+            conn.execute(PAPERS_SEARCH_SQL)
+            # Databases created before the sync triggers existed need one
+            # full rebuild; afterwards the triggers keep the index current
+            needs_rebuild = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'papers_ai'"
+            ).fetchone() is None
+            self._create_search_triggers(conn)
+            if needs_rebuild:
+                conn.execute(
+                    "INSERT INTO papers_search(papers_search) VALUES('rebuild')")
+            migrate(conn)
+            self._configure_search_rank(conn)
+
+    def _configure_search_rank(self, conn):
+        """Make the index's rank column bm25 with the configured column weights"""
+        rank = 'bm25(%s)' % ', '.join(
+            str(float(SEARCH_BM25_WEIGHTS[column])) for column in ('title', 'abstract', 'authors'))
+        current = conn.execute(
+            "SELECT v FROM papers_search_config WHERE k = 'rank'").fetchone()
+        if current is None or current[0] != rank:
+            conn.execute(
+                "INSERT INTO papers_search(papers_search, rank) VALUES('rank', ?)", (rank,))
+
+    def _create_search_triggers(self, conn):
+        """Keep the external-content FTS index in sync with papers row by row"""
+        conn.executescript('''
+            CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN
+                INSERT INTO papers_search(rowid, title, abstract, authors)
+                VALUES (new.id, new.title, new.abstract, new.authors);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS papers_ad AFTER DELETE ON papers BEGIN
+                INSERT INTO papers_search(papers_search, rowid, title, abstract, authors)
+                VALUES ('delete', old.id, old.title, old.abstract, old.authors);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS papers_au AFTER UPDATE OF title, abstract, authors ON papers BEGIN
+                INSERT INTO papers_search(papers_search, rowid, title, abstract, authors)
+                VALUES ('delete', old.id, old.title, old.abstract, old.authors);
+                INSERT INTO papers_search(rowid, title, abstract, authors)
+                VALUES (new.id, new.title, new.abstract, new.authors);
+            END;
+        ''')
 
     def needs_initialization(self):
-        conn = self._get_connection()
-        try:
+        with self.connections.reader() as conn:
             cursor = conn.execute(
                 'SELECT initialized FROM initialization_status WHERE id = 1')
             result = cursor.fetchone()
             return result is None or not result[0]
-        finally:
-            conn.close()
 
     def mark_initialized(self):
-        conn = self._get_connection()
-        try:
+        with self.connections.writer() as conn:
             conn.execute('''
                 INSERT OR REPLACE INTO initialization_status (id, initialized, last_updated)
                 VALUES (1, TRUE, ?)
             ''', (datetime.now().isoformat(),))
-            conn.commit()
-        finally:
-            conn.close()
 
     def load_initial_papers(self, progress_bar):
         if not self.needs_initialization():
             return False
 
-        all_venues = []
-        for venues in VENUE_GROUPS.values():
-            all_venues.extend(venues)
+        jobs = [(venue, year)
+                for venues in VENUE_GROUPS.values()
+                for venue in venues
+                for year in INGEST_YEARS]
 
-        total_combinations = len(all_venues) * len(range(2010, 2025))
-        loaded = 0
+        def report_progress(loaded, total_combinations):
+            progress_bar.progress(loaded / total_combinations,
+                                  f"Loading papers from ({loaded}/{total_combinations}) venues and years")
 
-        for venue in all_venues:
-            for year in range(2010, 2025):
-                self._fetch_and_store_papers(venue, year)
-                loaded += 1
-                progress_bar.progress(loaded / total_combinations,
-                                      f"Loading papers from ({loaded}/{total_combinations}) venues and years")
+        IngestionEngine(self).run(jobs, report_progress)
+        # The engine stores batches only; link and embed everything once at the end
+        self.link_duplicates()
+        self._update_vectors()
 
         self.mark_initialized()
         return True
 
-    def _get_connection(self):
-        conn = sqlite3.connect(self.db_path, timeout=30.0)
-        conn.execute("PRAGMA journal_mode=WAL")
-        conn.execute("PRAGMA busy_timeout=30000")
-        return conn
+    def get_connection_stats(self) -> Dict[str, Any]:
+        """Connection pool hit/miss statistics"""
+        return self.connections.get_stats()
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Search result cache hit/miss statistics"""
+        return self.query_cache.get_stats()
 
     def _init_search_index(self):
-        conn = self._get_connection()
-        try:
+        with self.connections.writer() as conn, metrics.span('fts'):
             conn.execute(
-                'INSERT INTO papers_search(papers_search) VALUES("rebuild")')
-            conn.commit()
-        finally:
-            conn.close()
+                "INSERT INTO papers_search(papers_search) VALUES('rebuild')")
 
     def start_background_fetch(self):
         if self.fetch_thread is None or not self.fetch_thread.is_alive():
@@ -112,78 +186,640 @@ class PaperDB:
                 target=self._background_fetch_worker)
             self.fetch_thread.daemon = True
             self.fetch_thread.start()
+        self.scheduler.start()
+
+    def stop_background_fetch(self, timeout: Optional[float] = None):
+        """Stop scheduling refreshes and let the worker finish its current job"""
+        self.scheduler.stop(timeout)
+        if self.fetch_thread is not None and self.fetch_thread.is_alive():
+            # Sorts ahead of every queued job
+            self.fetch_queue.put((-1, next(self._queue_seq), None, None))
+            self.fetch_thread.join(timeout)
 
     def _background_fetch_worker(self):
         while True:
-            try:
-                venue, year = self.fetch_queue.get()
-                self._fetch_and_store_papers(venue, year)
+            _, _, venue, year = self.fetch_queue.get()
+            if venue is None:
                 self.fetch_queue.task_done()
+                break
+            with self._queued_lock:
+                self._queued.discard((venue, year))
+            try:
+                changed = self._fetch_and_store_papers(venue, year)
+                self._record_crawl(venue, year, changed=changed > 0)
             except Exception as e:
-                st.error(f"Error in background fetch: {str(e)}")
+                # Not shown anywhere on this thread; the metrics error log keeps it
+                print(f"Error in background fetch for {venue}-{year}: {str(e)}")
+                metrics.error('refresh', e, venue=venue)
+                try:
+                    self._record_crawl(venue, year, failed=True)
+                except Exception as e:
+                    # The worker must outlive it: later jobs and publishing depend on it
+                    print(f"Error recording the crawl of {venue}-{year}: {str(e)}")
+                    metrics.error('refresh', e, venue=venue)
+            else:
+                self._unpublished = self._unpublished or changed > 0
+            finally:
+                self.fetch_queue.task_done()
+            # Readers of a serving directory see the refreshed papers once published,
+            # which happens after a burst of refreshes rather than after every one
+            if self.serving_dir is not None and self._unpublished and (
+                    self.fetch_queue.empty()
+                    or time.monotonic() - self._published_at >= SERVING_PUBLISH_INTERVAL):
+                self.publish()
 
-    def queue_fetch(self, venue: str, year: int):
-        self.fetch_queue.put((venue, year))
+    def queue_fetch(self, venue: str, year: int, priority: int = 0) -> bool:
+        """Queue a venue-year for the background worker unless it is already queued"""
+        with self._queued_lock:
+            if (venue, year) in self._queued:
+                return False
+            self._queued.add((venue, year))
+        self.fetch_queue.put((priority, next(self._queue_seq), venue, year))
+        return True
 
-    def _fetch_and_store_papers(self, venue: str, year: int):
+    def _fetch_and_store_papers(self, venue: str, year: int) -> int:
         from utils import get_parser_for_venue
         parser = get_parser_for_venue(venue)
-        papers = parser.fetch_papers(venue, year)
+        with metrics.span('fetch', venue=venue):
+            result = parser.download(venue, year)
+        metrics.count('bytes', result.size, venue=venue)
+        # Source unchanged since the last crawl: nothing to parse or write
+        if not result.changed and self.has_papers(venue, year):
+            return 0
+        papers = metrics.timed_iter('parse', lambda: parser.iter_papers(result, venue, year), venue=venue)
+        changed = self._store_papers(venue, year, papers)
+        if changed:
+            self.link_duplicates()
+            self._update_vectors()
+        # Only now is the download cached: had anything above failed, the next crawl parses it again
+        parser.commit(result)
+        return changed
+
+    def link_duplicates(self):
+        """Link newly stored papers to their near duplicates; a failure only delays it"""
+        try:
+            with metrics.span('dedup'):
+                Deduplicator(self).update()
+        except Exception as e:
+            print(f"Error linking duplicate papers: {str(e)}")
+
+    def publish(self) -> Optional[str]:
+        """Publish the database as a new generation of serving_dir; a failure only logs"""
+        from db.serving import publish
+        try:
+            with metrics.span('publish'):
+                generation = publish(self, self.serving_dir)
+        except Exception as e:
+            print(f"Error publishing the database to {self.serving_dir}: {str(e)}")
+            return None
+        self._unpublished = False
+        self._published_at = time.monotonic()
+        return generation
+
+    def vector_index(self) -> Optional[VectorIndex]:
+        """The semantic search index, if the embedding job has built one"""
+        if not VectorIndex.exists(self.db_path):
+            return None
+        return VectorIndex.for_db(self)
+
+    def shard_index(self) -> Optional[ShardedIndex]:
+        """The sharded full-text index, if the batch job has built one"""
+        if not ShardedIndex.exists(self.db_path):
+            return None
+        return ShardedIndex.for_db(self)
+
+    def _route_to_shards(self, papers: Sequence[Tuple], watermark: str):
+        """
+        Index freshly stored (id, title, abstract, authors, venue, year) rows in
+        their shards; a failure leaves the shards behind until their next update
+        """
+        try:
+            shards = self.shard_index()
+            if shards is not None and papers:
+                with metrics.span('fts', kind='shards'):
+                    shards.index(papers, watermark)
+        except Exception as e:
+            print(f"Error routing papers to the index shards: {str(e)}")
 
-        conn = self._get_connection()
+    def _update_vectors(self):
+        """Embed newly stored papers; semantic search is optional, so failures only log"""
         try:
-            for paper in papers:
+            index = self.vector_index()
+            if index is None:
+                return
+            with metrics.span('embed'):
+                updated = index.update()
+            if updated:
+                related = RelatedPapers(self, index)
+                if related.is_built():
+                    with metrics.span('related'):
+                        related.update()
+        except Exception as e:
+            print(f"Error updating paper embeddings: {str(e)}")
+
+    def _record_crawl(self, venue: str, year: int, changed: bool = False, failed: bool = False):
+        """Update the crawl state of a venue-year after a fetch attempt"""
+        now = datetime.now().isoformat()
+        with self.connections.writer() as conn:
+            if failed:
+                conn.execute('''
+                    INSERT INTO crawl_state (venue, year, last_fetched, failure_count)
+                    VALUES (?, ?, ?, 1)
+                    ON CONFLICT(venue, year) DO UPDATE SET
+                        last_fetched = excluded.last_fetched,
+                        failure_count = failure_count + 1
+                ''', (venue, year, now))
+            else:
                 conn.execute('''
-                    INSERT OR REPLACE INTO papers 
-                    (title, authors, venue, year, paper_url, abstract, last_updated)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    paper['title'],
-                    paper['authors'],
-                    paper['event'],
-                    year,
-                    paper.get('paper_url'),
-                    paper.get('abstract', ''),
-                    datetime.now().isoformat()
-                ))
-            conn.commit()
-        finally:
-            conn.close()
+                    INSERT INTO crawl_state (venue, year, last_fetched, last_changed, paper_count)
+                    VALUES (?, ?, ?, ?, (SELECT COUNT(*) FROM papers WHERE venue = ? AND year = ?))
+                    ON CONFLICT(venue, year) DO UPDATE SET
+                        last_fetched = excluded.last_fetched,
+                        last_changed = COALESCE(excluded.last_changed, last_changed),
+                        paper_count = excluded.paper_count,
+                        failure_count = 0
+                ''', (venue, year, now, now if changed else None, venue, year))
+
+    def get_crawl_state(self) -> Dict[Tuple[str, int], Dict[str, Any]]:
+        """Crawl state of every venue-year fetched so far"""
+        with self.connections.reader() as conn:
+            return {(row['venue'], row['year']): dict(row)
+                    for row in conn.execute('SELECT * FROM crawl_state')}
+
+    def has_papers(self, venue: str, year: int) -> bool:
+        """Whether any papers are stored for a venue-year"""
+        with self.connections.reader() as conn:
+            return conn.execute('SELECT 1 FROM papers WHERE venue = ? AND year = ? LIMIT 1',
+                                (venue, year)).fetchone() is not None
+
+    def has_arxiv_mirror(self) -> bool:
+        """Whether arXiv metadata has been harvested into the database"""
+        with self.connections.reader() as conn:
+            return conn.execute('SELECT 1 FROM papers WHERE venue = ? LIMIT 1',
+                                (ARXIV_VENUE,)).fetchone() is not None
+
+    def _store_papers(self, venue: str, year: int, papers: Iterable[Dict[str, Any]]) -> int:
+        """
+        Upsert papers in batches, one transaction per batch
+        papers may be any iterable, e.g. a streaming parser's generator; only one
+        batch is held in memory at a time. Existing rows keep their ids and are only
+        rewritten when their content changed; returns the number of inserted or updated rows
+        """
+        changed = 0
+        papers = iter(papers)
+        while True:
+            batch = list(itertools.islice(papers, WRITE_BATCH_SIZE))
+            if not batch:
+                break
+            # Rows touched by this batch are the ones stamped with its timestamp
+            now = datetime.now().isoformat()
+            rows = [(
+                paper['title'],
+                paper['authors'],
+                venue,
+                year,
+                paper.get('paper_url'),
+                paper.get('abstract', ''),
+                now
+            ) for paper in batch]
+            # The FTS index is kept by triggers, so its upkeep is part of the write
+            stored = []
+            with self.connections.writer() as conn, metrics.span('write', venue=venue):
+                cursor = conn.executemany(UPSERT_PAPER_SQL, rows)
+                if cursor.rowcount:
+                    changed += cursor.rowcount
+                    stored = conn.execute(
+                        'SELECT id, title, abstract, authors, venue, year FROM papers'
+                        ' WHERE venue = ? AND year = ? AND last_updated = ?',
+                        (venue, year, now)).fetchall()
+                    sync_paper_authors(conn, ((paper[0], paper[3]) for paper in stored))
+            metrics.count('papers', len(batch), venue=venue)
+            self._route_to_shards(stored, now)
+        if changed:
+            self.query_cache.invalidate()
+        return changed
 
     def search_papers(self, query: str, venue: str = None, year: int = None) -> List[Dict[str, Any]]:
-        conn = self._get_connection()
-        # Replace hyphens with spaces for search
-        query = query.replace('-', ' ')
+        key = QueryCache.make_key('all', query, venue, year)
+        return self.query_cache.get_or_compute(
+            key, lambda: self._search_papers(query, venue, year))
+
+    def _search_papers(self, query: str, venue: str = None, year: int = None) -> List[Dict[str, Any]]:
+        with self.connections.reader() as conn:
+            plan = self._plan_search(conn, query, venue, year)
+            if plan is None:
+                return []
+            from_sql, where_sql, params, rank_sql = plan
+            sql = 'SELECT p.* ' + from_sql + where_sql + f' ORDER BY {rank_sql}, p.id'
+            return [dict(row) for row in metrics.query(conn, 'search_all', sql, params)]
+
+    def _plan_search(self, conn, query: str, venue: str = None, year: int = None,
+                     categories: Optional[Sequence[str]] = None, collapse: bool = True):
+        """
+        Compile the user's query and build the FROM/WHERE clauses and rank
+        expression for it, or return None if it has neither terms nor filters
+        categories restricts the search to (harvested arXiv) papers filed under any of them.
+        Near duplicates are left out unless collapse is False.
+        When the venue/year filter selects few papers, walk them through their
+        index and probe the FTS index by rowid; otherwise the MATCH drives the join
+        """
+        compiled = compile_query(query)
+        filters, params = self._search_filters(compiled, venue, year, categories)
+        collapse_sql, collapse_params = '', []
+        if collapse:
+            collapse_sql, collapse_params = self._collapse_duplicates(filters, params)
+        filters = [f.format(t='p') for f in filters]
+
+        if compiled.match is None:
+            # Qualifiers only: list the matching papers without ranking
+            if not filters:
+                return None
+            return (' FROM papers p', ' WHERE ' + ' AND '.join(filters) + collapse_sql,
+                    params + collapse_params, '0.0')
+
+        where_sql = ' WHERE papers_search MATCH ?'
+        from_sql = ' FROM papers_search ps JOIN papers p ON p.id = ps.rowid'
+        if filters:
+            filter_sql = ' AND '.join(filters)
+            where_sql += ' AND ' + filter_sql
+            filtered = metrics.query(
+                conn, 'filter_count', 'SELECT COUNT(*) FROM papers p WHERE ' + filter_sql, params)[0][0]
+            if filtered <= FILTER_FIRST_MAX_ROWS:
+                from_sql = ' FROM papers p CROSS JOIN papers_search ps'
+                where_sql += ' AND ps.rowid = p.id'
+
+        return from_sql, where_sql + collapse_sql, [compiled.match] + params + collapse_params, 'ps.rank'
+
+    @staticmethod
+    def _search_filters(compiled, venue: str = None, year: int = None,
+                        categories: Optional[Sequence[str]] = None) -> Tuple[List[str], List[Any]]:
+        """WHERE terms of a search, as templates over the table alias {t}, and their params"""
+        filters = []
+        params = []
+        # Qualifiers in the query narrow the explicit filters further
+        for column, value in (('venue', compiled.venue), ('year', compiled.year)):
+            if value is not None:
+                filters.append(f'{{t}}.{column} = ?')
+                params.append(value)
+        if venue and venue != "All":
+            filters.append('{t}.venue = ?')
+            params.append(venue)
+        if year and year != "All":
+            filters.append('{t}.year = ?')
+            params.append(int(year))
+        if compiled.match is None and compiled.exclude is not None:
+            # Only excluded words: every paper without them
+            filters.append('{t}.id NOT IN (SELECT rowid FROM papers_search WHERE papers_search MATCH ?)')
+            params.append(compiled.exclude)
+        if categories:
+            filters.append('{t}.id IN (SELECT paper_id FROM paper_categories WHERE category IN (%s))'
+                           % ', '.join('?' * len(categories)))
+            params.extend(categories)
+        return filters, params
+
+    @staticmethod
+    def _collapse_duplicates(filters: List[str], params: List[Any]) -> Tuple[str, List[Any]]:
+        """
+        WHERE clause hiding duplicates whose canonical paper passes the same filters
+        filters are templates over the table alias {t}. Duplicates share their text,
+        so the canonical paper is taken to match the query whenever they do
+        """
+        canonical_filters = ''.join(' AND ' + f.format(t='q') for f in filters)
+        return (' AND NOT EXISTS (SELECT 1 FROM paper_clusters d JOIN papers q ON q.id = d.canonical_id'
+                ' WHERE d.paper_id = p.id' + canonical_filters + ')'), list(params)
+
+    def search_papers_page(self, query: str, venue: str = None, year: int = None,
+                           cursor: Optional[Tuple] = None,
+                           limit: int = PAPERS_PER_PAGE,
+                           categories: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Fetch one page of lightweight search results (no abstracts)
+        Pages are keyed by the (rank, id) of the last row of the previous page,
+        followed by 'shards' if the sharded index ranked it; returns papers, the
+        cursor for the next page and a capped total count
+        """
+        categories = tuple(sorted(categories)) if categories else None
+        key = QueryCache.make_key('page', query, venue, year,
+                                  tuple(cursor) if cursor else None, limit, categories)
+        return self.query_cache.get_or_compute(
+            key, lambda: self._search_papers_page(query, venue, year, cursor, limit, categories))
+
+    def _search_papers_page(self, query: str, venue: str = None, year: int = None,
+                            cursor: Optional[Tuple] = None,
+                            limit: int = PAPERS_PER_PAGE,
+                            categories: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        shards = self.shard_index()
+        # Ranks differ between the indexes, so paging stays with the one that started
+        shard_cursor = cursor is not None and len(cursor) > 2
+        if shards is not None and not categories and (cursor is None or shard_cursor):
+            page = self._search_shards_page(shards, query, venue, year,
+                                            tuple(cursor[:2]) if cursor else None, limit)
+            if page is not None:
+                return page
+        if shard_cursor:
+            # The shards failed partway through the pages: start over in the main index
+            cursor = None
+        with self.connections.reader() as conn:
+            plan = self._plan_search(conn, query, venue, year, categories)
+            if plan is None:
+                return {'papers': [], 'next_cursor': None, 'total': 0, 'total_is_estimate': False}
+            from_sql, where_sql, params, rank_sql = plan
+
+            page_sql = f'''
+                SELECT p.id, p.title, p.authors, p.venue, p.year, p.paper_url,
+                       length(p.abstract) > 0 AS has_abstract, {rank_sql} AS rank,
+                       (SELECT COUNT(*) FROM paper_clusters d WHERE d.canonical_id = p.id) AS duplicates
+            ''' + from_sql + where_sql
+            page_params = list(params)
+            if cursor is not None:
+                page_sql += f' AND ({rank_sql}, p.id) > (?, ?)'
+                page_params.extend(cursor)
+            page_sql += f' ORDER BY {rank_sql}, p.id LIMIT ?'
+            page_params.append(limit + 1)
+
+            count_sql = 'SELECT COUNT(*) FROM (SELECT 1' + \
+                from_sql + where_sql + ' LIMIT ?)'
+
+            rows = [dict(row) for row in metrics.query(conn, 'search_page', page_sql, page_params)]
+            total = metrics.query(conn, 'search_count', count_sql, params + [SEARCH_COUNT_CAP])[0][0]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1]['rank'], rows[-1]['id'])
+
+        return {
+            'papers': rows,
+            'next_cursor': next_cursor,
+            'total': total,
+            'total_is_estimate': total >= SEARCH_COUNT_CAP
+        }
+
+    def _search_shards_page(self, shards: ShardedIndex, query: str, venue: str = None,
+                            year: int = None, cursor: Optional[Tuple[float, int]] = None,
+                            limit: int = PAPERS_PER_PAGE) -> Optional[Dict[str, Any]]:
+        """
+        One page of results from the sharded index, or None to search the
+        main index instead: for queries without terms, while the shards are
+        behind the papers table, or when a shard fails
+        Candidates come from the shards in rank order and the rows from papers;
+        near duplicates are dropped there, so a batch may come up short and the
+        next one is asked for. Totals count the dropped duplicates too
+        """
+        compiled = compile_query(query)
+        if compiled.match is None or shards.behind:
+            return None
+        filters, params = self._search_filters(compiled, venue, year)
+        collapse_sql, collapse_params = self._collapse_duplicates(filters, params)
+        shard_filters = [f.format(t='papers_search') for f in filters]
+
+        rows = []
+        total = None
+        batch_cursor = cursor
         try:
-            conn.row_factory = sqlite3.Row
-            sql = '''
-                SELECT p.* 
-                FROM papers p
-                JOIN papers_search ps ON p.id = ps.rowid
-                WHERE papers_search MATCH ?
-            '''
-            params = [query]
-
-            if venue and venue != "All":
-                sql += ' AND p.venue LIKE ?'
-                params.append(f'{venue}-%')  # Matches "ACL-" at the start
-
-            if year and year != "All":
-                sql += ' AND p.year = ?'
-                params.append(year)
-
-            sql += ' ORDER BY rank'
-
-            cursor = conn.execute(sql, params)
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
+            while len(rows) <= limit:
+                with metrics.span('query', kind='shards'):
+                    candidates, batch_total = shards.search(
+                        compiled.match, shard_filters, params, batch_cursor, limit + 1,
+                        count=total is None)
+                if total is None:
+                    total = batch_total
+                if not candidates:
+                    break
+                ranks = {paper_id: rank for rank, paper_id in candidates}
+                with self.connections.reader() as conn:
+                    found = metrics.query(conn, 'shard_rows', f'''
+                        SELECT p.id, p.title, p.authors, p.venue, p.year, p.paper_url,
+                               length(p.abstract) > 0 AS has_abstract,
+                               (SELECT COUNT(*) FROM paper_clusters d WHERE d.canonical_id = p.id) AS duplicates
+                        FROM papers p WHERE p.id IN ({', '.join('?' * len(ranks))})''' + collapse_sql,
+                        list(ranks) + collapse_params)
+                found = [dict(row, rank=ranks[row['id']]) for row in found]
+                rows.extend(sorted(found, key=lambda row: (row['rank'], row['id'])))
+                if len(candidates) <= limit:
+                    break
+                batch_cursor = candidates[-1]
+        except Exception as e:
+            print(f"Error searching the index shards: {str(e)}")
+            metrics.error('query', e, kind='shards')
+            return None
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1]['rank'], rows[-1]['id'], 'shards')
+
+        return {
+            'papers': rows,
+            'next_cursor': next_cursor,
+            'total': total,
+            'total_is_estimate': total >= SEARCH_COUNT_CAP
+        }
+
+    def get_facets(self, query: str = '', venue: str = None, year: int = None,
+                   categories: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Per-venue and per-year result counts of a search, to label its filters
+        Each facet is counted under the other one's selection (venues within the
+        chosen year, years within the chosen venue), both from a single GROUP BY
+        over the matching rows; without search terms, from venue_year_stats.
+        Returns {total, venues: {venue: count}, years: {year: count}, any_venue,
+        any_year}, the last two being the counts with that filter set to "All"
+        """
+        categories = tuple(sorted(categories)) if categories else None
+        key = QueryCache.make_key('facets', query or '', venue, year, categories)
+        return self.query_cache.get_or_compute(
+            key, lambda: self._get_facets(query or '', venue, year, categories))
+
+    def _get_facets(self, query: str, venue: str = None, year: int = None,
+                    categories: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        with self.connections.reader() as conn:
+            plan = self._plan_search(conn, query, categories=categories, collapse=False)
+            if plan is None:
+                # Every paper: venue_year_stats, with duplicates moved to cells of their own
+                cells = {(cell_venue, cell_year, None, None): count for cell_venue, cell_year, count
+                         in conn.execute('SELECT venue, year, paper_count FROM venue_year_stats')}
+                for cell_venue, cell_year, canonical_venue, canonical_year, count in metrics.query(
+                        conn, 'facets_clusters', '''
+                        SELECT p.venue, p.year, q.venue, q.year, COUNT(*)
+                        FROM paper_clusters d JOIN papers p ON p.id = d.paper_id
+                        JOIN papers q ON q.id = d.canonical_id
+                        GROUP BY p.venue, p.year, q.venue, q.year'''):
+                    cells[cell_venue, cell_year, None, None] -= count
+                    cells[cell_venue, cell_year, canonical_venue, canonical_year] = count
+                cells = [key + (count,) for key, count in cells.items()]
+            else:
+                # Matches grouped by their own venue-year and their canonical paper's
+                from_sql, where_sql, params, _ = plan
+                canonical_sql = ''
+                if categories:
+                    canonical_sql = (' AND q.id IN (SELECT paper_id FROM paper_categories'
+                                     ' WHERE category IN (%s))' % ', '.join('?' * len(categories)))
+                cells = metrics.query(
+                    conn, 'facets',
+                    'SELECT p.venue, p.year, q.venue, q.year, COUNT(*)' + from_sql +
+                    ' LEFT JOIN paper_clusters d ON d.paper_id = p.id'
+                    ' LEFT JOIN papers q ON q.id = d.canonical_id' + canonical_sql + where_sql +
+                    ' GROUP BY p.venue, p.year, q.venue, q.year',
+                    list(categories or ()) + params)
+
+        venue = None if venue in (None, '', 'All') else venue
+        year = None if year in (None, '', 'All') else int(year)
+
+        def passes(cell_venue, cell_year, venue, year):
+            return cell_venue is not None and venue in (None, cell_venue) and year in (None, cell_year)
+
+        # Each count is what the search filtered to that facet would find: like
+        # there, a duplicate is hidden when its canonical paper passes the filters too
+        facets = {'total': 0, 'venues': {}, 'years': {}, 'any_venue': 0, 'any_year': 0}
+        for cell_venue, cell_year, canonical_venue, canonical_year, count in cells:
+            if passes(cell_venue, cell_year, None, year) and \
+                    not passes(canonical_venue, canonical_year, cell_venue, year):
+                facets['venues'][cell_venue] = facets['venues'].get(cell_venue, 0) + count
+            if passes(cell_venue, cell_year, venue, None) and \
+                    not passes(canonical_venue, canonical_year, venue, cell_year):
+                facets['years'][cell_year] = facets['years'].get(cell_year, 0) + count
+            if passes(cell_venue, cell_year, None, year) and \
+                    not passes(canonical_venue, canonical_year, None, year):
+                facets['any_venue'] += count
+            if passes(cell_venue, cell_year, venue, None) and \
+                    not passes(canonical_venue, canonical_year, venue, None):
+                facets['any_year'] += count
+            if passes(cell_venue, cell_year, venue, year) and \
+                    not passes(canonical_venue, canonical_year, venue, year):
+                facets['total'] += count
+        return facets
+
+    def search_papers_semantic(self, query: str, venue: str = None, year: int = None,
+                               limit: int = PAPERS_PER_PAGE, hybrid: bool = True) -> Dict[str, Any]:
+        """
+        Search by meaning rather than by words alone, one page without cursors
+        hybrid re-ranks the best full-text matches by a blend of bm25 and cosine
+        similarity; otherwise the nearest papers in the vector index are returned,
+        whether or not they contain the query's words. Falls back to plain
+        full-text search when no vector index has been built
+        """
+        key = QueryCache.make_key('hybrid' if hybrid else 'semantic', query, venue, year, limit)
+        return self.query_cache.get_or_compute(
+            key, lambda: self._search_papers_semantic(query, venue, year, limit, hybrid))
+
+    def _search_papers_semantic(self, query: str, venue: str = None, year: int = None,
+                                limit: int = PAPERS_PER_PAGE, hybrid: bool = True) -> Dict[str, Any]:
+        index = self.vector_index()
+        if index is None:
+            return self._search_papers_page(query, venue, year, limit=limit)
+        compiled = compile_query(query)
+        query_vector = index.embed_query(' '.join(compiled.terms))
+        venue = venue if venue and venue != "All" else compiled.venue
+        year = int(year) if year and year != "All" else compiled.year
+
+        with self.connections.reader() as conn:
+            if hybrid:
+                plan = self._plan_search(conn, query, venue, year)
+                if plan is None:
+                    return {'papers': [], 'next_cursor': None, 'total': 0, 'total_is_estimate': False}
+                from_sql, where_sql, params, rank_sql = plan
+                candidates = metrics.query(
+                    conn, 'hybrid_candidates',
+                    f'SELECT p.id, {rank_sql} AS rank' + from_sql + where_sql +
+                    f' ORDER BY {rank_sql}, p.id LIMIT ?',
+                    params + [VECTOR_HYBRID_CANDIDATES])
+                ids = [row['id'] for row in candidates]
+                # bm25 ranks are negative, best first; scale them to (0, 1] by the best one
+                best = min((row['rank'] for row in candidates), default=0) or -1
+                lexical = [row['rank'] / best for row in candidates]
+                with metrics.span('query', kind='vector_similarity'):
+                    similarity = index.similarities(query_vector, ids)
+                scores = {paper_id: VECTOR_HYBRID_ALPHA * float(sim) + (1 - VECTOR_HYBRID_ALPHA) * lex
+                          for paper_id, sim, lex in zip(ids, similarity, lexical)}
+                total = len(candidates)
+            else:
+                # Filters and collapsed duplicates are applied after the lookup, so look further
+                with metrics.span('query', kind='vector_search'):
+                    hits = index.search(query_vector, limit * 20 if venue or year else limit * 2)
+                scores = dict(hits)
+                total = len(hits)
+
+            filter_sql = ''
+            params = []
+            if not hybrid:
+                filters = []
+                for column, value in (('venue', venue), ('year', year)):
+                    if value:
+                        filters.append(f'{{t}}.{column} = ?')
+                        params.append(value)
+                collapse_sql, collapse_params = self._collapse_duplicates(filters, params)
+                filter_sql = ''.join(' AND ' + f.format(t='p') for f in filters) + collapse_sql
+                params += collapse_params
+            rows = []
+            ids = list(scores)
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows += metrics.query(conn, 'semantic_rows', '''
+                    SELECT p.id, p.title, p.authors, p.venue, p.year, p.paper_url,
+                           length(p.abstract) > 0 AS has_abstract,
+                           (SELECT COUNT(*) FROM paper_clusters d WHERE d.canonical_id = p.id) AS duplicates
+                    FROM papers p WHERE p.id IN (%s)
+                ''' % ', '.join('?' * len(chunk)) + filter_sql, chunk + params)
+
+        papers = sorted((dict(row, score=scores[row['id']]) for row in rows),
+                        key=lambda paper: -paper['score'])
+        if not hybrid:
+            total = len(papers)
+        return {
+            'papers': papers[:limit],
+            'next_cursor': None,
+            'total': total,
+            'total_is_estimate': hybrid and total >= VECTOR_HYBRID_CANDIDATES
+        }
+
+    def data_version(self) -> str:
+        """
+        Identifies the database contents as of now, across processes
+        Derived from the database and WAL file metadata, which every commit
+        changes; when another process has written since the last call, the
+        result cache of this one is dropped
+        """
+        parts = []
+        for path in (self.db_path, self.db_path.with_name(self.db_path.name + '-wal')):
+            try:
+                stat = path.stat()
+                parts.append(f'{stat.st_mtime_ns:x}.{stat.st_size:x}')
+            except FileNotFoundError:
+                parts.append('-')
+        version = '-'.join(parts)
+        with self._data_version_lock:
+            if self._data_version is not None and version != self._data_version:
+                self.query_cache.invalidate()
+            self._data_version = version
+        return version
+
+    def get_paper(self, paper_id: int) -> Optional[Dict[str, Any]]:
+        """A single paper with its abstract, or None if there is no such paper"""
+        with self.connections.reader() as conn:
+            row = conn.execute('SELECT * FROM papers WHERE id = ?', (paper_id,)).fetchone()
+            return dict(row) if row else None
+
+    def get_abstract(self, paper_id: int) -> str:
+        """Fetch a single paper's abstract on demand"""
+        with self.connections.reader() as conn:
+            row = conn.execute(
+                'SELECT abstract FROM papers WHERE id = ?', (paper_id,)).fetchone()
+            return row['abstract'] if row else ''
+
+    def get_related_papers(self, paper_id: int, limit: int = RELATED_TOP_N) -> List[Dict[str, Any]]:
+        """Most similar papers to a paper, best first, as computed by the related job"""
+        with self.connections.reader() as conn:
+            # Papers deleted since the job ran drop out in the join
+            return [dict(row) for row in conn.execute('''
+                SELECT p.id, p.title, p.authors, p.venue, p.year, p.paper_url, r.score
+                FROM related r JOIN papers p ON p.id = r.neighbor_id
+                WHERE r.paper_id = ?
+                ORDER BY r.score DESC LIMIT ?
+            ''', (paper_id, limit))]
 
     def get_paper_count(self):
-        """Get total papers in database"""
-        conn = self._get_connection()
-        try:
-            cursor = conn.execute('SELECT COUNT(*) FROM papers')
+        """Get total papers in database, from the per venue-year counts"""
+        with self.connections.reader() as conn:
+            cursor = conn.execute('SELECT COALESCE(SUM(paper_count), 0) FROM venue_year_stats')
             return cursor.fetchone()[0]
-        finally:
-            conn.close()
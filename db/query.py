@@ -0,0 +1,115 @@
+import re
+from typing import List, NamedTuple, Optional
+
+from config import VENUE_GROUPS, ARXIV_VENUE
+
+# field:value, field:"quoted value", field: with nothing after it yet,
+# "phrase" (closing quote optional) or a bare word
+_TOKEN_RE = re.compile(
+    r'(?P<field>\w+):(?:"(?P<quoted_value>[^"]*)"?|(?P<value>[^\s"]+))'
+    r'|(?P<empty_field>\w+):(?=\s|$)'
+    r'|"(?P<phrase>[^"]*)"?'
+    r'|(?P<word>[^\s"]+)')
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Qualifiers that restrict an FTS column; venue: and year: become SQL filters
+_COLUMNS = {'title': 'title', 'abstract': 'abstract', 'author': 'authors', 'authors': 'authors'}
+
+_VENUES = {venue.lower(): venue
+           for venues in VENUE_GROUPS.values() for venue in venues}
+_VENUES[ARXIV_VENUE.lower()] = ARXIV_VENUE
+
+
+class CompiledQuery(NamedTuple):
+    match: Optional[str]  # FTS5 MATCH expression, None if the query has no search terms
+    venue: Optional[str] = None
+    year: Optional[int] = None
+    terms: List[str] = []  # plain search words, in order
+    exclude: Optional[str] = None  # MATCH expression of excluded words, if the query has nothing else
+
+
+def _phrase(words: List[str], prefix: bool = False) -> str:
+    """Quote words as one FTS5 string, so no user input is read as syntax"""
+    return '"' + ' '.join(words) + '"' + ('*' if prefix else '')
+
+
+def _words(text: str) -> List[str]:
+    return [word.lower() for word in _WORD_RE.findall(text)]
+
+
+def compile_query(text: str, prefix_last: bool = False) -> CompiledQuery:
+    """
+    Turn user input into a safe FTS5 MATCH expression plus SQL filters
+    - words are matched as given; word* matches a prefix, and with
+      prefix_last the last word does too (search as you type)
+    - "quoted phrases", and hyphenated-words as phrases
+    - title:, abstract:, author: restrict a word or "phrase" to a column
+    - venue:ACL and year:2020 filter the results
+    - OR between two terms matches either; -word excludes a word, and a
+      query of excluded words only matches every paper without them
+    Terms are ANDed; anything else FTS5 would read as syntax is quoted.
+    A qualifier with nothing after it is ignored, and year: with something
+    other than a year is searched as text like unknown qualifiers
+    """
+    venue = None
+    year = None
+    groups = []  # ANDed groups of ORed terms
+    excluded = []
+    terms = []
+    join_next = False
+
+    matches = list(_TOKEN_RE.finditer(text or ''))
+    for position, token in enumerate(matches):
+        field = token.group('field') or token.group('empty_field')
+        if token.group('empty_field') and (field.lower() in _COLUMNS
+                                           or field.lower() in ('venue', 'year')):
+            continue
+        value = token.group('quoted_value') or token.group('value') or ''
+        if field and field.lower() == 'venue':
+            venue = _VENUES.get(value.lower(), value)
+            continue
+        if field and field.lower() == 'year' and value.isdigit():
+            year = int(value)
+            continue
+
+        column = _COLUMNS.get(field.lower()) if field else None
+        if field and column is None:
+            raw = f"{field} {value}"
+        else:
+            raw = token.group('quoted_value') or token.group('value') \
+                or token.group('phrase') or token.group('word') or ''
+
+        if token.group('word') == 'OR':
+            join_next = bool(groups)
+            continue
+
+        negate = bool(token.group('word')) and raw.startswith('-') and len(raw) > 1
+        words = _words(raw)
+        if not words:
+            continue
+        is_phrase = token.group('phrase') is not None or token.group('quoted_value') is not None
+        prefix = not is_phrase and len(words) == 1 and (
+            raw.endswith('*') or (prefix_last and position == len(matches) - 1
+                                  and not text[token.end():].strip()
+                                  and not text.endswith(' ')))
+        term = _phrase(words, prefix)
+        if column:
+            term = f'{column} : {term}'
+
+        if negate:
+            excluded.append(term)
+            continue
+        terms.extend(words)
+        if join_next:
+            groups[-1].append(term)
+        else:
+            groups.append([term])
+        join_next = False
+
+    if not groups:
+        return CompiledQuery(None, venue, year, terms, ' OR '.join(excluded) or None)
+    match = ' AND '.join(group[0] if len(group) == 1 else '(' + ' OR '.join(group) + ')'
+                         for group in groups)
+    for term in excluded:
+        match += f' NOT {term}'
+    return CompiledQuery(match, venue, year, terms)
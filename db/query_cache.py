@@ -0,0 +1,110 @@
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from cachetools import TTLCache
+
+from config import QUERY_CACHE_MAX_BYTES, QUERY_CACHE_TTL
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+_MISSING = object()
+
+
+def _estimate_size(value) -> int:
+    """Approximate the memory held by a cached result"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_size(k) + _estimate_size(v)
+                    for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_estimate_size(item) for item in value)
+    return size
+
+
+class QueryCache:
+    """
+    Process-wide LRU/TTL cache of search results for one database file
+    Bounded by the estimated size of cached results in bytes; entries are
+    tagged with a generation that is bumped whenever new papers are stored
+    """
+
+    @classmethod
+    def for_path(cls, db_path) -> 'QueryCache':
+        """Get the shared cache for a database file, creating it on first use"""
+        key = str(Path(db_path).resolve())
+        with _caches_lock:
+            if key not in _caches:
+                _caches[key] = cls()
+            return _caches[key]
+
+    @classmethod
+    def discard(cls, db_path):
+        """Forget the shared cache of a database file"""
+        with _caches_lock:
+            _caches.pop(str(Path(db_path).resolve()), None)
+
+    def __init__(self, max_bytes: int = QUERY_CACHE_MAX_BYTES, ttl: float = QUERY_CACHE_TTL):
+        self._cache = TTLCache(maxsize=max_bytes, ttl=ttl,
+                               getsizeof=lambda entry: entry[2])
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    @staticmethod
+    def make_key(kind: str, query: str, venue: Optional[str] = None,
+                 year: Optional[int] = None, *extra: Hashable) -> Tuple:
+        """Normalize search parameters so equivalent searches share an entry"""
+        query = ' '.join(query.lower().split())
+        venue = None if venue in (None, '', 'All') else venue
+        year = None if year in (None, '', 'All') else int(year)
+        return (kind, query, venue, year) + extra
+
+    def get(self, key: Tuple, default=None):
+        with self._lock:
+            entry = self._cache.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] == self.generation:
+                self._stats['hits'] += 1
+                return entry[1]
+            self._stats['misses'] += 1
+            return default
+
+    def set(self, key: Tuple, value: Any, generation: Optional[int] = None):
+        """Cache a value computed during the given generation (default: current)"""
+        size = _estimate_size(value)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return  # papers landed while the value was being computed
+            try:
+                self._cache[key] = (self.generation, value, size)
+            except ValueError:  # larger than the whole cache
+                pass
+
+    def get_or_compute(self, key: Tuple, compute):
+        """Return the cached value for key, computing and caching it on a miss"""
+        generation = self.generation
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value, generation)
+        return value
+
+    def invalidate(self):
+        """Start a new generation; results cached before it are never served"""
+        with self._lock:
+            self.generation += 1
+            self._stats['invalidations'] += 1
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, hit rate and current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(generation=self.generation, entries=len(self._cache),
+                         bytes=self._cache.currsize, max_bytes=self._cache.maxsize)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,251 @@
+"""
+Related papers, precomputed offline
+
+    python -m db.related build [--db papers.db]    neighbours of every paper, from scratch
+    python -m db.related update [--db papers.db]   venue-years ingested since the last run
+
+Neighbours are the papers with the most similar embeddings (db/vectors.py),
+found exactly rather than through the IVF lists. Blocks of RELATED_BLOCK_SIZE
+papers are multiplied against RELATED_CHUNK_SIZE corpus vectors at a time,
+keeping a running top-N per paper, so memory stays bounded at any corpus
+size. The top RELATED_TOP_N land in the related table, and serving them is
+one primary-key range read.
+"""
+import argparse
+import sys
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config import (DB_PATH, RELATED_TOP_N, RELATED_MIN_SCORE, RELATED_BLOCK_SIZE,
+                    RELATED_CHUNK_SIZE)
+from db.vectors import VectorIndex
+
+PRUNE_RELATED_SQL = '''
+    DELETE FROM related WHERE paper_id = ?1 AND neighbor_id NOT IN (
+        SELECT neighbor_id FROM related WHERE paper_id = ?1 ORDER BY score DESC LIMIT ?2)
+'''
+
+
+class RelatedPapers:
+    """
+    Maintains the related table of a database from its vector index
+    update() recomputes the neighbours of venue-years whose papers have been
+    added or changed since they were last computed (by their count and their
+    newest last_updated), and offers those papers to every other paper as
+    neighbours that may beat its current weakest one
+    """
+
+    def __init__(self, db, index: VectorIndex = None):
+        self.db = db
+        self.index = index or VectorIndex.for_db(db)
+
+    def is_built(self) -> bool:
+        with self.db.connections.reader() as conn:
+            return conn.execute('SELECT 1 FROM related_state LIMIT 1').fetchone() is not None
+
+    def pending(self) -> List[Tuple[str, int]]:
+        """Venue-years whose papers have changed since their neighbours were computed"""
+        return [(venue, year) for venue, year, _, _ in self._states(pending_only=True)]
+
+    def _states(self, pending_only: bool = False) -> List[Tuple[str, int, int, Optional[str]]]:
+        """
+        (venue, year, paper count, newest last_updated) of every venue-year, or
+        of those pending; changes the vector index has not embedded yet are
+        left out of last_updated, so they stay pending until it has
+        """
+        watermark = self.index.meta['watermark'] if self.index.meta else None
+        with self.db.connections.reader() as conn:
+            states = conn.execute('''
+                SELECT p.venue, p.year, COUNT(*),
+                       MAX(CASE WHEN ?1 IS NULL OR p.last_updated <= ?1 THEN p.last_updated END),
+                       MAX(r.paper_count), MAX(r.last_updated)
+                FROM papers p
+                LEFT JOIN related_state r ON r.venue = p.venue AND r.year = p.year
+                GROUP BY p.venue, p.year
+            ''', (watermark,)).fetchall()
+        result = []
+        for venue, year, count, last_updated, computed_count, computed_last_updated in states:
+            if pending_only and count == computed_count and last_updated == computed_last_updated:
+                continue
+            result.append((venue, year, count, last_updated))
+        return result
+
+    def _corpus(self) -> np.ndarray:
+        """Ids of every embedded paper, ascending"""
+        return np.flatnonzero(np.asarray(self.index.assign) >= 0)
+
+    def _neighbours(self, ids: np.ndarray, corpus: np.ndarray, thresholds: np.ndarray = None):
+        """
+        Top RELATED_TOP_N corpus papers for each of ids, as (neighbour ids, scores)
+        arrays of shape (len(ids), RELATED_TOP_N). With thresholds (one per corpus
+        paper) also returns the (paper, neighbour, score) triples in which one of
+        ids beats a corpus paper's threshold
+        """
+        vectors = self.index.vectors
+        queries = np.asarray(vectors[ids])
+        rows = np.arange(len(ids))
+        positions = np.searchsorted(corpus, ids)
+        n = RELATED_TOP_N
+        best_scores = np.full((len(ids), n), -np.inf, dtype=np.float32)
+        best_ids = np.full((len(ids), n), -1, dtype=np.int64)
+        reverse = []
+
+        for start in range(0, len(corpus), RELATED_CHUNK_SIZE):
+            chunk = corpus[start:start + RELATED_CHUNK_SIZE]
+            scores = queries @ np.asarray(vectors[chunk]).T
+            # A paper is not its own neighbour
+            own = (positions >= start) & (positions < start + len(chunk))
+            scores[rows[own], positions[own] - start] = -np.inf
+            if thresholds is not None:
+                hit_rows, hit_cols = np.nonzero(scores > thresholds[start:start + len(chunk)])
+                reverse.append((chunk[hit_cols], ids[hit_rows], scores[hit_rows, hit_cols]))
+
+            # Once rows hold N neighbours, few scores in a chunk beat their weakest one:
+            # gather just those rather than partitioning the whole chunk
+            hit_rows, hit_cols = np.nonzero(scores > best_scores.min(axis=1)[:, None])
+            if len(hit_rows) > 4 * n * len(ids):
+                candidate_scores = scores
+                candidate_ids = np.broadcast_to(chunk, scores.shape)
+            else:
+                hit_scores = scores[hit_rows, hit_cols]
+                order = np.lexsort((-hit_scores, hit_rows))
+                hit_rows, hit_cols, hit_scores = hit_rows[order], hit_cols[order], hit_scores[order]
+                rank = np.arange(len(hit_rows)) - np.searchsorted(hit_rows, hit_rows)
+                keep = rank < n
+                candidate_scores = np.full((len(ids), n), -np.inf, dtype=np.float32)
+                candidate_ids = np.full((len(ids), n), -1, dtype=np.int64)
+                candidate_scores[hit_rows[keep], rank[keep]] = hit_scores[keep]
+                candidate_ids[hit_rows[keep], rank[keep]] = chunk[hit_cols[keep]]
+
+            merged_scores = np.concatenate([best_scores, candidate_scores], axis=1)
+            merged_ids = np.concatenate([best_ids, candidate_ids], axis=1)
+            top = np.argpartition(-merged_scores, n - 1, axis=1)[:, :n]
+            best_scores = np.take_along_axis(merged_scores, top, axis=1)
+            best_ids = np.take_along_axis(merged_ids, top, axis=1)
+
+        if thresholds is None:
+            return best_ids, best_scores
+        return best_ids, best_scores, reverse
+
+    def _thresholds(self, corpus: np.ndarray) -> np.ndarray:
+        """Score a new neighbour must beat for each corpus paper: its weakest one once it has N"""
+        thresholds = np.full(len(corpus), RELATED_MIN_SCORE, dtype=np.float32)
+        with self.db.connections.reader() as conn:
+            for paper_id, count, weakest in conn.execute(
+                    'SELECT paper_id, COUNT(*), MIN(score) FROM related GROUP BY paper_id'):
+                position = np.searchsorted(corpus, paper_id)
+                if count >= RELATED_TOP_N and position < len(corpus) and corpus[position] == paper_id:
+                    thresholds[position] = weakest
+        return thresholds
+
+    def _compute(self, ids: np.ndarray, corpus: np.ndarray, incremental: bool,
+                 progress_callback=None) -> int:
+        thresholds = None
+        if incremental:
+            thresholds = self._thresholds(corpus)
+            # Papers being recomputed get their neighbours directly, not as offers
+            thresholds[np.searchsorted(corpus, ids)] = np.inf
+
+        done = 0
+        for start in range(0, len(ids), RELATED_BLOCK_SIZE):
+            block = ids[start:start + RELATED_BLOCK_SIZE]
+            if incremental:
+                best_ids, best_scores, reverse = self._neighbours(block, corpus, thresholds)
+            else:
+                best_ids, best_scores = self._neighbours(block, corpus)
+                reverse = []
+            keep = best_scores >= RELATED_MIN_SCORE
+            rows = [(int(paper_id), int(neighbor_id), round(float(score), 4))
+                    for paper_id, neighbor_id, score in zip(
+                        np.repeat(block, RELATED_TOP_N)[keep.ravel()],
+                        best_ids[keep], best_scores[keep])]
+            offers = [(int(paper_id), int(neighbor_id), round(float(score), 4))
+                      for paper_ids, neighbor_ids, scores in reverse
+                      for paper_id, neighbor_id, score in zip(paper_ids, neighbor_ids, scores)]
+
+            with self.db.connections.writer() as conn:
+                conn.executemany('DELETE FROM related WHERE paper_id = ?',
+                                 ((int(paper_id),) for paper_id in block))
+                conn.executemany(
+                    'INSERT INTO related (paper_id, neighbor_id, score) VALUES (?, ?, ?)', rows)
+                if offers:
+                    conn.executemany('INSERT OR REPLACE INTO related (paper_id, neighbor_id, score) '
+                                     'VALUES (?, ?, ?)', offers)
+                    conn.executemany(PRUNE_RELATED_SQL, (
+                        (paper_id, RELATED_TOP_N) for paper_id in {offer[0] for offer in offers}))
+            done += len(block)
+            if progress_callback:
+                progress_callback(done, len(ids))
+        return done
+
+    def _record(self, states: List[Tuple[str, int, int, Optional[str]]]):
+        """Mark venue-years as computed, as of the states read before computing them"""
+        now = datetime.now().isoformat()
+        with self.db.connections.writer() as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO related_state (venue, year, paper_count, last_updated, computed_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', ((venue, year, count, last_updated, now)
+                  for venue, year, count, last_updated in states))
+
+    def build(self, progress_callback=None) -> int:
+        """Compute the neighbours of every embedded paper; returns how many papers"""
+        if self.index.meta is None:
+            return 0
+        states = self._states()
+        with self.db.connections.writer() as conn:
+            conn.execute('DELETE FROM related')
+            conn.execute('DELETE FROM related_state')
+        corpus = self._corpus()
+        done = self._compute(corpus, corpus, False, progress_callback)
+        self._record(states)
+        return done
+
+    def update(self, progress_callback=None) -> int:
+        """Compute neighbours for venue-years that changed since the last run; returns how many papers"""
+        if self.index.meta is None:
+            return 0
+        states = self._states(pending_only=True)
+        if not states:
+            return 0
+        corpus = self._corpus()
+        with self.db.connections.reader() as conn:
+            ids = np.array(sorted(
+                paper_id for venue, year, _, _ in states
+                for (paper_id,) in conn.execute(
+                    'SELECT id FROM papers WHERE venue = ? AND year = ?', (venue, year))),
+                dtype=np.int64)
+        # Only papers that have been embedded can have neighbours
+        ids = ids[np.isin(ids, corpus)]
+        done = self._compute(ids, corpus, True, progress_callback) if len(ids) else 0
+        self._record(states)
+        return done
+
+
+def main():
+    from db.paper_db import PaperDB
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=['build', 'update'])
+    parser.add_argument('--db', default=DB_PATH)
+    args = parser.parse_args()
+
+    db = PaperDB(args.db)
+    index = VectorIndex.for_db(db)
+    if index.meta is None:
+        print('No vector index yet; run `python -m db.vectors build` first')
+        return 1
+    related = RelatedPapers(db, index)
+    progress = lambda done, total: print(f'  {done}/{total} papers', end='\r', flush=True)
+    if args.command == 'build' or not related.is_built():
+        print(f'\nRelated papers computed for {related.build(progress)} papers')
+    else:
+        index.update()
+        print(f'\nRelated papers recomputed for {related.update(progress)} papers')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from config import (VENUE_GROUPS, INGEST_YEARS, REFRESH_INTERVALS,
+                    REFRESH_CHECK_INTERVAL)
+
+
+class RefreshScheduler:
+    """
+    Periodically queues venue-years whose last crawl is older than their
+    refresh interval. Current and upcoming years are refreshed often, past
+    years rarely, and repeatedly failing venue-years back off exponentially.
+    """
+
+    def __init__(self, db, check_interval: float = REFRESH_CHECK_INTERVAL):
+        self.db = db
+        self.check_interval = check_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def refresh_interval(self, year: int, failure_count: int, now: datetime) -> timedelta:
+        """How long a venue-year's last crawl stays fresh"""
+        age = now.year - year
+        if age <= 0:
+            interval = REFRESH_INTERVALS['current']
+        elif age == 1:
+            interval = REFRESH_INTERVALS['recent']
+        else:
+            interval = REFRESH_INTERVALS['archive']
+        if failure_count:
+            interval = min(interval * 2 ** min(failure_count, 10),
+                           REFRESH_INTERVALS['archive'])
+        return interval
+
+    def due_jobs(self, now: Optional[datetime] = None) -> List[Tuple[int, str, int]]:
+        """(priority, venue, year) for every venue-year due for a refresh, most urgent first"""
+        now = now or datetime.now()
+        state = self.db.get_crawl_state()
+        jobs = []
+        for venues in VENUE_GROUPS.values():
+            for venue in venues:
+                # Up to next year, so upcoming events are picked up once announced
+                for year in range(INGEST_YEARS.start, now.year + 2):
+                    crawl = state.get((venue, year))
+                    if crawl is not None and crawl['last_fetched']:
+                        last_fetched = datetime.fromisoformat(crawl['last_fetched'])
+                        interval = self.refresh_interval(
+                            year, crawl['failure_count'], now)
+                        if last_fetched + interval > now:
+                            continue
+                    jobs.append((max(now.year - year, 0), venue, year))
+        return sorted(jobs)
+
+    def run_once(self) -> int:
+        """Queue all due venue-years; returns how many were newly queued"""
+        return sum(self.db.queue_fetch(venue, year, priority)
+                   for priority, venue, year in self.due_jobs())
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error scheduling refresh: {str(e)}")
+            self._stop_event.wait(self.check_interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="refresh-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,269 @@
+"""
+Read-only serving from immutable, memory-mapped database generations
+
+    python -m db.serving publish [--db papers.db] [--dir serving]
+    python -m db.serving status [--dir serving]
+
+The ingesting process owns papers.db and, after a burst of refreshes (or
+from the command line), publishes a copy of it to a new generation of the
+serving directory:
+
+    serving/CURRENT                    name of the generation to serve
+    serving/gen-000042/papers.db       VACUUM INTO copy, never written again
+    serving/gen-000042/papers.db.vectors/, papers.db.shards/   if built
+
+The copy is built off to the side under "<generation>.building", renamed
+into place, and then CURRENT is replaced atomically. Readers open a
+generation with ?mode=ro&immutable=1, so SQLite takes no locks, never looks
+for a WAL and maps the file into memory: every worker process serving it
+shares the same pages of the OS page cache, and nothing the ingester does
+reaches them until they switch.
+
+ServingDB stands in for PaperDB in the readers. It keeps one read-only
+PaperDB per generation and looks at CURRENT every SERVING_CHECK_INTERVAL
+seconds; a new generation is opened and warmed up before it is swapped in
+with a single assignment, so a call runs against one generation from start
+to end. The one it replaced is released SERVING_RETIRE_DELAY seconds later,
+and the publisher removes all but the newest SERVING_KEEP_GENERATIONS.
+"""
+import argparse
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import (DB_PATH, SERVING_DIR, SERVING_CHECK_INTERVAL, SERVING_RETIRE_DELAY,
+                    SERVING_KEEP_GENERATIONS)
+from db.connection import ConnectionManager
+from db.paper_db import PaperDB
+from db.query_cache import QueryCache
+from db.shards import ShardedIndex
+from db.suggest import Suggester
+from db.vectors import VectorIndex
+
+CURRENT = 'CURRENT'
+GENERATION_DB = 'papers.db'
+
+_GENERATION_RE = re.compile(r'^gen-(\d+)$')
+
+
+def current_generation(serving_dir) -> Optional[str]:
+    """Name of the generation CURRENT points at, or None before the first publish"""
+    try:
+        return (Path(serving_dir) / CURRENT).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def generations(serving_dir) -> List[str]:
+    """Published generations, oldest first"""
+    serving_dir = Path(serving_dir)
+    if not serving_dir.is_dir():
+        return []
+    numbered = [(int(match.group(1)), path.name) for path in serving_dir.iterdir()
+                for match in [_GENERATION_RE.match(path.name)] if match and path.is_dir()]
+    return [name for _, name in sorted(numbered)]
+
+
+def _vacuum_into(source: Path, target: Path):
+    """Consistent, compacted copy of a database as of one read transaction"""
+    conn = sqlite3.connect(f'{source.resolve().as_uri()}?mode=ro', uri=True)
+    try:
+        conn.execute('VACUUM INTO ?', (str(target),))
+    finally:
+        conn.close()
+
+
+def publish(db, serving_dir=SERVING_DIR) -> str:
+    """
+    Copy a database and its vector and shard indexes into a new generation
+    of serving_dir, point CURRENT at it and remove the generations past
+    SERVING_KEEP_GENERATIONS; returns the new generation's name
+    Indexes are copied before the database, so like the live ones they are at
+    most behind its papers, never ahead of them
+    """
+    if serving_dir is None:
+        raise ValueError('No serving directory given (set SERVING_DIR or pass --dir)')
+    serving_dir = Path(serving_dir)
+    serving_dir.mkdir(parents=True, exist_ok=True)
+    existing = generations(serving_dir)
+    number = int(_GENERATION_RE.match(existing[-1]).group(1)) + 1 if existing else 1
+    generation = f'gen-{number:06d}'
+    building = serving_dir / f'{generation}.building'
+    if building.exists():
+        shutil.rmtree(building)
+    building.mkdir()
+    target = building / GENERATION_DB
+    try:
+        vectors = VectorIndex.directory(db.db_path)
+        if VectorIndex.exists(db.db_path):
+            vectors_target = VectorIndex.directory(target)
+            vectors_target.mkdir()
+            # meta.json first: the vector files only grow, so they cover every row it lists
+            names = ['meta.json'] + sorted(path.name for path in vectors.iterdir()
+                                           if path.is_file() and path.name != 'meta.json'
+                                           and not path.name.endswith('.tmp'))
+            for name in names:
+                shutil.copy2(vectors / name, vectors_target / name)
+
+        if ShardedIndex.exists(db.db_path):
+            shards = ShardedIndex(db)
+            shards_target = ShardedIndex.directory(target)
+            shards_target.mkdir()
+            shutil.copy2(shards.path / 'meta.json', shards_target / 'meta.json')
+            for path in shards.shard_paths:
+                _vacuum_into(path, shards_target / path.name)
+
+        _vacuum_into(db.db_path, target)
+        building.rename(serving_dir / generation)
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+
+    tmp = serving_dir / f'{CURRENT}.tmp'
+    tmp.write_text(generation + '\n')
+    os.replace(tmp, serving_dir / CURRENT)
+
+    # Readers still on a removed generation keep the files they opened
+    for old in generations(serving_dir)[:-SERVING_KEEP_GENERATIONS]:
+        shutil.rmtree(serving_dir / old, ignore_errors=True)
+    return generation
+
+
+def _release(db: PaperDB):
+    """Close the connections of a generation and drop everything loaded for it"""
+    Suggester.discard(db.db_path)
+    ShardedIndex.discard(db.db_path)
+    VectorIndex.discard(db.db_path)
+    QueryCache.discard(db.db_path)
+    ConnectionManager.discard(db.db_path)
+
+
+class ServingDB:
+    """
+    Read-only stand-in for PaperDB, serving the current published generation
+    Attributes and methods not defined here are those of the generation's
+    PaperDB, looked up anew on every access, so a swap applies from the next
+    call on. One instance per process, like PaperDB
+    """
+
+    def __init__(self, serving_dir=SERVING_DIR):
+        if serving_dir is None:
+            raise ValueError('No serving directory given (set SERVING_DIR)')
+        self.serving_dir = Path(serving_dir)
+        self.generation = current_generation(self.serving_dir)
+        if self.generation is None:
+            raise FileNotFoundError(f'Nothing published to {self.serving_dir} yet '
+                                    f'(python -m db.serving publish)')
+        self.current = self._open(self.generation)
+        self._retiring = []  # (release after, PaperDB)
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, name='serving-watch', daemon=True)
+        self._watcher.start()
+
+    def __getattr__(self, name):
+        # Only reached for names not set on the instance or its class
+        if name.startswith('__') or name == 'current':
+            raise AttributeError(name)
+        return getattr(self.current, name)
+
+    def _open(self, generation: str) -> PaperDB:
+        return PaperDB(self.serving_dir / generation / GENERATION_DB, read_only=True)
+
+    def _watch(self):
+        while not self._stop.wait(SERVING_CHECK_INTERVAL):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error switching to a new serving generation: {str(e)}")
+
+    def refresh(self) -> bool:
+        """Swap in the generation CURRENT names if it is a new one; returns whether it was"""
+        with self._refresh_lock:
+            now = time.monotonic()
+            while self._retiring and self._retiring[0][0] <= now:
+                _release(self._retiring.pop(0)[1])
+
+            generation = current_generation(self.serving_dir)
+            if generation is None or generation == self.generation:
+                return False
+            db = self._open(generation)
+            # Warm up before the swap, so the first requests on it do not pay for loading
+            db.get_paper_count()
+            db.vector_index()
+            if Suggester.is_loaded(self.current):
+                Suggester.for_db(db)
+
+            old, self.current, self.generation = self.current, db, generation
+            self._retiring.append((now + SERVING_RETIRE_DELAY, old))
+            return True
+
+    def needs_initialization(self):
+        return False
+
+    def load_initial_papers(self, progress_bar):
+        return False
+
+    def start_background_fetch(self):
+        """Nothing to do: papers are fetched and published by the ingesting process"""
+
+    def stop_background_fetch(self, timeout: Optional[float] = None):
+        pass
+
+    def close(self):
+        """Stop watching for new generations and release the open ones"""
+        self._stop.set()
+        self._watcher.join()
+        with self._refresh_lock:
+            for _, db in self._retiring:
+                _release(db)
+            self._retiring = []
+            _release(self.current)
+
+    def get_serving_stats(self) -> Dict[str, Any]:
+        return {'serving_dir': str(self.serving_dir), 'generation': self.generation,
+                'retiring': len(self._retiring)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=['publish', 'status'])
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--dir', default=SERVING_DIR, help='serving directory (default: SERVING_DIR)')
+    args = parser.parse_args()
+    if args.dir is None:
+        print('Error: no serving directory given (set SERVING_DIR or pass --dir)')
+        return 1
+
+    if args.command == 'publish':
+        start = time.perf_counter()
+        generation = publish(PaperDB(args.db), args.dir)
+        size = sum(path.stat().st_size for path in (Path(args.dir) / generation).rglob('*')
+                   if path.is_file())
+        print(f'Published {args.db} as {generation} of {args.dir} '
+              f'({size / 1024 / 1024:.1f} MB, {time.perf_counter() - start:.1f}s)')
+        return 0
+
+    generation = current_generation(args.dir)
+    if generation is None:
+        print(f'Nothing published to {args.dir} yet')
+        return 1
+    path = Path(args.dir) / generation / GENERATION_DB
+    db = PaperDB(path, read_only=True)
+    published = datetime.fromtimestamp(path.stat().st_mtime).isoformat(timespec='seconds')
+    print(f'{generation}: {db.get_paper_count()} papers, published {published}, '
+          f'vectors {"yes" if VectorIndex.exists(path) else "no"}, '
+          f'shards {"yes" if ShardedIndex.exists(path) else "no"}; '
+          f'kept: {", ".join(generations(args.dir))}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
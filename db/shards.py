@@ -0,0 +1,364 @@
+"""
+Full-text search spread over several shard databases
+
+    python -m db.shards build [--db papers.db] [--shards 4] [--by id|venue_group]
+    python -m db.shards update [--db papers.db]    index papers stored since the last routed write
+
+The index is split over SQLite databases in "<db>.shards/", each with an
+FTS5 table holding the text of its papers (venue and year alongside, the
+paper id as rowid). A query goes to every shard at once, each searched by a
+worker process of a pool, and the per-shard top k by bm25 rank are merged
+into the global top k. Shards keep their own term statistics, so ranks only
+compare well between shards of similar content: papers spread by id make
+every shard a sample of the whole, while venue groups keep ACL, ML and
+arXiv papers apart.
+
+The papers table stays the source of truth: writes land there first and
+are then routed to their shard. A batch that fails to get there marks the
+index as behind in its meta.json, and searches use the main index until the
+next update has caught the shards up. Rebuild with the app stopped, as running
+processes keep reading the shard files they opened.
+"""
+import argparse
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import (DB_PATH, VENUE_GROUPS, ARXIV_VENUE, WRITE_BATCH_SIZE, SEARCH_COUNT_CAP,
+                    FTS_TOKENIZE, FTS_PREFIX, SEARCH_BM25_WEIGHTS, SEARCH_SHARDS,
+                    SEARCH_SHARD_BY, SEARCH_SHARD_WORKERS, SEARCH_SHARD_TIMEOUT)
+from db.connection import ConnectionManager
+
+SHARD_SEARCH_SQL = f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS papers_search
+    USING FTS5(title, abstract, authors, venue UNINDEXED, year UNINDEXED,
+               tokenize='{FTS_TOKENIZE}', prefix='{FTS_PREFIX}')
+'''
+
+# Same weights as the main index; venue and year are not searched
+SHARD_RANK = 'bm25(%s, 0.0, 0.0)' % ', '.join(
+    str(float(SEARCH_BM25_WEIGHTS[column])) for column in ('title', 'abstract', 'authors'))
+
+SHARD_BY = ('id', 'venue_group')
+
+# Paper = (id, title, abstract, authors, venue, year)
+Paper = Tuple[int, str, str, str, str, int]
+
+_GROUP_OF_VENUE = dict({venue: group for group, venues in enumerate(VENUE_GROUPS.values())
+                        for venue in venues}, **{ARXIV_VENUE: len(VENUE_GROUPS)})
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _search_shard(path: str, match: str, filters: Sequence[str], params: Sequence[Any],
+                  cursor: Optional[Tuple[float, int]], k: int, count: bool,
+                  immutable: bool = False) -> Tuple[List[Tuple[float, int]], Optional[int]]:
+    """
+    Top k (rank, id) of one shard after cursor, and its capped match count if
+    asked for; runs in a worker process, which keeps its connections open
+    """
+    where_sql = ' WHERE papers_search MATCH ?' + ''.join(' AND ' + f for f in filters)
+    params = [match] + list(params)
+    page_sql = 'SELECT rank, rowid FROM papers_search' + where_sql
+    page_params = list(params)
+    if cursor is not None:
+        page_sql += ' AND (rank, rowid) > (?, ?)'
+        page_params.extend(cursor)
+    page_sql += ' ORDER BY rank, rowid LIMIT ?'
+    page_params.append(k)
+    with ConnectionManager.for_path(path, immutable).reader() as conn:
+        rows = [(rank, paper_id) for rank, paper_id in conn.execute(page_sql, page_params)]
+        total = None
+        if count:
+            total = conn.execute('SELECT COUNT(*) FROM (SELECT 1 FROM papers_search' + where_sql +
+                                 ' LIMIT ?)', params + [SEARCH_COUNT_CAP]).fetchone()[0]
+    return rows, total
+
+
+class ShardedIndex:
+    """
+    The shard databases of one database and the process pool searching them
+    Built once by the batch job; from then on every batch of stored papers is
+    routed to the shards it belongs in. A batch that fails to reach its
+    shards leaves the index behind the papers table until update() (run
+    before the next routed batch, or from the command line) catches it up
+    """
+
+    @staticmethod
+    def directory(db_path) -> Path:
+        db_path = Path(db_path)
+        return db_path.with_name(db_path.name + '.shards')
+
+    @classmethod
+    def exists(cls, db_path) -> bool:
+        return (cls.directory(db_path) / 'meta.json').exists()
+
+    @classmethod
+    def for_db(cls, db) -> 'ShardedIndex':
+        """Get the shared index of a database, loading it on first use"""
+        key = str(db.db_path.resolve())
+        with _indexes_lock:
+            if key not in _indexes:
+                _indexes[key] = cls(db)
+            return _indexes[key]
+
+    @classmethod
+    def discard(cls, db_path):
+        """Forget the shared index of a database and stop its worker processes"""
+        with _indexes_lock:
+            index = _indexes.pop(str(Path(db_path).resolve()), None)
+        if index is not None:
+            index.close()
+
+    def __init__(self, db):
+        self.db = db
+        self.path = self.directory(db.db_path)
+        self._lock = threading.RLock()
+        self._executor = None
+        self.meta = None
+        if (self.path / 'meta.json').exists():
+            self.meta = json.loads((self.path / 'meta.json').read_text())
+
+    @property
+    def behind(self) -> bool:
+        """Whether a routed batch failed, leaving papers the shards do not have yet"""
+        return bool(self.meta and self.meta.get('behind'))
+
+    @property
+    def shard_paths(self) -> List[Path]:
+        return [self.path / f'shard-{shard}.db' for shard in range(self.meta['shards'])]
+
+    def shard_of(self, paper_id: int, venue: str) -> int:
+        shards = self.meta['shards']
+        if self.meta['by'] == 'venue_group':
+            group = _GROUP_OF_VENUE.get(venue)
+            if group is None:
+                group = zlib.crc32(venue.encode('utf-8'))
+            return group % shards
+        # Ids are handed out in storage order, so consecutive venue-years spread evenly
+        return paper_id % shards
+
+    def _save_meta(self):
+        tmp = self.path / 'meta.json.tmp'
+        tmp.write_text(json.dumps(self.meta))
+        tmp.replace(self.path / 'meta.json')
+
+    @staticmethod
+    def _create_shard(conn: sqlite3.Connection):
+        conn.execute(SHARD_SEARCH_SQL)
+        conn.execute("INSERT INTO papers_search(papers_search, rank) VALUES('rank', ?)", (SHARD_RANK,))
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, papers: Sequence[Paper]):
+        """Replace the indexed text of papers in one shard"""
+        conn.executemany('DELETE FROM papers_search WHERE rowid = ?',
+                         ((paper[0],) for paper in papers))
+        conn.executemany('INSERT INTO papers_search (rowid, title, abstract, authors, venue, year)'
+                         ' VALUES (?, ?, ?, ?, ?, ?)', papers)
+
+    def _iter_papers(self, since: Optional[str] = None) -> Iterable[List[Tuple]]:
+        """Batches of papers with their last_updated, optionally only rows updated after since"""
+        sql = 'SELECT id, title, abstract, authors, venue, year, last_updated FROM papers'
+        params = ()
+        if since is not None:
+            sql += ' WHERE last_updated > ?'
+            params = (since,)
+        with self.db.connections.reader() as conn:
+            cursor = conn.execute(sql + ' ORDER BY id', params)
+            while True:
+                batch = cursor.fetchmany(WRITE_BATCH_SIZE * 10)
+                if not batch:
+                    break
+                yield [tuple(row) for row in batch]
+
+    def build(self, shards: int = SEARCH_SHARDS, by: str = SEARCH_SHARD_BY,
+              progress_callback=None) -> int:
+        """Index every paper into a fresh set of shards; returns the paper count"""
+        if by not in SHARD_BY:
+            raise ValueError(f"Unknown shard key {by!r}, expected one of {', '.join(SHARD_BY)}")
+        with self._lock:
+            self.close()
+            building = self.path.with_name(self.path.name + '.building')
+            shutil.rmtree(building, ignore_errors=True)
+            building.mkdir(parents=True)
+            with self.db.connections.reader() as conn:
+                total, watermark = conn.execute(
+                    'SELECT COUNT(*), MAX(last_updated) FROM papers').fetchone()
+            self.meta = {'shards': shards, 'by': by, 'watermark': watermark, 'behind': False}
+
+            # One transaction per shard for the whole build
+            with ExitStack() as stack:
+                conns = []
+                for shard in range(shards):
+                    conn = sqlite3.connect(building / f'shard-{shard}.db')
+                    stack.callback(conn.close)
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    self._create_shard(conn)
+                    conns.append(conn)
+                done = 0
+                for batch in self._iter_papers():
+                    routed = [[] for _ in range(shards)]
+                    for paper in batch:
+                        routed[self.shard_of(paper[0], paper[4])].append(paper[:6])
+                    for conn, papers in zip(conns, routed):
+                        conn.executemany('INSERT INTO papers_search (rowid, title, abstract, authors,'
+                                         ' venue, year) VALUES (?, ?, ?, ?, ?, ?)', papers)
+                    done += len(batch)
+                    if progress_callback:
+                        progress_callback(done, total)
+                for conn in conns:
+                    conn.commit()
+                    conn.execute("INSERT INTO papers_search(papers_search) VALUES('optimize')")
+                    conn.commit()
+
+            (building / 'meta.json').write_text(json.dumps(self.meta))
+            if self.path.exists():
+                for path in self.path.glob('shard-*.db'):
+                    ConnectionManager.for_path(path).close()
+                shutil.rmtree(self.path)
+            building.rename(self.path)
+            return total
+
+    def index(self, papers: Sequence[Paper], watermark: str):
+        """Route freshly stored papers (stamped watermark) to their shards"""
+        with self._lock:
+            if self.meta is None:
+                return
+            if self.behind:
+                self.update()
+            routed = [[] for _ in range(self.meta['shards'])]
+            for paper in papers:
+                routed[self.shard_of(paper[0], paper[4])].append(tuple(paper[:6]))
+            try:
+                for path, shard_papers in zip(self.shard_paths, routed):
+                    if shard_papers:
+                        with ConnectionManager.for_path(path).writer() as conn:
+                            self._write(conn, shard_papers)
+            except Exception:
+                # Kept in meta.json, so that after a restart the watermark still only
+                # moves past these papers once update() has routed them
+                self.meta['behind'] = True
+                self._save_meta()
+                raise
+            if watermark > (self.meta['watermark'] or ''):
+                self.meta['watermark'] = watermark
+                self._save_meta()
+
+    def update(self) -> int:
+        """Route papers stored or changed since the watermark; returns how many"""
+        with self._lock:
+            if self.meta is None:
+                return 0
+            changed = 0
+            watermark = self.meta['watermark']
+            for batch in self._iter_papers(since=watermark):
+                routed = [[] for _ in range(self.meta['shards'])]
+                for paper in batch:
+                    routed[self.shard_of(paper[0], paper[4])].append(paper[:6])
+                for path, shard_papers in zip(self.shard_paths, routed):
+                    if shard_papers:
+                        with ConnectionManager.for_path(path).writer() as conn:
+                            self._write(conn, shard_papers)
+                watermark = max([watermark or ''] + [row[6] for row in batch if row[6]]) or None
+                changed += len(batch)
+            if changed or self.behind:
+                self.meta['watermark'] = watermark
+                self.meta['behind'] = False
+                self._save_meta()
+            return changed
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            workers = SEARCH_SHARD_WORKERS or min(self.meta['shards'], os.cpu_count() or 1)
+            # Spawned, not forked: the parent runs server and writer threads
+            self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def search(self, match: str, filters: Sequence[str] = (), params: Sequence[Any] = (),
+               cursor: Optional[Tuple[float, int]] = None, k: int = 10,
+               count: bool = False) -> Tuple[List[Tuple[float, int]], Optional[int]]:
+        """
+        Global top k (rank, id) after cursor for a compiled MATCH expression,
+        and the capped number of matches if count is set
+        filters are WHERE terms over the venue and year columns, with their params
+        """
+        with self._lock:
+            paths = [str(path) for path in self.shard_paths]
+            pool = self._pool()
+        try:
+            futures = [pool.submit(_search_shard, path, match, list(filters), list(params),
+                                   cursor, k, count, self.db.read_only) for path in paths]
+            _, pending = wait(futures, timeout=SEARCH_SHARD_TIMEOUT)
+            if pending:
+                raise TimeoutError(f'{len(pending)} of {len(paths)} search shards did not answer '
+                                   f'within {SEARCH_SHARD_TIMEOUT}s')
+            results = [future.result() for future in futures]
+        except (BrokenProcessPool, TimeoutError):
+            # A worker that died breaks the pool for good, and a stuck one keeps its
+            # slot: the next search starts over with a fresh pool
+            self.close(pool)
+            raise
+        # Each shard's list is sorted by (rank, id), so a k-way merge gives the global order
+        merged = list(itertools.islice(heapq.merge(*(rows for rows, _ in results)), k))
+        total = None
+        if count:
+            total = min(SEARCH_COUNT_CAP, sum(shard_total for _, shard_total in results))
+        return merged, total
+
+    def close(self, pool: Optional[ProcessPoolExecutor] = None):
+        """
+        Stop the worker processes (given a pool, only if they are still its
+        workers); the next search starts new ones
+        """
+        with self._lock:
+            if self._executor is not None and pool in (None, self._executor):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        if self.meta is None:
+            return {'shards': 0}
+        papers = []
+        for path in self.shard_paths:
+            with ConnectionManager.for_path(path, self.db.read_only).reader() as conn:
+                papers.append(conn.execute('SELECT COUNT(*) FROM papers_search').fetchone()[0])
+        return {'shards': self.meta['shards'], 'by': self.meta['by'], 'papers': papers}
+
+
+def main():
+    from db.paper_db import PaperDB
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=['build', 'update'])
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--shards', type=int, default=SEARCH_SHARDS)
+    parser.add_argument('--by', choices=SHARD_BY, default=SEARCH_SHARD_BY)
+    args = parser.parse_args()
+
+    index = ShardedIndex.for_db(PaperDB(args.db))
+    if args.command == 'build' or index.meta is None:
+        total = index.build(args.shards, args.by, lambda done, total: print(
+            f'  indexed {done}/{total}', end='\r', flush=True))
+        stats = index.get_stats()
+        print(f'\nIndexed {total} papers into {stats["shards"]} shards by {stats["by"]} '
+              f'at {index.path}: {", ".join(map(str, stats["papers"]))}')
+    else:
+        print(f'Routed {index.update()} new or changed papers to their shards')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+Columnar snapshots of the paper corpus
+
+    python -m db.snapshot export DIR [--db papers.db]
+    python -m db.snapshot import DIR [--db papers.db] [--force]
+    python -m db.snapshot verify DIR
+
+A snapshot is a directory holding one Parquet file per table (papers and
+everything derived from them: authors, crawl state, related papers,
+duplicate clusters, the full-text index as its FTS5 shadow tables), the
+vector index files if one has been built, and manifest.json listing every
+file with its SHA-256. Tables are read in one transaction, which also
+covers the copy of the vector index, so a snapshot taken while papers are
+being stored is still consistent: its vectors are at most behind its papers.
+
+Import checks the snapshot against its manifest and then loads it into a
+new database next to the target in a single transaction: indexes and
+triggers are dropped before the bulk insert and created again after it, and
+the full-text index is copied as it is (rebuilt instead if it was built with
+other tokenizer settings). The target is only replaced once the load has
+committed. Index shards are not part of a snapshot; `make shards` builds
+them again.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import (DB_PATH, FTS_TOKENIZE, FTS_PREFIX, SQLITE_PRAGMAS,
+                    SNAPSHOT_COMPRESSION, SNAPSHOT_BATCH_ROWS)
+from db.connection import ConnectionManager
+from db.migrations import SCHEMA_VERSION
+from db.shards import ShardedIndex
+from db.vectors import VectorIndex
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+# Shadow tables holding the full-text index itself; its config rows are
+# written by PaperDB when the table is created
+FTS_TABLES = ('papers_search_data', 'papers_search_idx', 'papers_search_docsize')
+
+# Shadow table columns FTS5 declares without a type
+_UNTYPED_COLUMNS = {
+    ('papers_search_idx', 'segid'): pa.int64(),
+    ('papers_search_idx', 'term'): pa.binary(),
+    ('papers_search_idx', 'pgno'): pa.int64(),
+}
+
+
+def _arrow_type(table: str, column: str, declared: str) -> pa.DataType:
+    """Parquet column type for a SQLite column, after its declared type's affinity"""
+    if (table, column) in _UNTYPED_COLUMNS:
+        return _UNTYPED_COLUMNS[table, column]
+    declared = declared.upper()
+    if 'INT' in declared or declared == 'BOOLEAN':
+        return pa.int64()
+    # Timestamps are stored as ISO strings
+    if any(name in declared for name in ('CHAR', 'CLOB', 'TEXT')) or declared == 'TIMESTAMP':
+        return pa.string()
+    if any(name in declared for name in ('REAL', 'FLOA', 'DOUB')):
+        return pa.float64()
+    return pa.binary()
+
+
+def _snapshot_tables(conn: sqlite3.Connection) -> List[str]:
+    """Tables to export: all but SQLite's own and the FTS table's config and virtual table"""
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+    return [name for name in names if not name.startswith('sqlite_')
+            and (not name.startswith('papers_search') or name in FTS_TABLES)]
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _export_table(conn: sqlite3.Connection, table: str, path: Path) -> int:
+    """Write one table to a Parquet file, SNAPSHOT_BATCH_ROWS rows per row group"""
+    columns = [(row[1], row[2]) for row in conn.execute(f'PRAGMA table_info("{table}")')]
+    schema = pa.schema([(name, _arrow_type(table, name, declared)) for name, declared in columns])
+    column_sql = ', '.join(f'"{name}"' for name, _ in columns)
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression=SNAPSHOT_COMPRESSION) as writer:
+        cursor = conn.execute(f'SELECT {column_sql} FROM "{table}"')
+        while True:
+            batch = cursor.fetchmany(SNAPSHOT_BATCH_ROWS)
+            if not batch:
+                break
+            writer.write_batch(pa.record_batch(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)],
+                schema=schema))
+            rows += len(batch)
+    return rows
+
+
+def _export_vectors(db, directory: Path):
+    """Copy the vector index files, compressed; meta.json first, as the files only grow"""
+    index = VectorIndex.for_db(db)
+    (directory / 'vectors').mkdir()
+    with index._lock:
+        names = ['meta.json'] + sorted(path.name for path in index.path.iterdir()
+                                       if path.is_file() and path.name != 'meta.json'
+                                       and not path.name.endswith('.tmp'))
+        for name in names:
+            with open(index.path / name, 'rb') as source, pa.CompressedOutputStream(
+                    str(directory / 'vectors' / name), SNAPSHOT_COMPRESSION) as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+
+
+def export_snapshot(db, directory, progress_callback=None) -> Dict[str, Any]:
+    """
+    Write a snapshot of the database into directory, which must not exist
+    or be empty; returns the manifest
+    progress_callback(table, rows) is invoked after every table
+    """
+    directory = Path(directory)
+    if directory.exists() and any(directory.iterdir()):
+        raise FileExistsError(f'{directory} is not empty')
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        'format': FORMAT_VERSION,
+        'schema_version': SCHEMA_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'fts': {'tokenize': FTS_TOKENIZE, 'prefix': FTS_PREFIX},
+        'tables': {},
+        'files': {},
+    }
+
+    with db.connections.reader() as conn:
+        # One read transaction for all tables; the reader is rolled back when returned
+        conn.execute('BEGIN')
+        # Copied before the first read fixes what the transaction sees, so
+        # every paper the vectors cover is in the exported tables
+        if VectorIndex.exists(db.db_path):
+            _export_vectors(db, directory)
+        for table in _snapshot_tables(conn):
+            path = directory / f'{table}.parquet'
+            rows = _export_table(conn, table, path)
+            manifest['tables'][table] = {'file': path.name, 'rows': rows}
+            if progress_callback:
+                progress_callback(table, rows)
+
+    for path in sorted(directory.rglob('*')):
+        if path.is_file():
+            manifest['files'][path.relative_to(directory).as_posix()] = {
+                'sha256': _sha256(path), 'bytes': path.stat().st_size}
+    # Written last: a snapshot without its manifest is incomplete
+    tmp = directory / (MANIFEST + '.tmp')
+    tmp.write_text(json.dumps(manifest, indent=1))
+    tmp.replace(directory / MANIFEST)
+    return manifest
+
+
+def verify_snapshot(directory) -> Dict[str, Any]:
+    """The manifest of a snapshot, after checking every file it lists; raises ValueError if one fails"""
+    directory = Path(directory)
+    if not (directory / MANIFEST).exists():
+        raise ValueError(f'{directory} has no {MANIFEST}; the snapshot is incomplete')
+    manifest = json.loads((directory / MANIFEST).read_text())
+    if manifest.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')}")
+    for name, entry in manifest['files'].items():
+        path = directory / name
+        if not path.is_file():
+            raise ValueError(f'{name} is missing from the snapshot')
+        if path.stat().st_size != entry['bytes'] or _sha256(path) != entry['sha256']:
+            raise ValueError(f'{name} does not match its checksum')
+    return manifest
+
+
+def _load_tables(conn: sqlite3.Connection, directory: Path, manifest: Dict[str, Any],
+                 copy_fts: bool, progress_callback=None) -> int:
+    """Bulk insert every table of the snapshot; indexes and triggers are already dropped"""
+    existing = set(_snapshot_tables(conn))
+    loaded = 0
+    for table, entry in manifest['tables'].items():
+        if table in FTS_TABLES and not copy_fts:
+            continue
+        if table not in existing:
+            raise ValueError(f'Snapshot table {table} does not exist in this schema')
+        parquet = pq.ParquetFile(directory / entry['file'])
+        columns = parquet.schema_arrow.names
+        known = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+        if not set(columns) <= known:
+            raise ValueError(f'Snapshot columns of {table} do not match this schema')
+        # Fresh databases come with a few rows of their own, e.g. the FTS structure record
+        conn.execute(f'DELETE FROM "{table}"')
+        insert_sql = 'INSERT INTO "%s" (%s) VALUES (%s)' % (
+            table, ', '.join(f'"{column}"' for column in columns), ', '.join('?' * len(columns)))
+        rows = 0
+        for batch in parquet.iter_batches(batch_size=SNAPSHOT_BATCH_ROWS):
+            conn.executemany(insert_sql, zip(*(column.to_pylist() for column in batch.columns)))
+            rows += batch.num_rows
+        if rows != entry['rows']:
+            raise ValueError(f'{table} has {rows} rows, the manifest lists {entry["rows"]}')
+        loaded += rows
+        if progress_callback:
+            progress_callback(table, rows)
+    return loaded
+
+
+def import_snapshot(directory, db_path=DB_PATH, force: bool = False,
+                    progress_callback=None) -> Dict[str, Any]:
+    """
+    Load a verified snapshot into a new database at db_path, replacing an
+    existing one only if force is set; returns {tables, rows, papers, fts}
+    progress_callback(table, rows) is invoked after every table
+    """
+    from db.paper_db import PaperDB
+
+    directory = Path(directory)
+    db_path = Path(db_path)
+    if db_path.exists() and not force:
+        raise FileExistsError(f'{db_path} already exists (replace it with --force)')
+    manifest = verify_snapshot(directory)
+    if manifest['schema_version'] != SCHEMA_VERSION:
+        raise ValueError(f"Snapshot has schema version {manifest['schema_version']}, "
+                         f"this version of Cerebro needs {SCHEMA_VERSION}")
+    copy_fts = (manifest['fts'] == {'tokenize': FTS_TOKENIZE, 'prefix': FTS_PREFIX}
+                and all(table in manifest['tables'] for table in FTS_TABLES))
+
+    building = db_path.with_name(db_path.name + '.importing')
+    for stale in building.parent.glob(building.name + '*'):
+        shutil.rmtree(stale) if stale.is_dir() else stale.unlink()
+    # Tables, indexes, triggers and FTS config as this version creates them
+    PaperDB(building)
+    ConnectionManager.for_path(building).close()
+
+    conn = sqlite3.connect(building, isolation_level=None)
+    try:
+        # Nothing reads the file until it is complete, so skip the WAL and syncing
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute(f"PRAGMA cache_size={SQLITE_PRAGMAS['cache_size']}")
+        conn.execute('BEGIN')
+        # Indexes are built once from the loaded rows, and triggers (FTS sync,
+        # venue-year counts) must not fire for rows whose derived data is loaded too
+        deferred = conn.execute("SELECT type, name, sql FROM sqlite_master "
+                                "WHERE type IN ('index', 'trigger') AND sql IS NOT NULL").fetchall()
+        for kind, name, _ in deferred:
+            conn.execute(f'DROP {kind.upper()} "{name}"')
+        rows = _load_tables(conn, directory, manifest, copy_fts, progress_callback)
+        for _, _, sql in deferred:
+            conn.execute(sql)
+        if not copy_fts:
+            conn.execute("INSERT INTO papers_search(papers_search) VALUES('rebuild')")
+        conn.execute('COMMIT')
+        conn.execute('PRAGMA journal_mode=WAL')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        conn.close()
+        building.unlink(missing_ok=True)
+        raise
+    conn.close()
+
+    vectors = VectorIndex.directory(db_path)
+    vectors_building = VectorIndex.directory(building)
+    snapshot_vectors = sorted(name for name in manifest['files'] if name.startswith('vectors/'))
+    if snapshot_vectors:
+        vectors_building.mkdir()
+        for name in snapshot_vectors:
+            with pa.CompressedInputStream(str(directory / name), SNAPSHOT_COMPRESSION) as source, \
+                    open(vectors_building / Path(name).name, 'wb') as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+
+    # Everything is in place next to the target; swap it in
+    ConnectionManager.for_path(db_path).close()
+    for suffix in ('-wal', '-shm'):
+        Path(str(db_path) + suffix).unlink(missing_ok=True)
+    os.replace(building, db_path)
+    for stale in (vectors, ShardedIndex.directory(db_path)):
+        if stale.exists():
+            shutil.rmtree(stale)
+    if snapshot_vectors:
+        vectors_building.rename(vectors)
+
+    return {'tables': len(manifest['tables']), 'rows': rows,
+            'papers': manifest['tables']['papers']['rows'], 'fts': 'copied' if copy_fts else 'rebuilt'}
+
+
+def main():
+    from db.paper_db import PaperDB
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=['export', 'import', 'verify'])
+    parser.add_argument('directory')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--force', action='store_true', help='replace an existing database on import')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    progress = lambda table, rows: print(f'  {table}: {rows} rows', flush=True)
+    try:
+        if args.command == 'export':
+            manifest = export_snapshot(PaperDB(args.db), args.directory, progress)
+            size = sum(entry['bytes'] for entry in manifest['files'].values())
+            print(f"Exported {manifest['tables']['papers']['rows']} papers to {args.directory} "
+                  f"({size / 1024 / 1024:.1f} MB, {time.perf_counter() - start:.1f}s)")
+        elif args.command == 'import':
+            stats = import_snapshot(args.directory, args.db, args.force, progress)
+            print(f"Imported {stats['papers']} papers ({stats['rows']} rows in {stats['tables']} tables, "
+                  f"full-text index {stats['fts']}) into {args.db} in {time.perf_counter() - start:.1f}s")
+        else:
+            manifest = verify_snapshot(args.directory)
+            print(f"{args.directory}: {len(manifest['files'])} files match their checksums")
+    except (ValueError, FileExistsError) as e:
+        print(f"Error: {str(e)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+from config import (SUGGEST_TOP_K, SUGGEST_PRECOMPUTED_PREFIX, SUGGEST_MIN_COUNT,
+                    SUGGEST_REFRESH_INTERVAL)
+
+_WORD_RE = re.compile(r"[^\W\d_][\w'-]*", re.UNICODE)
+
+# Not worth completing on their own, nor at either end of a title phrase
+STOPWORDS = frozenset('''
+    a an and are as at be by for from in into is it its of on or over that the
+    their this to towards under using via we what when with without
+'''.split())
+
+_suggesters = {}
+_suggesters_lock = threading.Lock()
+
+
+class Suggester:
+    """
+    In-memory completion index over title words and two-word phrases, author
+    names and venues, loaded once per process and database
+    Keys are kept in one sorted array, so the completions of a prefix are a
+    contiguous slice of it; the best completions of every prefix up to
+    SUGGEST_PRECOMPUTED_PREFIX characters (the slices too wide to scan per
+    keystroke) are computed when the index is built. The index is rebuilt in
+    the background once papers have been stored since it was built
+    """
+
+    @classmethod
+    def for_db(cls, db) -> 'Suggester':
+        """Get the shared suggester for a database, creating it on first use"""
+        key = str(db.db_path.resolve())
+        with _suggesters_lock:
+            if key not in _suggesters:
+                _suggesters[key] = cls(db)
+            return _suggesters[key]
+
+    @classmethod
+    def is_loaded(cls, db) -> bool:
+        """Whether this process has a suggester for the database already"""
+        with _suggesters_lock:
+            return str(db.db_path.resolve()) in _suggesters
+
+    @classmethod
+    def discard(cls, db_path):
+        """Forget the shared suggester of a database file"""
+        with _suggesters_lock:
+            _suggesters.pop(str(Path(db_path).resolve()), None)
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._index = None
+        self._generation = None
+        self._built_at = 0.0
+        self.rebuild()
+
+    def _collect(self) -> Dict[str, list]:
+        """key -> [display text, count, kind, query] for everything worth suggesting"""
+        entries = {}
+
+        def add(key, display, count, kind, query):
+            entry = entries.get(key)
+            if entry is None or count > entry[1]:
+                entries[key] = [display, count, kind, query]
+
+        words = defaultdict(int)
+        phrases = defaultdict(int)
+        with self.db.connections.reader() as conn:
+            for (title,) in conn.execute('SELECT title FROM papers'):
+                tokens = [word.lower() for word in _WORD_RE.findall(title)]
+                # Count each word and phrase once per title
+                words_in_title = set(word for word in tokens
+                                     if len(word) > 2 and word not in STOPWORDS)
+                phrases_in_title = set(
+                    f'{first} {second}' for first, second in zip(tokens, tokens[1:])
+                    if first not in STOPWORDS and second not in STOPWORDS)
+                for word in words_in_title:
+                    words[word] += 1
+                for phrase in phrases_in_title:
+                    phrases[phrase] += 1
+
+            authors = conn.execute('''
+                SELECT a.name, COUNT(*) AS papers
+                FROM paper_authors pa JOIN authors a ON a.id = pa.author_id
+                GROUP BY pa.author_id
+            ''').fetchall()
+            venues = conn.execute(
+                'SELECT venue, COUNT(*) AS papers FROM papers GROUP BY venue').fetchall()
+
+        for word, count in words.items():
+            if count >= SUGGEST_MIN_COUNT:
+                add(word, word, count, 'term', word)
+        for phrase, count in phrases.items():
+            if count >= SUGGEST_MIN_COUNT:
+                add(phrase, phrase, count, 'term', f'"{phrase}"')
+        for name, count in authors:
+            query = f'author:"{name}"'
+            parts = name.lower().split()
+            # Reachable by the full name and by the family name
+            add(' '.join(parts), name, count, 'author', query)
+            if len(parts) > 1:
+                add(f'{parts[-1]} {" ".join(parts[:-1])}', name, count, 'author', query)
+        for venue, count in venues:
+            add(venue.lower(), venue, count, 'venue', f'venue:{venue}')
+        return entries
+
+    def rebuild(self):
+        """Build a fresh index from the database and swap it in"""
+        generation = self.db.query_cache.generation
+        entries = self._collect()
+        keys = sorted(entries)
+        values = [entries[key] for key in keys]
+
+        top = {}
+        for position, key in enumerate(keys):
+            count = values[position][1]
+            for length in range(1, min(len(key), SUGGEST_PRECOMPUTED_PREFIX) + 1):
+                best = top.setdefault(key[:length], [])
+                # Min-heap of (count, -position) keeps the top-k of each prefix
+                if len(best) < SUGGEST_TOP_K:
+                    heapq.heappush(best, (count, -position))
+                elif count > best[0][0]:
+                    heapq.heapreplace(best, (count, -position))
+        top = {prefix: [-position for _, position in sorted(best, reverse=True)]
+               for prefix, best in top.items()}
+
+        with self._lock:
+            self._index = (keys, values, top)
+            self._generation = generation
+            self._built_at = time.monotonic()
+            self._rebuilding = False
+
+    def _refresh_if_stale(self):
+        with self._lock:
+            stale = (self._generation != self.db.query_cache.generation
+                     and time.monotonic() - self._built_at >= SUGGEST_REFRESH_INTERVAL
+                     and not self._rebuilding)
+            if stale:
+                self._rebuilding = True
+        if stale:
+            threading.Thread(target=self._rebuild_quietly, name='suggest-rebuild',
+                             daemon=True).start()
+
+    def _rebuild_quietly(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            print(f"Error rebuilding suggestions: {str(e)}")
+            with self._lock:
+                self._rebuilding = False
+                self._built_at = time.monotonic()
+
+    def _complete(self, prefix: str, k: int) -> List[int]:
+        keys, values, top = self._index
+        # Only the top SUGGEST_TOP_K are precomputed; more are found by scanning
+        if len(prefix) <= SUGGEST_PRECOMPUTED_PREFIX and k <= SUGGEST_TOP_K:
+            return top.get(prefix, [])[:k]
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + '\U0010ffff', lo)
+        return heapq.nlargest(k, range(lo, hi), key=lambda position: values[position][1])
+
+    def suggest(self, text: str, k: int = SUGGEST_TOP_K) -> List[Dict[str, Any]]:
+        """
+        Top-k completions of what has been typed so far
+        The whole input is completed first (phrases and names); the last word
+        alone fills any remaining slots. Each suggestion has the text to show,
+        its kind (term/author/venue), how many papers it occurs in, and the
+        search query it stands for
+        """
+        self._refresh_if_stale()
+        words = ' '.join(text.lower().split())
+        if not words:
+            return []
+        _, values, _ = self._index
+
+        suggestions = []
+        seen = set()
+        candidates = [('', position) for position in self._complete(words, k)]
+        head, _, last = words.rpartition(' ')
+        if head and last:
+            candidates += [(text.rsplit(None, 1)[0] + ' ', position)
+                           for position in self._complete(last, k)]
+        for context, position in candidates:
+            display, count, kind, query = values[position]
+            # Completions of the last word keep the words typed before it
+            query = context + (display if kind == 'term' and context else query)
+            if query in seen:
+                continue
+            seen.add(query)
+            suggestions.append({'text': context + display, 'kind': kind,
+                                'count': count, 'query': query})
+            if len(suggestions) == k:
+                break
+        return suggestions
@@ -0,0 +1,351 @@
+"""
+Semantic search over titles and abstracts
+
+    python -m db.vectors build [--db papers.db]    embed every paper, fit the IVF index
+    python -m db.vectors update [--db papers.db]   embed papers stored since the last run
+
+Papers are embedded on the CPU without a model: TF-IDF weights of hashed
+words, projected to VECTOR_DIM dimensions by a fixed random sign matrix,
+which approximately preserves their cosine similarities. The vectors live in
+a memory-mapped float32 matrix whose row i belongs to paper id i, next to
+the database in "<db>.vectors/". An IVF index (k-means centroids plus the
+list each paper falls in) keeps lookups sub-linear.
+"""
+import argparse
+import json
+import math
+import re
+import sys
+import threading
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import (DB_PATH, VECTOR_DIM, VECTOR_HASH_BUCKETS, VECTOR_SEED, VECTOR_BATCH_SIZE,
+                    VECTOR_NPROBE, VECTOR_KMEANS_SAMPLE, VECTOR_KMEANS_ITERATIONS)
+from db.suggest import STOPWORDS
+
+_TOKEN_RE = re.compile(r"[^\W\d_]{2,}", re.UNICODE)
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class HashedTfidfEmbedder:
+    """Embeds texts as randomly projected, L2-normalized TF-IDF vectors of hashed words"""
+
+    def __init__(self, idf: np.ndarray, dim: int = VECTOR_DIM, seed: int = VECTOR_SEED):
+        self.idf = idf.astype(np.float32)
+        self.buckets = len(idf)
+        # Signs only, so the matrix stays small; rows are scaled when gathered
+        rng = np.random.default_rng(seed)
+        self.projection = rng.integers(0, 2, size=(self.buckets, dim), dtype=np.int8) * 2 - 1
+        self.dim = dim
+        self._bucket_cache = {}
+
+    def _bucket(self, word: str) -> int:
+        bucket = self._bucket_cache.get(word)
+        if bucket is None:
+            # crc32 rather than hash(), which differs between processes
+            bucket = zlib.crc32(word.encode('utf-8')) % self.buckets
+            self._bucket_cache[word] = bucket
+        return bucket
+
+    def term_counts(self, title: str, abstract: str) -> Counter:
+        """Bucket counts of a paper's words; title words count twice"""
+        counts = Counter()
+        for text, weight in ((title, 2), (abstract, 1)):
+            for word in _TOKEN_RE.findall((text or '').lower()):
+                if word not in STOPWORDS:
+                    counts[self._bucket(word)] += weight
+        return counts
+
+    def embed(self, texts: Sequence[Tuple[str, str]]) -> np.ndarray:
+        """(title, abstract) pairs -> (len(texts), dim) unit vectors (zero if no words)"""
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        buckets = []
+        weights = []
+        rows = []
+        for row, (title, abstract) in enumerate(texts):
+            counts = self.term_counts(title, abstract)
+            if not counts:
+                continue
+            rows.append(row)
+            buckets.append(np.fromiter(counts.keys(), dtype=np.int64, count=len(counts)))
+            weights.append(1 + np.log(np.fromiter(counts.values(), dtype=np.float32,
+                                                  count=len(counts))))
+        if not rows:
+            return out
+        lengths = np.array([len(b) for b in buckets])
+        buckets = np.concatenate(buckets)
+        weights = np.concatenate(weights) * self.idf[buckets]
+        gathered = self.projection[buckets].astype(np.float32) * weights[:, None]
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        out[rows] = np.add.reduceat(gathered, starts, axis=0)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int, seed: int) -> np.ndarray:
+    """Spherical k-means (cosine) on unit vectors; returns unit centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # Re-seed empty clusters with random points
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        norms[empty] = 1
+        centroids = sums / norms
+    return centroids.astype(np.float32)
+
+
+class VectorIndex:
+    """
+    Embeddings of every paper and an IVF index over them, for one database
+    Built once by the batch job, then kept current with update(), which only
+    embeds papers stored (or changed) since the last run and files them under
+    their nearest centroid
+    """
+
+    @staticmethod
+    def directory(db_path) -> Path:
+        db_path = Path(db_path)
+        return db_path.with_name(db_path.name + '.vectors')
+
+    @classmethod
+    def exists(cls, db_path) -> bool:
+        return (cls.directory(db_path) / 'meta.json').exists()
+
+    @classmethod
+    def for_db(cls, db) -> 'VectorIndex':
+        """Get the shared index of a database, loading it on first use"""
+        key = str(db.db_path.resolve())
+        with _indexes_lock:
+            if key not in _indexes:
+                _indexes[key] = cls(db)
+            return _indexes[key]
+
+    @classmethod
+    def discard(cls, db_path):
+        """Forget the shared index of a database, unmapping it once no search holds it"""
+        with _indexes_lock:
+            _indexes.pop(str(Path(db_path).resolve()), None)
+
+    def __init__(self, db):
+        self.db = db
+        self.path = self.directory(db.db_path)
+        self._lock = threading.RLock()
+        self.meta = None
+        if self.exists(db.db_path):
+            self._load()
+
+    def _load(self):
+        self.meta = json.loads((self.path / 'meta.json').read_text())
+        self.embedder = HashedTfidfEmbedder(np.load(self.path / 'idf.npy'),
+                                            self.meta['dim'], self.meta['seed'])
+        self.centroids = np.load(self.path / 'centroids.npy')
+        self._open(self.meta['rows'])
+
+    def _open(self, rows: int):
+        """
+        Map the vector and list-assignment files, growing them to rows first;
+        the index of a read-only database is mapped read-only as it is
+        """
+        mode = 'r' if self.db.read_only else 'r+'
+        for name, dtype, width, fill in (('vectors.f32', np.float32, self.meta['dim'], 0),
+                                         ('assign.i32', np.int32, 1, -1)):
+            path = self.path / name
+            item_size = np.dtype(dtype).itemsize * width
+            old_rows = path.stat().st_size // item_size if path.exists() else 0
+            if rows > old_rows and mode == 'r+':
+                with open(path, 'ab') as f:
+                    f.write(np.full((rows - old_rows) * width, fill, dtype=dtype).tobytes())
+        self.vectors = np.memmap(self.path / 'vectors.f32', dtype=np.float32, mode=mode,
+                                 shape=(rows, self.meta['dim']))
+        self.assign = np.memmap(self.path / 'assign.i32', dtype=np.int32, mode=mode,
+                                shape=(rows,))
+        self.meta['rows'] = rows
+        self._build_lists()
+
+    def _build_lists(self):
+        """Paper ids grouped by IVF list: ids[offsets[c]:offsets[c + 1]] are in list c"""
+        assign = np.asarray(self.assign)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign[assign >= 0], minlength=len(self.centroids))
+        unassigned = int((assign < 0).sum())
+        self.list_ids = order[unassigned:]
+        self.list_offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def _save_meta(self):
+        tmp = self.path / 'meta.json.tmp'
+        tmp.write_text(json.dumps(self.meta))
+        tmp.replace(self.path / 'meta.json')
+
+    def _iter_papers(self, since: Optional[str] = None):
+        """(id, title, abstract, last_updated) batches, optionally only rows updated after since"""
+        sql = 'SELECT id, title, abstract, last_updated FROM papers'
+        params = ()
+        if since is not None:
+            sql += ' WHERE last_updated > ?'
+            params = (since,)
+        with self.db.connections.reader() as conn:
+            cursor = conn.execute(sql + ' ORDER BY id', params)
+            while True:
+                batch = cursor.fetchmany(VECTOR_BATCH_SIZE)
+                if not batch:
+                    break
+                yield [tuple(row) for row in batch]
+
+    def build(self, progress_callback=None) -> int:
+        """Embed every paper from scratch and fit the IVF index; returns the paper count"""
+        with self._lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with self.db.connections.reader() as conn:
+                max_id, total, watermark = conn.execute(
+                    'SELECT MAX(id), COUNT(*), MAX(last_updated) FROM papers').fetchone()
+            rows = (max_id or 0) + 1
+
+            # Document frequencies of the hashed words give the IDF weights
+            probe = HashedTfidfEmbedder(np.ones(VECTOR_HASH_BUCKETS, dtype=np.float32))
+            df = np.zeros(VECTOR_HASH_BUCKETS, dtype=np.int64)
+            for batch in self._iter_papers():
+                for _, title, abstract, _ in batch:
+                    df[list(probe.term_counts(title, abstract))] += 1
+            idf = (np.log((1 + total) / (1 + df)) + 1).astype(np.float32)
+            np.save(self.path / 'idf.npy', idf)
+
+            for name in ('vectors.f32', 'assign.i32'):
+                (self.path / name).unlink(missing_ok=True)
+            self.meta = {'dim': VECTOR_DIM, 'seed': VECTOR_SEED, 'rows': rows,
+                         'watermark': watermark, 'papers': total}
+            self.embedder = HashedTfidfEmbedder(idf, VECTOR_DIM, VECTOR_SEED)
+            self.embedder._bucket_cache = probe._bucket_cache
+            self.centroids = np.zeros((1, VECTOR_DIM), dtype=np.float32)
+            self._open(rows)
+
+            done = 0
+            for batch in self._iter_papers():
+                ids = [paper_id for paper_id, _, _, _ in batch]
+                self.vectors[ids] = self.embedder.embed(
+                    [(title, abstract) for _, title, abstract, _ in batch])
+                done += len(batch)
+                if progress_callback:
+                    progress_callback(done, total)
+
+            embedded = np.flatnonzero(np.linalg.norm(self.vectors, axis=1) > 0)
+            nlist = max(1, int(math.sqrt(len(embedded))))
+            rng = np.random.default_rng(VECTOR_SEED)
+            sample = rng.choice(embedded, size=min(len(embedded), VECTOR_KMEANS_SAMPLE),
+                                replace=False) if len(embedded) else embedded
+            if len(sample):
+                self.centroids = _kmeans(np.asarray(self.vectors[np.sort(sample)]),
+                                         min(nlist, len(sample)), VECTOR_KMEANS_ITERATIONS,
+                                         VECTOR_SEED)
+            np.save(self.path / 'centroids.npy', self.centroids)
+            self.assign[:] = -1
+            self._assign(embedded)
+            self.vectors.flush()
+            self.assign.flush()
+            self._build_lists()
+            self._save_meta()
+            return total
+
+    def _assign(self, ids: np.ndarray):
+        for start in range(0, len(ids), VECTOR_BATCH_SIZE * 8):
+            chunk = ids[start:start + VECTOR_BATCH_SIZE * 8]
+            self.assign[chunk] = np.argmax(self.vectors[chunk] @ self.centroids.T, axis=1)
+
+    def update(self) -> int:
+        """Embed papers stored or changed since the last run; returns how many"""
+        with self._lock:
+            if self.meta is None:
+                return 0
+            with self.db.connections.reader() as conn:
+                max_id = conn.execute('SELECT MAX(id) FROM papers').fetchone()[0] or 0
+            if max_id + 1 > self.meta['rows']:
+                self._open(max_id + 1)
+
+            changed = 0
+            watermark = self.meta['watermark']
+            for batch in self._iter_papers(since=watermark):
+                ids = np.array([paper_id for paper_id, _, _, _ in batch])
+                self.vectors[ids] = self.embedder.embed(
+                    [(title, abstract) for _, title, abstract, _ in batch])
+                embedded = ids[np.linalg.norm(self.vectors[ids], axis=1) > 0]
+                self.assign[ids] = -1
+                self._assign(embedded)
+                watermark = max([watermark or ''] + [row[3] for row in batch if row[3]]) or None
+                changed += len(batch)
+            if changed:
+                self.vectors.flush()
+                self.assign.flush()
+                self._build_lists()
+                self.meta['watermark'] = watermark
+                self._save_meta()
+            return changed
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embedder.embed([(text, '')])[0]
+
+    def similarities(self, query_vector: np.ndarray, ids: Sequence[int]) -> np.ndarray:
+        """Cosine similarity of the query to the given papers (0 for unknown ids)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        known = ids < self.meta['rows']
+        scores = np.zeros(len(ids), dtype=np.float32)
+        scores[known] = self.vectors[ids[known]] @ query_vector
+        return scores
+
+    def search(self, query_vector: np.ndarray, k: int,
+               nprobe: int = VECTOR_NPROBE) -> List[Tuple[int, float]]:
+        """Approximate top-k (paper id, cosine similarity), searching the nprobe closest lists"""
+        if self.meta is None or not query_vector.any():
+            return []
+        with self._lock:
+            vectors, centroids = self.vectors, self.centroids
+            list_ids, offsets = self.list_ids, self.list_offsets
+        nprobe = min(nprobe, len(centroids))
+        probes = np.argpartition(-(centroids @ query_vector), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([list_ids[offsets[c]:offsets[c + 1]] for c in probes])
+        if not len(candidates):
+            return []
+        scores = vectors[candidates] @ query_vector
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def get_stats(self) -> Dict[str, int]:
+        if self.meta is None:
+            return {'papers': 0, 'lists': 0}
+        return {'papers': len(self.list_ids), 'lists': len(self.centroids),
+                'rows': self.meta['rows'], 'dim': self.meta['dim']}
+
+
+def main():
+    from db.paper_db import PaperDB
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=['build', 'update'])
+    parser.add_argument('--db', default=DB_PATH)
+    args = parser.parse_args()
+
+    index = VectorIndex.for_db(PaperDB(args.db))
+    if args.command == 'build' or index.meta is None:
+        total = index.build(lambda done, total: print(
+            f'  embedded {done}/{total}', end='\r', flush=True))
+        print(f'\nEmbedded {total} papers into {len(index.centroids)} lists at {index.path}')
+    else:
+        print(f'Embedded {index.update()} new or changed papers')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
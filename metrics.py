@@ -0,0 +1,338 @@
+"""
+Instrumentation of the ingestion and search hot paths
+
+Stages are timed with spans (fetch, parse, write, fts, dedup, embed, query,
+render), labelled with the venue or the kind of query where there is one;
+counters track bytes fetched, papers stored and failures per venue; queries
+slower than METRICS_SLOW_QUERY_MS are logged with their EXPLAIN QUERY PLAN.
+Everything is exported as Prometheus text or as a JSON document, and with
+METRICS_DUMP_PATH set a JSON dump is also written periodically, which is how
+a Streamlit process exposes its metrics.
+
+Collection is off unless METRICS_ENABLED is set or enable() is called; every
+hook then returns after checking one flag. Metrics are per process.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import (METRICS_ENABLED, METRICS_SLOW_QUERY_MS, METRICS_LOG_SIZE, METRICS_WINDOW,
+                    METRICS_BUCKETS, METRICS_DUMP_PATH, METRICS_DUMP_INTERVAL)
+
+_NOOP = nullcontext()
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+class _Series:
+    """Durations of one stage and label set: totals, histogram and a recent window"""
+    __slots__ = ('count', 'total', 'max', 'buckets', 'recent')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(METRICS_BUCKETS)
+        self.recent = deque(maxlen=METRICS_WINDOW)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for position, bound in enumerate(METRICS_BUCKETS):
+            if seconds <= bound:
+                self.buckets[position] += 1
+                break
+        self.recent.append(seconds)
+
+
+class Registry:
+    """Spans, counters and the slow-query and error logs of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._series: Dict[Tuple[str, Labels], _Series] = {}
+            self._counters: Dict[Tuple[str, Labels], float] = {}
+            self._slow_queries = deque(maxlen=METRICS_LOG_SIZE)
+            self._errors = deque(maxlen=METRICS_LOG_SIZE)
+            self._started = time.time()
+
+    def observe(self, stage: str, seconds: float, labels: Labels = ()):
+        with self._lock:
+            series = self._series.get((stage, labels))
+            if series is None:
+                series = self._series[stage, labels] = _Series()
+            series.observe(seconds)
+
+    def count(self, name: str, value: float = 1, labels: Labels = ()):
+        with self._lock:
+            self._counters[name, labels] = self._counters.get((name, labels), 0) + value
+
+    def error(self, stage: str, error: BaseException, labels: Labels = ()):
+        """
+        Count a failure and keep it in the error log, under the first stage
+        that records it: one escaping nested spans, or handled after escaping
+        one, is not counted again
+        """
+        if getattr(error, '_metrics_recorded', False):
+            return
+        error._metrics_recorded = True
+        self.count('failures', 1, (('stage', stage),) + labels)
+        entry = {'time': time.time(), 'stage': stage, 'labels': dict(labels),
+                 'error': f'{type(error).__name__}: {error}',
+                 'where': ''.join(traceback.format_tb(error.__traceback__, limit=-3))}
+        with self._lock:
+            self._errors.append(entry)
+
+    def slow_query(self, kind: str, sql: str, params: Iterable, seconds: float, plan: List[str]):
+        entry = {'time': time.time(), 'kind': kind, 'ms': round(seconds * 1000, 2),
+                 'sql': ' '.join(sql.split()), 'params': [repr(param)[:100] for param in params],
+                 'plan': plan}
+        with self._lock:
+            self._slow_queries.append(entry)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything collected so far as one JSON-serializable document"""
+        with self._lock:
+            series = [(stage, labels, s.count, s.total, s.max, list(s.recent))
+                      for (stage, labels), s in self._series.items()]
+            counters = list(self._counters.items())
+            slow_queries = list(self._slow_queries)
+            errors = list(self._errors)
+        stages = []
+        for stage, labels, count, total, longest, recent in sorted(series):
+            p50, p95, p99 = (float(value) for value in np.percentile(recent, [50, 95, 99]) * 1000)
+            stages.append({'stage': stage, 'labels': dict(labels), 'count': count,
+                           'total_s': round(total, 4), 'max_ms': round(longest * 1000, 2),
+                           'p50_ms': round(p50, 2), 'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2)})
+        return {
+            'pid': os.getpid(),
+            'since': self._started,
+            'time': time.time(),
+            'stages': stages,
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                         for (name, labels), value in sorted(counters)],
+            'slow_queries': slow_queries,
+            'errors': errors,
+        }
+
+    def prometheus(self) -> str:
+        """Stage histograms and counters in the Prometheus text exposition format"""
+        def format_labels(labels: Labels, extra: Labels = ()) -> str:
+            labels = labels + extra
+            if not labels:
+                return ''
+            return '{' + ','.join('%s="%s"' % (name, value.replace('\\', '\\\\').replace('"', '\\"'))
+                                  for name, value in labels) + '}'
+
+        with self._lock:
+            series = [(stage, labels, s.count, s.total, list(s.buckets))
+                      for (stage, labels), s in self._series.items()]
+            counters = list(self._counters.items())
+
+        lines = ['# HELP cerebro_stage_seconds Time spent per pipeline stage',
+                 '# TYPE cerebro_stage_seconds histogram']
+        for stage, labels, count, total, buckets in sorted(series):
+            labels = (('stage', stage),) + labels
+            cumulative = 0
+            for bound, hits in zip(METRICS_BUCKETS, buckets):
+                cumulative += hits
+                lines.append(f'cerebro_stage_seconds_bucket{format_labels(labels, (("le", str(bound)),))}'
+                             f' {cumulative}')
+            lines.append(f'cerebro_stage_seconds_bucket{format_labels(labels, (("le", "+Inf"),))} {count}')
+            lines.append(f'cerebro_stage_seconds_sum{format_labels(labels)} {total:.6f}')
+            lines.append(f'cerebro_stage_seconds_count{format_labels(labels)} {count}')
+
+        names = sorted({name for (name, _), _ in counters})
+        for name in names:
+            lines.append(f'# TYPE cerebro_{name}_total counter')
+            for (counter, labels), value in sorted(counters):
+                if counter == name:
+                    lines.append(f'cerebro_{name}_total{format_labels(labels)} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+class _Span:
+    __slots__ = ('stage', 'labels', 'start')
+
+    def __init__(self, stage: str, labels: Labels):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe(self.stage, time.perf_counter() - self.start, self.labels)
+        if exc is not None:
+            registry.error(self.stage, exc, self.labels)
+        return False
+
+
+registry = Registry()
+_enabled = METRICS_ENABLED
+_dump_thread = None
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(dump_path: Optional[str] = METRICS_DUMP_PATH):
+    """Start collecting; with dump_path, also write a JSON dump there periodically"""
+    global _enabled, _dump_thread
+    _enabled = True
+    if dump_path and _dump_thread is None:
+        _dump_thread = threading.Thread(target=_dump_periodically, args=(dump_path,),
+                                        name='metrics-dump', daemon=True)
+        _dump_thread.start()
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def span(stage: str, **labels):
+    """Context manager timing a stage; an exception escaping it is counted as a failure"""
+    if not _enabled:
+        return _NOOP
+    return _Span(stage, _labels(labels))
+
+
+def timed(stage: str, **labels):
+    """Decorator timing every call of a function as a stage"""
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Span(stage, _labels(labels)):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timed_iter(stage: str, make_iterable: Callable[[], Iterable], **labels) -> Iterator:
+    """
+    Items of make_iterable(), timing only the work of producing them, e.g. the
+    parsing behind a streaming parser consumed by a writer; the call itself
+    counts too, as parsers that are not streaming do all their work in it.
+    Recorded as one observation when the items are exhausted
+    """
+    if not _enabled:
+        return iter(make_iterable())
+    return _timed_iter(make_iterable, stage, _labels(labels))
+
+
+def _timed_iter(make_iterable: Callable[[], Iterable], stage: str, labels: Labels) -> Iterator:
+    start = time.perf_counter()
+    try:
+        iterator = iter(make_iterable())
+    except Exception as e:
+        registry.observe(stage, time.perf_counter() - start, labels)
+        registry.error(stage, e, labels)
+        raise
+    elapsed = time.perf_counter() - start
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            registry.observe(stage, elapsed + time.perf_counter() - start, labels)
+            return
+        except Exception as e:
+            registry.observe(stage, elapsed + time.perf_counter() - start, labels)
+            registry.error(stage, e, labels)
+            raise
+        elapsed += time.perf_counter() - start
+        yield item
+
+
+def count(name: str, value: float = 1, **labels):
+    """Add to a counter, e.g. count('papers', 250, venue='ACL')"""
+    if _enabled:
+        registry.count(name, value, _labels(labels))
+
+
+def error(stage: str, e: BaseException, **labels):
+    """Record a failure that was handled; ignored if a span it escaped recorded it already"""
+    if _enabled:
+        registry.error(stage, e, _labels(labels))
+
+
+def _query_plan(conn, sql: str, params) -> List[str]:
+    """EXPLAIN QUERY PLAN as indented lines, as the sqlite3 shell prints it"""
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return lines
+
+
+def query(conn, kind: str, sql: str, params=()) -> list:
+    """
+    Run a query and fetch all its rows, timed as a query of the given kind;
+    slow ones are logged with their plan
+    """
+    if not _enabled:
+        return conn.execute(sql, params).fetchall()
+    labels = (('kind', kind),)
+    start = time.perf_counter()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    except Exception as e:
+        registry.error('query', e, labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe('query', elapsed, labels)
+    if elapsed * 1000 >= METRICS_SLOW_QUERY_MS:
+        try:
+            plan = _query_plan(conn, sql, params)
+        except Exception as e:
+            plan = [f'(no plan: {e})']
+        registry.slow_query(kind, sql, params, elapsed, plan)
+    return rows
+
+
+def snapshot() -> Dict[str, Any]:
+    return registry.snapshot()
+
+
+def prometheus() -> str:
+    return registry.prometheus()
+
+
+def _dump_periodically(path: str):
+    while True:
+        time.sleep(METRICS_DUMP_INTERVAL)
+        try:
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot(), f, indent=1)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error writing metrics dump: {str(e)}")
+
+
+if _enabled:
+    enable()
@@ -1,13 +1,19 @@
 import streamlit as st
-import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 import re
 
-from .base import ConferencePaperParser
+try:
+    from lxml import html as lxml_html
+except ImportError:  # fall back to BeautifulSoup
+    lxml_html = None
 
+import metrics
+from .base import ConferenceSourceParser
+from .fetcher import FetchResult, get_fetcher
 
-class ACLPaperParser(ConferencePaperParser):
+
+class ACLPaperParser(ConferenceSourceParser):
     """Parser for ACL Anthology papers"""
 
     def __init__(self):
@@ -28,35 +34,125 @@ class ACLPaperParser(ConferencePaperParser):
         sanitized = re.sub(r'[^a-zA-Z0-9]', '', venue).lower()
         return sanitized
 
+    def get_url(self, venue: str, year: int) -> str:
+        """Build the ACL Anthology event URL for a venue and year"""
+        sanitized_venue = self._sanitize_venue_name(venue)
+        return f"{self.base_url}/events/{sanitized_venue}-{year}/"
+
+    def download(self, venue: str, year: int) -> FetchResult:
+        """Download the event page HTML, revalidating any cached copy"""
+        return get_fetcher().fetch(self.get_url(venue, year))
+
+    def parse(self, content: str, venue: str, year: int) -> list:
+        """Parse an event page into paper dictionaries"""
+        return self._parse_papers(content, venue, year)
+
     def fetch_papers(self, venue: str, year: int) -> list:
         """
         Fetch papers from ACL Anthology
         Returns list of paper dictionaries with title, authors, paper_url, and abstract
         """
-        sanitized_venue = self._sanitize_venue_name(venue)
-        url = f"{self.base_url}/events/{sanitized_venue}-{year}/"
-
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            return self._parse_papers(response.text, venue, year)
+            result = self.download(venue, year)
+            papers = self.parse(result.content, venue, year)
+            self.commit(result)
+            return papers
         except Exception as e:
             st.error(f"Error fetching papers: {str(e)}")
+            metrics.error('fetch', e, venue=venue)
             return []
 
     def _parse_papers(self, html_content: str, venue: str, year: int) -> list:
         """Parse paper information from HTML content"""
+        if lxml_html is not None:
+            return self._parse_papers_lxml(html_content, venue, year)
+        return self._parse_papers_bs4(html_content, venue, year)
+
+    def _parse_papers_lxml(self, html_content: str, venue: str, year: int) -> list:
+        """
+        Single pass over the document with lxml: collect paper entries and
+        abstract cards, then pair them by the abstract id each entry links to
+        """
+        root = lxml_html.document_fromstring(html_content)
+        entries = []
+        abstracts = {}
+
+        for elem in root.iter('p', 'div'):
+            classes = (elem.get('class') or '').split()
+            if elem.tag == 'p' and 'd-sm-flex' in classes:
+                entries.append(elem)
+            elif elem.tag == 'div' and 'abstract-collapse' in classes:
+                abstracts[elem.get('id')] = elem
+
+        papers = []
+        for paper in entries:
+            paper_info = self._extract_paper_info_lxml(
+                paper, venue, year, abstracts)
+            if paper_info:
+                papers.append(paper_info)
+
+        return papers
+
+    def _extract_paper_info_lxml(self, paper_elem, venue: str, year: int, abstracts: dict) -> dict:
+        """Extract information for a single paper from an lxml element"""
+        paper_url = None
+        pdf_badge = None
+        abstract_id = None
+        authors = []
+        for link in paper_elem.iter('a'):
+            href = link.get('href') or ''
+            if pdf_badge is None and 'badge-primary' in (link.get('class') or '').split():
+                pdf_badge = link
+            if href.startswith('/people/'):
+                authors.append(link.text_content().strip())
+            elif href.startswith('#abstract-') and abstract_id is None:
+                abstract_id = href[1:]
+
+        if pdf_badge is not None and 'pdf' in pdf_badge.text_content().lower():
+            paper_url = urljoin(self.base_url, pdf_badge.get('href'))
+
+        # Get title
+        title_elem = None
+        strong = next(paper_elem.iter('strong'), None)
+        if strong is not None:
+            title_elem = next((link for link in strong.iter('a')
+                               if 'align-middle' in (link.get('class') or '').split()), None)
+        if title_elem is None:
+            return None
+
+        # Get abstract
+        abstract = ""
+        abstract_div = abstracts.get(abstract_id)
+        if abstract_div is not None:
+            abstract_body = next((div for div in abstract_div.iter('div')
+                                  if 'card-body' in (div.get('class') or '').split()), None)
+            if abstract_body is not None:
+                abstract = abstract_body.text_content().strip()
+
+        return {
+            'title': title_elem.text_content().strip(),
+            'authors': ', '.join(authors),
+            'event': f"{venue}-{year}",
+            'paper_url': paper_url,
+            'abstract': abstract
+        }
+
+    def _parse_papers_bs4(self, html_content: str, venue: str, year: int) -> list:
+        """Reference parser using BeautifulSoup, used when lxml is not installed"""
         soup = BeautifulSoup(html_content, 'html.parser')
+        abstracts = {div.get('id'): div
+                     for div in soup.find_all('div', class_='abstract-collapse')}
         papers = []
 
         for paper in soup.find_all('p', class_='d-sm-flex'):
-            paper_info = self._extract_paper_info(paper, venue, year)
+            paper_info = self._extract_paper_info(
+                paper, venue, year, abstracts)
             if paper_info:
                 papers.append(paper_info)
 
         return papers
 
-    def _extract_paper_info(self, paper_elem, venue: str, year: int) -> dict:
+    def _extract_paper_info(self, paper_elem, venue: str, year: int, abstracts: dict) -> dict:
         """Extract information for a single paper"""
         # Get paper URL (formerly pdf_link)
         paper_url = None
@@ -65,7 +161,8 @@ class ACLPaperParser(ConferencePaperParser):
             paper_url = urljoin(self.base_url, pdf_badge['href'])
 
         # Get title
-        title_elem = paper_elem.find('strong').find('a', class_='align-middle')
+        strong = paper_elem.find('strong')
+        title_elem = strong.find('a', class_='align-middle') if strong else None
         if not title_elem:
             return None
 
@@ -74,9 +171,12 @@ class ACLPaperParser(ConferencePaperParser):
             'a', href=lambda x: x and x.startswith('/people/'))
         authors = [author.text.strip() for author in author_spans]
 
-        # Get abstract
+        # Get abstract: the entry's "abs" badge links to its abstract card by id
         abstract = ""
-        abstract_div = paper_elem.find_next('div', class_='abstract-collapse')
+        abstract_link = paper_elem.find(
+            'a', href=lambda x: x and x.startswith('#abstract-'))
+        abstract_div = abstracts.get(
+            abstract_link['href'][1:]) if abstract_link else None
         if abstract_div:
             abstract_body = abstract_div.find('div', class_='card-body')
             if abstract_body:
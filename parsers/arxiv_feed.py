@@ -0,0 +1,200 @@
+import gzip
+import json
+import re
+from email.utils import parsedate_to_datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlencode
+import xml.etree.ElementTree as ET
+
+from config import HTTP_TIMEOUT
+from .fetcher import get_fetcher
+
+OAI_NS = '{http://www.openarchives.org/OAI/2.0/}'
+ARXIV_NS = '{http://arxiv.org/OAI/arXiv/}'
+ATOM_NS = '{http://www.w3.org/2005/Atom}'
+
+_VERSION_RE = re.compile(r'v\d+$')
+
+
+def _clean(text: Optional[str]) -> str:
+    """Collapse the line breaks and indentation arXiv leaves in titles and abstracts"""
+    return ' '.join((text or '').split())
+
+
+def _record(arxiv_id: str, title: str, authors: list, abstract: str,
+            categories: list, created: str, datestamp: str) -> Dict[str, Any]:
+    arxiv_id = _VERSION_RE.sub('', arxiv_id.strip())
+    return {
+        'arxiv_id': arxiv_id,
+        'title': _clean(title),
+        'authors': ', '.join(_clean(name) for name in authors if _clean(name)),
+        'abstract': _clean(abstract),
+        'categories': categories,
+        'year': int(created[:4]),
+        'datestamp': datestamp[:10],
+        'paper_url': f'https://arxiv.org/abs/{arxiv_id}'
+    }
+
+
+def _oai_record(record: ET.Element) -> Optional[Dict[str, Any]]:
+    """A record in the OAI-PMH 'arXiv' metadata format; None for deleted records"""
+    header = record.find(f'{OAI_NS}header')
+    if header is None or header.get('status') == 'deleted':
+        return None
+    meta = record.find(f'{OAI_NS}metadata/{ARXIV_NS}arXiv')
+    if meta is None:
+        return None
+    authors = []
+    for author in meta.iterfind(f'{ARXIV_NS}authors/{ARXIV_NS}author'):
+        parts = [author.findtext(f'{ARXIV_NS}{part}', '')
+                 for part in ('forenames', 'keyname', 'suffix')]
+        authors.append(' '.join(part for part in parts if part))
+    return _record(
+        meta.findtext(f'{ARXIV_NS}id', ''),
+        meta.findtext(f'{ARXIV_NS}title', ''),
+        authors,
+        meta.findtext(f'{ARXIV_NS}abstract', ''),
+        meta.findtext(f'{ARXIV_NS}categories', '').split(),
+        meta.findtext(f'{ARXIV_NS}created', '')
+        or header.findtext(f'{OAI_NS}datestamp', ''),
+        header.findtext(f'{OAI_NS}datestamp', ''))
+
+
+def _atom_entry(entry: ET.Element) -> Dict[str, Any]:
+    """An entry of an arXiv API (Atom) result page"""
+    return _record(
+        entry.findtext(f'{ATOM_NS}id', '').rsplit('/abs/', 1)[-1],
+        entry.findtext(f'{ATOM_NS}title', ''),
+        [author.findtext(f'{ATOM_NS}name', '')
+         for author in entry.iterfind(f'{ATOM_NS}author')],
+        entry.findtext(f'{ATOM_NS}summary', ''),
+        [category.get('term') for category in entry.iterfind(f'{ATOM_NS}category')],
+        entry.findtext(f'{ATOM_NS}published', ''),
+        entry.findtext(f'{ATOM_NS}updated', ''))
+
+
+def _json_record(line: str) -> Dict[str, Any]:
+    """A line of the arXiv metadata snapshot (one JSON object per paper)"""
+    item = json.loads(line)
+    versions = item.get('versions') or []
+    created = item.get('update_date', '')
+    if versions and versions[0].get('created'):
+        created = parsedate_to_datetime(versions[0]['created']).strftime('%Y-%m-%d')
+    if item.get('authors_parsed'):
+        authors = [' '.join(part for part in (first, last) + tuple(rest) if part)
+                   for last, first, *rest in item['authors_parsed']]
+    else:
+        authors = re.split(r',|\band\b', item.get('authors', ''))
+    return _record(item['id'], item.get('title', ''), authors,
+                   item.get('abstract', ''), item.get('categories', '').split(),
+                   created, item.get('update_date') or created)
+
+
+def iter_feed(stream, state: Optional[dict] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream records out of an OAI-PMH ListRecords page or an Atom feed
+    Elements are cleared as soon as they are read, so dump files of any size
+    parse in constant memory. The OAI resumption token, if the page has one,
+    is stored in state['resumption_token']
+    """
+    for _, elem in ET.iterparse(stream, events=('end',)):
+        if elem.tag == f'{OAI_NS}record':
+            record = _oai_record(elem)
+            elem.clear()
+            if record is not None:
+                yield record
+        elif elem.tag == f'{ATOM_NS}entry':
+            record = _atom_entry(elem)
+            elem.clear()
+            yield record
+        elif elem.tag == f'{OAI_NS}resumptionToken' and state is not None:
+            state['resumption_token'] = (elem.text or '').strip() or None
+        elif elem.tag == f'{OAI_NS}error':
+            if elem.get('code') == 'noRecordsMatch':
+                return
+            raise ValueError(f"OAI-PMH error {elem.get('code')}: {elem.text}")
+
+
+class OAISource:
+    """
+    Pages of the arXiv OAI-PMH ListRecords endpoint, following resumption
+    tokens; the cursor of a page is the token that requests the next one
+    """
+
+    def __init__(self, base_url: str, set_spec: str = 'cs', metadata_prefix: str = 'arXiv'):
+        self.base_url = base_url
+        self.set_spec = set_spec
+        self.metadata_prefix = metadata_prefix
+        self.name = f'{base_url}?set={set_spec}'
+
+    def pages(self, since: Optional[str] = None,
+              cursor: Optional[str] = None) -> Iterator[Tuple[Iterator[Dict[str, Any]], Optional[str]]]:
+        session = get_fetcher().session
+        token = cursor
+        while True:
+            if token:
+                params = {'verb': 'ListRecords', 'resumptionToken': token}
+            else:
+                params = {'verb': 'ListRecords', 'set': self.set_spec,
+                          'metadataPrefix': self.metadata_prefix}
+                if since:
+                    params['from'] = since
+            response = session.get(f'{self.base_url}?{urlencode(params)}', timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+            state = {}
+            # Pages are small; parse fully so the next token is known up front
+            records = list(iter_feed(BytesIO(response.content), state))
+            token = state.get('resumption_token')
+            yield iter(records), token
+            if not token:
+                return
+
+
+class FileSource:
+    """
+    A directory (or single file) of harvested OAI-PMH pages, Atom feeds or
+    JSON-lines metadata dumps, optionally gzipped, read in file name order;
+    the cursor of a page is its file name
+    """
+
+    PATTERNS = ('*.xml', '*.xml.gz', '*.json', '*.jsonl', '*.json.gz', '*.jsonl.gz')
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.name = str(self.path.resolve())
+
+    def _files(self):
+        if self.path.is_file():
+            return [self.path]
+        return sorted(path for pattern in self.PATTERNS
+                      for path in self.path.glob(pattern))
+
+    def _read(self, path: Path) -> Iterator[Dict[str, Any]]:
+        opener = gzip.open if path.suffix == '.gz' else open
+        if {'.json', '.jsonl'} & set(path.suffixes):
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield _json_record(line)
+        else:
+            with opener(path, 'rb') as f:
+                yield from iter_feed(f)
+
+    def pages(self, since: Optional[str] = None,
+              cursor: Optional[str] = None) -> Iterator[Tuple[Iterator[Dict[str, Any]], Optional[str]]]:
+        for path in self._files():
+            if cursor and path.name <= cursor:
+                continue  # already stored by an interrupted harvest
+            records = self._read(path)
+            if since:
+                records = (record for record in records if record['datestamp'] >= since)
+            yield records, path.name
+
+
+def get_source(location: str):
+    """OAISource for http(s) URLs, FileSource for anything else"""
+    if location.startswith(('http://', 'https://')):
+        return OAISource(location)
+    return FileSource(location)
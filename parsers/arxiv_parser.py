@@ -1,28 +1,119 @@
 from datetime import datetime
+import threading
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus
 import xml.etree.ElementTree as ET
 import streamlit as st
+from cachetools import TTLCache
+
+from config import ARXIV_BLOCK_SIZE, ARXIV_CACHE_MAX_BLOCKS, ARXIV_CACHE_TTL, HTTP_TIMEOUT
 from .base import ConferencePaperParser
 
 
+# Shared by every ArXivParser in the process; the app builds one per rerun
+_block_cache = TTLCache(maxsize=ARXIV_CACHE_MAX_BLOCKS, ttl=ARXIV_CACHE_TTL)
+_inflight = {}
+_lock = threading.Lock()
+_prefetch_pool = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="arxiv-prefetch")
+_stats = {'hits': 0, 'misses': 0, 'api_calls': 0, 'prefetches': 0}
+
+
 class ArXivParser(ConferencePaperParser):
     """Parser for arXiv papers using the arXiv API"""
 
     def fetch_papers(self, query: str, categories: list, start_idx: int = 0, max_results: int = 10) -> list:
-        """Fetch papers from arXiv API based on query and categories"""
+        """
+        Fetch papers from arXiv API based on query and categories
+        Errors are shown in the app and yield no papers; see search()
+        """
+        try:
+            return self.search(query, categories, start_idx, max_results)
+        except Exception as e:
+            st.error(f"Error fetching arXiv papers: {str(e)}")
+            return []
+
+    def search(self, query: str, categories: list, start_idx: int = 0, max_results: int = 10) -> list:
+        """
+        Like fetch_papers, but raises on errors instead of reporting them in the app
+        Pages are sliced out of cached blocks of ARXIV_BLOCK_SIZE results, and
+        the block holding the following page is prefetched in the background
+        """
         if not categories or not query:
             return []
 
+        end_idx = start_idx + max_results
+        papers = []
+        block_start = start_idx - start_idx % ARXIV_BLOCK_SIZE
+        while block_start < end_idx:
+            block = self._get_block(query, categories, block_start)
+            papers.extend(
+                block[max(start_idx - block_start, 0):end_idx - block_start])
+            if len(block) < ARXIV_BLOCK_SIZE:
+                return papers  # nothing beyond this block
+            block_start += ARXIV_BLOCK_SIZE
+
+        next_block = (end_idx + max_results - 1) // ARXIV_BLOCK_SIZE * ARXIV_BLOCK_SIZE
+        if next_block >= block_start:
+            self._prefetch(query, categories, next_block)
+        return papers
+
+    @staticmethod
+    def get_cache_stats() -> dict:
+        """Block cache hit/miss counters and the number of API calls made"""
+        with _lock:
+            stats = dict(_stats, blocks=len(_block_cache))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _block_key(self, query: str, categories: list, block_start: int) -> tuple:
+        return (' '.join(query.lower().split()), tuple(sorted(categories)), block_start)
+
+    def _get_block(self, query: str, categories: list, block_start: int) -> list:
+        """A block of results from the cache, an in-flight prefetch or the API"""
+        key = self._block_key(query, categories, block_start)
+        with _lock:
+            block = _block_cache.get(key)
+            if block is not None:
+                _stats['hits'] += 1
+                return block
+            _stats['misses'] += 1
+            future = _inflight.get(key)
+
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:
+                pass  # prefetch failed; retry in the foreground
+
+        return self._fetch_block(query, categories, block_start)
+
+    def _prefetch(self, query: str, categories: list, block_start: int):
+        key = self._block_key(query, categories, block_start)
+        with _lock:
+            if key in _block_cache or key in _inflight:
+                return
+            _stats['prefetches'] += 1
+            future = _prefetch_pool.submit(
+                self._fetch_block, query, categories, block_start)
+            _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    def _fetch_block(self, query: str, categories: list, block_start: int) -> list:
+        """Fetch one block of results from the API and cache it"""
         cats = "+OR+".join(f"cat:{cat}" for cat in categories)
-        url = f'http://export.arxiv.org/api/query?search_query=({cats})+AND+all:{query}&start={start_idx}&max_results={max_results}&sortBy=submittedDate&sortOrder=descending'
+        url = f'http://export.arxiv.org/api/query?search_query=({cats})+AND+all:{quote_plus(query)}&start={block_start}&max_results={ARXIV_BLOCK_SIZE}&sortBy=submittedDate&sortOrder=descending'
 
-        try:
-            with urllib.request.urlopen(url) as response:
-                xml_content = response.read().decode('utf-8')
-                return self._parse_response(xml_content)
-        except Exception as e:
-            st.error(f"Error fetching arXiv papers: {str(e)}")
-            return []
+        with urllib.request.urlopen(url, timeout=HTTP_TIMEOUT) as response:
+            xml_content = response.read().decode('utf-8')
+        block = self._parse_response(xml_content)
+
+        with _lock:
+            _stats['api_calls'] += 1
+            _block_cache[self._block_key(query, categories, block_start)] = block
+        return block
 
     def _parse_response(self, xml_content: str) -> list:
         """Parse XML response from arXiv API"""
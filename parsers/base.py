@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from .fetcher import get_fetcher
+
 
 class ConferencePaperParser(ABC):
     """Abstract base class for conference paper parsers"""
@@ -8,3 +10,30 @@ class ConferencePaperParser(ABC):
     def fetch_papers(self, venue: str, year: int) -> list:
         """Fetch papers for a given venue and year"""
         pass
+
+
+class ConferenceSourceParser(ConferencePaperParser):
+    """Parsers of a per venue-year page or data file, as crawled by the ingestion engine"""
+
+    @abstractmethod
+    def get_url(self, venue: str, year: int) -> str:
+        """Return the URL holding the papers for a given venue and year"""
+        pass
+
+    @abstractmethod
+    def download(self, venue: str, year: int):
+        """Download the raw page or data file for a given venue and year (a FetchResult)"""
+        pass
+
+    @abstractmethod
+    def parse(self, content: str, venue: str, year: int) -> list:
+        """Parse downloaded content into paper dictionaries"""
+        pass
+
+    def iter_papers(self, result, venue: str, year: int):
+        """Yield paper dictionaries from a FetchResult; streaming parsers override this"""
+        return iter(self.parse(result.content, venue, year))
+
+    def commit(self, result):
+        """Keep a download in the HTTP cache once its papers are stored"""
+        get_fetcher().commit(result)
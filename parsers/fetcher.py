@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (HTTP_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF, HTTP_POOL_SIZE, HTTP_CACHE_DIR,
+                    HTTP_STREAM_CHUNK_SIZE, HTTP_PENDING_MAX_AGE, HTTP_MIRRORS)
+
+
+class FetchResult(NamedTuple):
+    url: str
+    content: Optional[str]  # None for streamed fetches; read the body from path
+    changed: bool  # False when the server sent 304 or the body hash is unchanged
+    status: int
+    path: Optional[Path] = None  # cached copy of the body on disk
+    size: int = 0  # bytes received; 0 when the cached copy was still valid
+    pending: Optional[dict] = None  # cache entry of a changed body, saved by commit()
+
+
+class CachedFetcher:
+    """
+    HTTP GETs through one pooled session with retries and backoff,
+    plus an on-disk cache of bodies keyed by URL that enables conditional
+    requests (ETag / Last-Modified) and content-hash change detection
+    A changed body only replaces the cached one once commit() is called,
+    i.e. after its papers are stored, so a failed parse or write is retried.
+    Until then it sits in a pending file of its own, so concurrent fetches of
+    one URL never write over each other
+    URLs under an origin listed in mirrors are fetched from its stand-in
+    """
+
+    def __init__(self, cache_dir: str = HTTP_CACHE_DIR, mirrors: Optional[Dict[str, str]] = None):
+        self.mirrors = dict(HTTP_MIRRORS if mirrors is None else mirrors)
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.session = requests.Session()
+        retry = Retry(total=HTTP_RETRIES, backoff_factor=HTTP_BACKOFF,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE,
+                              pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._commit_lock = threading.Lock()
+
+    def _cache_paths(self, url: str):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def _new_pending(self, body_path: Path):
+        """
+        Open a pending file unique to one download, as (file, path), after
+        sweeping the ones of the same URL that were never committed
+        """
+        cutoff = time.time() - HTTP_PENDING_MAX_AGE
+        for stale in self.cache_dir.glob(f"{body_path.stem}.*.pending"):
+            try:
+                if stale.stat().st_mtime < cutoff:
+                    stale.unlink()
+            except OSError:
+                pass  # committed or swept meanwhile
+        fd, path = tempfile.mkstemp(prefix=f"{body_path.stem}.", suffix='.pending',
+                                    dir=self.cache_dir)
+        return os.fdopen(fd, 'wb'), Path(path)
+
+    def _load_meta(self, url: str) -> Optional[dict]:
+        meta_path, body_path = self._cache_paths(url)
+        if not meta_path.exists() or not body_path.exists():
+            return None
+        try:
+            return json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _write_atomic(self, path: Path, data: bytes):
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def fetch(self, url: str, stream: bool = False) -> FetchResult:
+        """
+        GET a URL, revalidating against the cached copy when there is one
+        With stream=True the body is written to the cache in chunks and not
+        held in memory; the result then has no content, only a path
+        """
+        for origin, mirror in self.mirrors.items():
+            if url.startswith(origin):
+                url = mirror + url[len(origin):]
+                break
+        meta_path, body_path = self._cache_paths(url)
+        meta = self._load_meta(url)
+
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self.session.get(url, headers=headers, timeout=HTTP_TIMEOUT,
+                                    stream=stream)
+        with response:
+            if response.status_code == 304 and meta:
+                content = None if stream else body_path.read_bytes().decode(
+                    meta['encoding'], errors='replace')
+                return FetchResult(url, content, False, 304, body_path)
+            response.raise_for_status()
+
+            pending_path = None
+            if stream:
+                digest, encoding, size, pending_path = self._stream_body(response, body_path, meta)
+                content = None
+            else:
+                body = response.content
+                size = len(body)
+                digest = hashlib.sha256(body).hexdigest()
+                encoding = response.encoding or response.apparent_encoding or 'utf-8'
+                if meta is None or meta.get('sha256') != digest:
+                    f, pending_path = self._new_pending(body_path)
+                    with f:
+                        f.write(body)
+                content = body.decode(encoding, errors='replace')
+
+        changed = meta is None or meta.get('sha256') != digest
+        entry = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': digest,
+            'encoding': encoding,
+            'fetched_at': datetime.now().isoformat()
+        }
+        if changed:
+            return FetchResult(url, content, True, response.status_code,
+                               pending_path, size, entry)
+        # Same body as the cached one, whose papers are stored already
+        self._write_atomic(meta_path, json.dumps(entry).encode('utf-8'))
+        return FetchResult(url, content, False, response.status_code, body_path, size)
+
+    def commit(self, result: FetchResult):
+        """
+        Cache a changed body once its papers are stored, so the next fetch
+        revalidates against it; until then every fetch counts as a change
+        """
+        if result.pending is None:
+            return
+        meta_path, body_path = self._cache_paths(result.url)
+        # The body and its meta must not come from two concurrent commits
+        with self._commit_lock:
+            os.replace(result.path, body_path)
+            self._write_atomic(meta_path, json.dumps(result.pending).encode('utf-8'))
+
+    def _stream_body(self, response, body_path: Path, meta: Optional[dict]):
+        """
+        Write a response body to a pending file chunk by chunk; returns
+        (sha256, encoding, size, pending path or None if the body is unchanged)
+        """
+        digest = hashlib.sha256()
+        size = 0
+        f, pending_path = self._new_pending(body_path)
+        try:
+            with f:
+                for chunk in response.iter_content(chunk_size=HTTP_STREAM_CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            pending_path.unlink()
+            raise
+        digest = digest.hexdigest()
+        if meta is not None and meta.get('sha256') == digest:
+            pending_path.unlink()
+            pending_path = None
+        return digest, response.encoding or 'utf-8', size, pending_path
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> CachedFetcher:
+    """Process-wide fetcher shared by all parsers"""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = CachedFetcher()
+        return _fetcher
+
+
+def set_fetcher(fetcher: CachedFetcher):
+    """Replace the process-wide fetcher, e.g. with one using another cache or mirrors"""
+    global _fetcher
+    with _fetcher_lock:
+        _fetcher = fetcher
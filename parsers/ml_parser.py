@@ -1,13 +1,19 @@
 import streamlit as st
-import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 import json
 
-from .base import ConferencePaperParser
+try:
+    import ijson
+except ImportError:  # fall back to decoding the whole file
+    ijson = None
 
+import metrics
+from .base import ConferenceSourceParser
+from .fetcher import FetchResult, get_fetcher
 
-class MLConferencePaperParser(ConferencePaperParser):
+
+class MLConferencePaperParser(ConferenceSourceParser):
     """Parser for ML conferences (ICML, ICLR, NeurIPS)"""
 
     def __init__(self):
@@ -37,37 +43,84 @@ class MLConferencePaperParser(ConferencePaperParser):
             raise ValueError(f"Unsupported venue: {venue}")
         return f"{base_url}/virtual/{year}/poster/{paper_id}"
 
-    def fetch_papers(self, venue: str, year: int) -> list:
+    def get_url(self, venue: str, year: int) -> str:
+        """Get the JSON data URL for the given venue and year"""
+        return self._get_data_url(venue, year)
+
+    def download(self, venue: str, year: int) -> FetchResult:
         """
-        Fetch papers from ML conferences using their JSON API
-        Returns list of paper dictionaries with title, authors, paper_url, and abstract
+        Download the raw orals/posters JSON dump, revalidating any cached copy
+        The dump is streamed to the on-disk cache rather than held in memory
         """
-        try:
-            # Get the JSON data
-            url = self._get_data_url(venue, year)
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
+        return get_fetcher().fetch(self.get_url(venue, year), stream=True)
+
+    def parse(self, content: str, venue: str, year: int) -> list:
+        """Decode a JSON dump and extract paper dictionaries from its results"""
+        data = json.loads(content)
+
+        # Process papers from results
+        papers = []
+
+        # Check if results exist in the JSON
+        if 'results' not in data:
+            raise self._no_results(venue, year)
 
-            # Process papers from results
-            papers = []
+        for paper_data in data['results']:
+            if paper_data:  # Skip empty entries
+                paper_info = self._extract_paper_info(paper_data, venue, year)
+                if paper_info:
+                    papers.append(paper_info)
 
-            # Check if results exist in the JSON
-            if 'results' not in data:
-                st.error(f"No results found in JSON data from {url}")
-                return papers
+        return papers
 
-            for paper_data in data['results']:
+    def iter_papers(self, result: FetchResult, venue: str, year: int):
+        """
+        Yield paper dictionaries while decoding the dump's results one entry
+        at a time, so memory does not grow with the size of the file
+        """
+        if result.path is None:
+            yield from self.parse(result.content, venue, year)
+            return
+
+        with open(result.path, 'rb') as f:
+            if ijson is not None:
+                entries = ijson.items(f, 'results.item', use_float=True)
+            else:
+                data = json.load(f)
+                if 'results' not in data:
+                    raise self._no_results(venue, year)
+                entries = data['results']
+            empty = True
+            for paper_data in entries:
+                empty = False
                 if paper_data:  # Skip empty entries
                     paper_info = self._extract_paper_info(
                         paper_data, venue, year)
                     if paper_info:
-                        papers.append(paper_info)
+                        yield paper_info
+            # No entries streamed: an empty list, or (an error) no results at all
+            if empty and ijson is not None:
+                f.seek(0)
+                if not any(prefix == '' and event == 'map_key' and value == 'results'
+                           for prefix, event, value in ijson.parse(f)):
+                    raise self._no_results(venue, year)
 
-            return papers
+    def _no_results(self, venue: str, year: int) -> ValueError:
+        return ValueError(f"No results found in JSON data from {self.get_url(venue, year)}")
 
+    def fetch_papers(self, venue: str, year: int) -> list:
+        """
+        Fetch papers from ML conferences using their JSON API
+        Returns list of paper dictionaries with title, authors, paper_url, and abstract
+        """
+        try:
+            result = self.download(venue, year)
+            papers = list(self.iter_papers(result, venue, year))
+            self.commit(result)
+            return papers
         except Exception as e:
             st.error(f"Error fetching papers: {str(e)}")
+            metrics.error('fetch', e, venue=venue)
             print(f"Full error: {str(e)}")  # Detailed error for debugging
             return []
 
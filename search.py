@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional
+
+from config import (PAPERS_PER_PAGE, ARXIV_CATEGORIES, SEARCH_SOURCE_TIMEOUTS,
+                    SEARCH_SOURCE_WEIGHTS, SEARCH_FANOUT_WORKERS, DEFAULT_SEARCH_FANOUT_WORKERS)
+from db.dedup import normalize_title
+from parsers.arxiv_parser import ArXivParser
+
+# One pool per source, shared by every search; a source that overruns its
+# budget keeps its worker until it finishes, which also warms that source's
+# own cache, but only ever one of that source's workers
+_fanout_pools = {}  # source name -> (executor, semaphore counting its idle workers)
+_fanout_lock = threading.Lock()
+
+
+class SourceBusy(Exception):
+    """Every worker of a source is still busy with earlier searches"""
+
+
+def _submit(name: str, source: Callable, *args) -> Future:
+    """Run a source on its own pool; fails at once with SourceBusy when no worker is idle"""
+    with _fanout_lock:
+        if name not in _fanout_pools:
+            workers = SEARCH_FANOUT_WORKERS.get(name, DEFAULT_SEARCH_FANOUT_WORKERS)
+            _fanout_pools[name] = (
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"search-{name}"),
+                threading.BoundedSemaphore(workers))
+        pool, idle = _fanout_pools[name]
+
+    if not idle.acquire(blocking=False):
+        future = Future()
+        future.set_exception(SourceBusy(f'all {name} workers are busy'))
+        return future
+
+    def run():
+        try:
+            return source(*args)
+        finally:
+            idle.release()
+    return pool.submit(run)
+
+
+class UnifiedSearch:
+    """
+    One search across the local index and remote sources
+    Sources are queried concurrently, each within its own latency budget;
+    late or failing sources are reported and left out, so a search takes at
+    most as long as the largest budget. Results are merged on per-source
+    scores normalized to [0, 1] and papers found by several sources (same
+    normalized title) are returned once, with the sources that found them
+    """
+
+    def __init__(self, db, arxiv_parser: Optional[ArXivParser] = None,
+                 timeouts: Optional[Dict[str, float]] = None,
+                 weights: Optional[Dict[str, float]] = None):
+        self.db = db
+        self.arxiv_parser = arxiv_parser or ArXivParser()
+        self.timeouts = dict(SEARCH_SOURCE_TIMEOUTS, **(timeouts or {}))
+        self.weights = dict(SEARCH_SOURCE_WEIGHTS, **(weights or {}))
+
+    def _search_local(self, query: str, categories: List[str], limit: int) -> List[Dict[str, Any]]:
+        page = self.db.search_papers_page(query, limit=limit)
+        papers = page['papers']
+        # bm25 ranks are negative, best first; scale them to (0, 1] by the best one
+        best = min((paper['rank'] for paper in papers), default=0) or -1
+        return [dict(paper, score=paper['rank'] / best) for paper in papers]
+
+    def _search_arxiv(self, query: str, categories: List[str], limit: int) -> List[Dict[str, Any]]:
+        papers = self.arxiv_parser.search(query, categories, 0, limit)
+        # The API returns no scores; score by position instead
+        return [{
+            'id': None,
+            'title': paper['title'],
+            'authors': paper['authors'],
+            'venue': 'arXiv',
+            'year': int(paper['submitted'][:4]),
+            'paper_url': paper['link'],
+            'abstract': paper['abstract'],
+            'has_abstract': bool(paper['abstract']),
+            'score': 1 - position / len(papers)
+        } for position, paper in enumerate(papers)]
+
+    def sources(self) -> Dict[str, Callable[[str, List[str], int], List[Dict[str, Any]]]]:
+        return {'local': self._search_local, 'arxiv': self._search_arxiv}
+
+    def search(self, query: str, categories: Optional[List[str]] = None,
+               limit: int = PAPERS_PER_PAGE) -> Dict[str, Any]:
+        """
+        Search every source and merge the results
+        Returns the top papers (each with score and sources) and, per source,
+        its status ('ok', 'timeout', 'busy' or 'error'), result count and latency
+        """
+        categories = list(ARXIV_CATEGORIES if categories is None else categories)
+        start = time.perf_counter()
+        futures = {name: _submit(name, source, query, categories, limit)
+                   for name, source in self.sources().items()}
+
+        results = {}
+        status = {}
+        # Budgets run concurrently: wait for each source until its own deadline
+        for name in sorted(futures, key=lambda name: self.timeouts.get(name, 0)):
+            remaining = start + self.timeouts.get(name, 0) - time.perf_counter()
+            try:
+                results[name] = futures[name].result(timeout=max(remaining, 0))
+                status[name] = {'status': 'ok', 'count': len(results[name])}
+            except FutureTimeout:
+                status[name] = {'status': 'timeout', 'count': 0}
+            except SourceBusy:
+                status[name] = {'status': 'busy', 'count': 0}
+            except Exception as e:
+                status[name] = {'status': 'error', 'count': 0, 'error': str(e)}
+            status[name]['elapsed_ms'] = (time.perf_counter() - start) * 1000
+
+        return {'papers': self._merge(results)[:limit], 'sources': status}
+
+    def _merge(self, results: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Combine per-source results, collapsing papers with the same normalized title"""
+        merged = {}
+        # Sources in the order they were defined, so local records win ties
+        for name in self.sources():
+            weight = self.weights.get(name, 1.0)
+            for paper in results.get(name, ()):
+                key = normalize_title(paper['title'])
+                score = weight * paper['score']
+                if key not in merged:
+                    merged[key] = dict(paper, score=score, sources=[name])
+                elif name not in merged[key]['sources']:
+                    # Found by several sources: keep the first record, add up the evidence
+                    merged[key]['score'] += score
+                    merged[key]['sources'].append(name)
+        return sorted(merged.values(), key=lambda paper: -paper['score'])
@@ -0,0 +1,50 @@
+from pathlib import Path
+
+import pytest
+
+from parsers.acl_parser import ACLPaperParser
+
+pytest.importorskip('lxml')
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / 'benchmarks' / 'fixtures'
+FIXTURES = sorted(FIXTURES_DIR.glob('acl_*.html'))
+
+
+def parse_both(path):
+    parser = ACLPaperParser()
+    html_content = path.read_text(encoding='utf-8')
+    return (parser._parse_papers_lxml(html_content, 'ACL', 2020),
+            parser._parse_papers_bs4(html_content, 'ACL', 2020))
+
+
+@pytest.mark.parametrize('path', FIXTURES, ids=[path.name for path in FIXTURES])
+def test_lxml_matches_beautifulsoup(path):
+    fast, reference = parse_both(path)
+    assert fast
+    assert fast == reference
+
+
+def test_papers_without_abstracts():
+    papers, _ = parse_both(FIXTURES_DIR / 'acl_event.html')
+    assert [paper['abstract'] == '' for paper in papers] == [True, False, False, False, True]
+    assert papers[4]['paper_url'] is None
+    assert papers[3]['title'] == 'Coach: A Coarse-to-Fine Approach for Cross-domain Slot Filling'
+
+
+def test_unusual_abstract_ids():
+    papers, _ = parse_both(FIXTURES_DIR / 'acl_unusual_ids.html')
+    by_title = {paper['title']: paper for paper in papers}
+    assert len(papers) == 4  # the entry without a title is skipped
+
+    dotted = by_title['Dots in Abstract Ids: A Relative PDF Link']
+    assert dotted['abstract'].startswith('An abstract card placed before its entry')
+    assert dotted['paper_url'] == 'https://aclanthology.org/2023.findings-emnlp.1.pdf'
+    assert dotted['authors'] == 'Zoë O’Brien, José García'
+
+    versioned = by_title['Underscores, Versions and Whitespace']
+    assert versioned['abstract'] == 'An abstract with markup, an ampersand & a non-breaking\xa0space.'
+    assert versioned['authors'] == 'Li Wei'
+
+    assert by_title['An Abs Badge Pointing at a Missing Card']['abstract'] == ''
+    bare = by_title['No PDF, No Authors and No Abstract']
+    assert (bare['paper_url'], bare['authors'], bare['abstract']) == (None, '', '')
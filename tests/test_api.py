@@ -0,0 +1,147 @@
+import json
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode
+
+from tornado.testing import AsyncHTTPTestCase
+
+from api import make_app
+from config import API_MAX_LIMIT, PAPERS_PER_PAGE
+from db.connection import ConnectionManager
+from db.paper_db import PaperDB
+from db.query_cache import QueryCache
+from db.suggest import Suggester
+
+
+class APITestCase(AsyncHTTPTestCase):
+    """The API over a temporary database of PAPERS papers on translation"""
+
+    # More than a client may ask for at once
+    PAPERS = API_MAX_LIMIT + 10
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.db = PaperDB(self.directory / 'papers.db')
+        self.db._store_papers('ACL', 2020, [
+            {'title': f'Neural translation model number {number}', 'authors': 'Ada Lovelace',
+             'abstract': f'Translation experiments, part {number}.'}
+            for number in range(self.PAPERS)])
+        self.executor = ThreadPoolExecutor(2)
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.executor.shutdown()
+        for registry in (Suggester, QueryCache, ConnectionManager):
+            registry.discard(self.db.db_path)
+        shutil.rmtree(self.directory)
+
+    def get_app(self):
+        return make_app(self.db, self.executor)
+
+    def get_json(self, path, **kwargs):
+        response = self.fetch(path, **kwargs)
+        return response, json.loads(response.body) if response.body else None
+
+
+class ErrorStatusTest(APITestCase):
+
+    def fail_search(self, message):
+        def search_papers_page(*args, **kwargs):
+            raise sqlite3.OperationalError(message)
+        self.db.search_papers_page = search_papers_page
+
+    def test_locked_database_is_unavailable(self):
+        self.fail_search('database is locked')
+        response, body = self.get_json('/search?q=translation')
+        self.assertEqual(response.code, 503)
+        self.assertIn('database is locked', body['error'])
+
+    def test_other_database_errors_are_the_servers(self):
+        self.fail_search('disk I/O error')
+        response, body = self.get_json('/search?q=translation')
+        self.assertEqual(response.code, 500)
+
+    def test_unusual_queries_are_searched(self):
+        for query in ('NEAR(', '"unterminated', 'c++', 'title:', '-', 'AND OR'):
+            response, body = self.get_json('/search?' + urlencode({'q': query}))
+            self.assertEqual(response.code, 200, query)
+
+
+class SearchTest(APITestCase):
+
+    def test_conditional_get(self):
+        response = self.fetch('/search?q=translation')
+        self.assertEqual(response.code, 200)
+        etag = response.headers['Etag']
+
+        response = self.fetch('/search?q=translation', headers={'If-None-Match': etag})
+        self.assertEqual(response.code, 304)
+        # The version covers the request too
+        response = self.fetch('/search?q=model', headers={'If-None-Match': etag})
+        self.assertEqual(response.code, 200)
+
+        # New papers make a new version
+        self.db._store_papers('EMNLP', 2021, [{'title': 'Translation once more',
+                                                'authors': 'Alan Turing', 'abstract': ''}])
+        response = self.fetch('/search?q=translation', headers={'If-None-Match': etag})
+        self.assertEqual(response.code, 200)
+        self.assertNotEqual(response.headers['Etag'], etag)
+
+    def test_limit_is_clamped(self):
+        for limit, expected in (('', PAPERS_PER_PAGE), ('0', 1), ('-5', 1),
+                                ('3', 3), (str(API_MAX_LIMIT * 10), API_MAX_LIMIT)):
+            response, body = self.get_json(f'/search?q=translation&limit={limit}')
+            self.assertEqual(len(body['papers']), expected, limit)
+
+    def test_invalid_arguments(self):
+        for path in ('/search?q=translation&limit=many', '/search?q=translation&year=last',
+                     '/search?q=translation&cursor=1.5', '/search?q=translation&cursor=a,b',
+                     '/search?q=translation&cursor=-1.5,3,elsewhere', '/search'):
+            response, body = self.get_json(path)
+            self.assertEqual(response.code, 400, path)
+            self.assertIn('error', body)
+
+    def test_cursor_round_trip(self):
+        titles = []
+        cursor = None
+        for _ in range(self.PAPERS):
+            path = '/search?' + urlencode(dict({'q': 'translation', 'limit': 7},
+                                               **({'cursor': cursor} if cursor else {})))
+            response, body = self.get_json(path)
+            self.assertEqual(response.code, 200)
+            titles += [paper['title'] for paper in body['papers']]
+            if body['next_cursor'] is None:
+                break
+            cursor = ','.join(str(part) for part in body['next_cursor'])
+
+        self.assertEqual(len(titles), self.PAPERS)
+        self.assertEqual(len(set(titles)), self.PAPERS)
+        response, body = self.get_json(f'/search?q=translation&limit={API_MAX_LIMIT}')
+        self.assertEqual([paper['title'] for paper in body['papers']], titles[:API_MAX_LIMIT])
+
+
+class PaperTest(APITestCase):
+
+    def test_abstract(self):
+        response, body = self.get_json('/papers/1/abstract')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(body, {'id': 1, 'abstract': 'Translation experiments, part 0.'})
+
+    def test_missing_paper(self):
+        response, body = self.get_json('/papers/999999/abstract')
+        self.assertEqual(response.code, 404)
+        self.assertEqual(body, {'error': 'Not Found'})
+
+    def test_count(self):
+        response, body = self.get_json('/count')
+        self.assertEqual(body, {'papers': self.PAPERS})
+
+    def test_suggest_k_is_clamped(self):
+        response, body = self.get_json(f'/suggest?q=tr&k={API_MAX_LIMIT * 10}')
+        self.assertEqual(response.code, 200)
+        self.assertLessEqual(len(body['suggestions']), API_MAX_LIMIT)
+        self.assertEqual(body['suggestions'][0]['text'], 'translation')
@@ -0,0 +1,125 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from db.arxiv_mirror import ArXivMirror
+from db.paper_db import PaperDB
+from parsers.arxiv_feed import FileSource
+
+FIXTURES = Path(__file__).resolve().parent.parent / 'benchmarks' / 'fixtures' / 'arxiv_feed'
+
+NEW_PAGE = '''{"id": "2403.04040", "authors": "Kyunghyun Cho", "title": "Retrieval for Long Documents", \
+"categories": "cs.CL", "abstract": "We retrieve passages from long documents.", "update_date": "2024-03-05"}
+'''
+
+
+class InterruptedSource(FileSource):
+    """A FileSource whose harvest fails while reading the page after the first `pages`"""
+
+    def __init__(self, path, pages):
+        super().__init__(path)
+        self.limit = pages
+        self.requested = []
+
+    def pages(self, since=None, cursor=None):
+        self.requested.append((since, cursor))
+        for number, (records, name) in enumerate(super().pages(since, cursor)):
+            if number == self.limit:
+                raise ConnectionError('connection reset')
+            yield records, name
+
+
+@pytest.fixture
+def feed(tmp_path):
+    return Path(shutil.copytree(FIXTURES, tmp_path / 'feed'))
+
+
+@pytest.fixture
+def db(tmp_path):
+    return PaperDB(tmp_path / 'papers.db')
+
+
+def stored(db):
+    """paper_url -> (title, authors in order, categories, last_updated)"""
+    with db.connections.reader() as conn:
+        return {url: (title, [row[0] for row in conn.execute('''
+                    SELECT a.name FROM paper_authors pa JOIN authors a ON a.id = pa.author_id
+                    WHERE pa.paper_id = ? ORDER BY pa.position''', (paper_id,))],
+                      sorted(row[0] for row in conn.execute(
+                          'SELECT category FROM paper_categories WHERE paper_id = ?', (paper_id,))),
+                      last_updated)
+                for paper_id, title, url, last_updated in conn.execute(
+                    "SELECT id, title, paper_url, last_updated FROM papers WHERE venue = 'arXiv'")}
+
+
+def test_harvest_stores_mirrored_records(db, feed):
+    mirror = ArXivMirror(db)
+    source = FileSource(feed)
+    assert mirror.harvest(source) == {'pages': 4, 'records': 6, 'changed': 6}
+
+    papers = stored(db)
+    # Out of the mirrored categories: math.DG/cs.SC and quant-ph
+    assert sorted(papers) == ['https://arxiv.org/abs/2402.01234', 'https://arxiv.org/abs/2402.05678',
+                              'https://arxiv.org/abs/2403.00042', 'https://arxiv.org/abs/2403.01010',
+                              'https://arxiv.org/abs/2403.02020']
+    title, authors, categories, _ = papers['https://arxiv.org/abs/2402.01234']
+    assert title == 'Cross-domain Slot Filling with Coarse-to-Fine Prototypes'
+    assert authors == ['Zihan Liu', 'Pascale Fung']
+    assert categories == ['cs.AI', 'cs.CL']
+    # The Atom page revises the OAI record in place
+    title, authors, categories, _ = papers['https://arxiv.org/abs/2402.05678']
+    assert title == 'Latent Prompt Categories for Depression Screening Interviews'
+    assert authors == ['Alex Rinaldi', 'Jean Fox Tree', 'Snigdha Chaturvedi']
+    assert categories == ['cs.LG', 'stat.ML']
+    assert stored(db)['https://arxiv.org/abs/2403.02020'][1:3] == \
+        (['Joyce Chai', 'Natalie Schluter'], ['cs.AI', 'cs.RO'])
+
+    state = mirror.get_state(source.name)
+    assert (state['datestamp'], state['cursor'], state['record_count']) == ('2024-03-04', None, 6)
+    assert db.search_papers_page('slot filling', categories=['cs.CL'])['total'] == 1
+
+
+def test_harvest_resumes_from_the_newest_datestamp(db, feed):
+    mirror = ArXivMirror(db)
+    mirror.harvest(FileSource(feed))
+    before = stored(db)
+
+    # Only records from the last datestamp on are read again, and they are unchanged
+    assert mirror.harvest(FileSource(feed)) == {'pages': 4, 'records': 1, 'changed': 0}
+    assert stored(db) == before
+
+    (feed / '0005_snapshot.jsonl').write_text(NEW_PAGE)
+    assert mirror.harvest(FileSource(feed)) == {'pages': 5, 'records': 2, 'changed': 1}
+    after = stored(db)
+    assert {url: after[url] for url in before} == before
+    assert after['https://arxiv.org/abs/2403.04040'][1:3] == (['Kyunghyun Cho'], ['cs.CL'])
+    assert mirror.get_state(FileSource(feed).name)['datestamp'] == '2024-03-05'
+
+
+def test_interrupted_harvest_resumes_after_the_last_stored_page(db, feed):
+    mirror = ArXivMirror(db)
+    source = InterruptedSource(feed, pages=2)
+    with pytest.raises(ConnectionError):
+        mirror.harvest(source)
+    assert sorted(stored(db)) == ['https://arxiv.org/abs/2402.01234', 'https://arxiv.org/abs/2402.05678',
+                                  'https://arxiv.org/abs/2403.00042']
+    state = mirror.get_state(source.name)
+    assert (state['datestamp'], state['cursor'], state['max_datestamp']) == \
+        (None, '0002_oai.xml', '2024-03-02')
+    before = stored(db)
+
+    # The stored pages are skipped, not stored again, and none after them is missed
+    source = InterruptedSource(feed, pages=None)
+    assert mirror.harvest(source) == {'pages': 2, 'records': 3, 'changed': 3}
+    assert source.requested == [(None, '0002_oai.xml')]
+    after = stored(db)
+    assert len(after) == 5
+    assert after['https://arxiv.org/abs/2402.01234'] == before['https://arxiv.org/abs/2402.01234']
+    assert after['https://arxiv.org/abs/2403.00042'] == before['https://arxiv.org/abs/2403.00042']
+    assert after['https://arxiv.org/abs/2402.05678'][0] == \
+        'Latent Prompt Categories for Depression Screening Interviews'
+
+    # The interrupted harvest's datestamps count towards the next one
+    state = mirror.get_state(source.name)
+    assert (state['datestamp'], state['cursor'], state['record_count']) == ('2024-03-04', None, 6)
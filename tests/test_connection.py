@@ -0,0 +1,31 @@
+import sqlite3
+
+import pytest
+
+from db.connection import ConnectionManager
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'papers.db'
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE papers (id INTEGER PRIMARY KEY, title TEXT)')
+    conn.close()
+    yield path
+    ConnectionManager.discard(path)
+
+
+def test_managers_are_shared_per_file(db_path):
+    assert ConnectionManager.for_path(db_path) is ConnectionManager.for_path(db_path.parent / '.' / db_path.name)
+
+
+@pytest.mark.parametrize('first, second', [(False, True), (True, False)])
+def test_other_immutable_setting_is_refused(db_path, first, second):
+    manager = ConnectionManager.for_path(db_path, immutable=first)
+    with pytest.raises(ValueError, match='already open'):
+        ConnectionManager.for_path(db_path, immutable=second)
+    assert ConnectionManager.for_path(db_path, immutable=first) is manager
+
+    # Once discarded, the file can be opened the other way
+    ConnectionManager.discard(db_path)
+    assert ConnectionManager.for_path(db_path, immutable=second).immutable == second
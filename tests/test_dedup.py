@@ -0,0 +1,102 @@
+import pytest
+
+import db.dedup
+from config import DEDUP_BANDS
+from db.dedup import Deduplicator
+from db.paper_db import PaperDB
+
+PAPER = {'title': 'Cross-lingual Transfer for Low-Resource Dependency Parsing',
+         'authors': 'Ada Lovelace, Alan Turing',
+         'abstract': 'We study cross-lingual transfer for dependency parsing of low-resource '
+                     'languages with multilingual encoders and report gains on twelve treebanks.'}
+OTHERS = [{'title': title, 'authors': 'Someone', 'abstract': ''} for title in (
+    'Speech Synthesis with Diffusion Models', 'Graph Neural Networks for Molecules',
+    'Question Answering over Knowledge Bases', 'Efficient Transformers for Long Documents',
+    'Image Segmentation in Medical Scans', 'Reinforcement Learning from Human Feedback',
+    'Topic Models for Historical Newspapers', 'Sign Language Recognition from Video')]
+
+
+@pytest.fixture
+def papers(tmp_path):
+    return PaperDB(tmp_path / 'papers.db')
+
+
+def clusters(papers):
+    with papers.connections.reader() as conn:
+        return sorted((venue, canonical) for venue, canonical in conn.execute('''
+            SELECT p.venue, q.venue FROM paper_clusters c
+            JOIN papers p ON p.id = c.paper_id JOIN papers q ON q.id = c.canonical_id'''))
+
+
+def bands_of(papers, title):
+    with papers.connections.reader() as conn:
+        return {key for (key,) in conn.execute('''
+            SELECT b.band_key FROM paper_bands b JOIN papers p ON p.id = b.paper_id
+            WHERE p.title = ?''', (title,))}
+
+
+@pytest.fixture
+def banded(monkeypatch):
+    """Number of signatures each update cuts into bands"""
+    counts = []
+    band_keys = db.dedup._band_keys
+
+    def counting(signatures):
+        counts.append(len(signatures))
+        return band_keys(signatures)
+
+    monkeypatch.setattr(db.dedup, '_band_keys', counting)
+    return counts
+
+
+def test_links_duplicates_stored_by_later_updates(papers, banded):
+    papers._store_papers('arXiv', 2020, [dict(PAPER, title=PAPER['title'].lower() + '.')] + OTHERS)
+    assert Deduplicator(papers).update()['signed'] == 9
+    assert clusters(papers) == []
+
+    papers._store_papers('ACL', 2020, [PAPER])
+    banded.clear()
+    assert Deduplicator(papers).update() == {'signed': 1, 'pairs': 1, 'clusters': 1}
+    # Only the new paper is banded; the stored ones are looked up in paper_bands
+    assert banded == [1]
+    assert clusters(papers) == [('arXiv', 'ACL')]
+
+    papers._store_papers('Findings', 2020, [PAPER])
+    assert Deduplicator(papers).update() == {'signed': 1, 'pairs': 2, 'clusters': 1}
+    assert clusters(papers) == [('Findings', 'ACL'), ('arXiv', 'ACL')]
+    assert Deduplicator(papers).update() == {'signed': 0, 'pairs': 0, 'clusters': 0}
+
+
+def test_papers_without_abstracts_only_join_title_buckets(papers):
+    papers._store_papers('ACL', 2020, [PAPER, dict(PAPER, title='Something else entirely',
+                                                  abstract='')])
+    Deduplicator(papers).update()
+    assert len(bands_of(papers, PAPER['title'])) == 2 * DEDUP_BANDS
+    assert len(bands_of(papers, 'Something else entirely')) == DEDUP_BANDS
+
+
+def test_changed_papers_leave_their_old_buckets(papers):
+    papers._store_papers('ACL', 2020, [PAPER])
+    Deduplicator(papers).update()
+    before = bands_of(papers, PAPER['title'])
+
+    abstract = 'A completely different abstract about speech synthesis for many voices and accents.'
+    papers._store_papers('ACL', 2020, [dict(PAPER, abstract=abstract)])
+    assert Deduplicator(papers).update()['signed'] == 1
+    after = bands_of(papers, PAPER['title'])
+    assert len(after) == 2 * DEDUP_BANDS
+    # Same title bands, new abstract bands
+    assert len(before & after) == DEDUP_BANDS
+
+
+def test_rebuild_matches_incremental_updates(papers):
+    papers._store_papers('arXiv', 2020, [dict(PAPER, title=PAPER['title'] + '!')] + OTHERS)
+    Deduplicator(papers).update()
+    papers._store_papers('ACL', 2020, [PAPER])
+    papers._store_papers('Findings', 2020, [PAPER])
+    Deduplicator(papers).update()
+    incremental = clusters(papers)
+
+    stats = Deduplicator(papers).rebuild()
+    assert stats['signed'] == 11
+    assert clusters(papers) == incremental == [('Findings', 'ACL'), ('arXiv', 'ACL')]
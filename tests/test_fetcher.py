@@ -0,0 +1,127 @@
+import hashlib
+import os
+import time
+
+import parsers.fetcher
+from parsers.fetcher import CachedFetcher
+
+URL = 'http://example.org/events/acl-2020/'
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b'', etag=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = {'ETag': etag} if etag else {}
+        self.encoding = 'utf-8'
+        self.apparent_encoding = 'utf-8'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+
+class FakeSession:
+    """Serves one body with an ETag, answering 304 to requests that send it back"""
+
+    def __init__(self, body):
+        self.body = body
+
+    def get(self, url, headers, timeout, stream=False):
+        etag = hashlib.sha256(self.body).hexdigest()
+        if headers.get('If-None-Match') == etag:
+            return FakeResponse(304)
+        return FakeResponse(200, self.body, etag)
+
+
+def make_fetcher(tmp_path, body):
+    fetcher = CachedFetcher(tmp_path / 'cache', mirrors={})
+    fetcher.session = FakeSession(body)
+    return fetcher
+
+
+def test_changed_body_is_cached_only_once_committed(tmp_path):
+    fetcher = make_fetcher(tmp_path, b'<html>v1</html>')
+    first = fetcher.fetch(URL)
+    assert first.changed and first.content == '<html>v1</html>'
+
+    # Not committed (say the parse failed): the next crawl sees a change again
+    second = fetcher.fetch(URL)
+    assert second.changed and second.status == 200
+
+    fetcher.commit(second)
+    third = fetcher.fetch(URL)
+    assert not third.changed and third.status == 304
+    assert third.content == '<html>v1</html>'
+
+
+def test_uncommitted_change_keeps_the_previous_copy(tmp_path):
+    fetcher = make_fetcher(tmp_path, b'<html>v1</html>')
+    fetcher.commit(fetcher.fetch(URL))
+
+    fetcher.session.body = b'<html>v2</html>'
+    assert fetcher.fetch(URL).changed
+
+    # The server goes back to v1: its 304 still matches the cached copy
+    fetcher.session.body = b'<html>v1</html>'
+    result = fetcher.fetch(URL)
+    assert result.status == 304 and result.content == '<html>v1</html>'
+
+
+def test_streamed_body_is_committed_with_its_meta(tmp_path):
+    fetcher = make_fetcher(tmp_path, b'{"results": []}')
+    result = fetcher.fetch(URL, stream=True)
+    assert result.changed and result.path.read_bytes() == b'{"results": []}'
+
+    fetcher.commit(result)
+    cached = fetcher.fetch(URL, stream=True)
+    assert not cached.changed and cached.path.read_bytes() == b'{"results": []}'
+
+
+def test_concurrent_fetches_keep_their_own_pending_body(tmp_path):
+    fetcher = make_fetcher(tmp_path, b'<html>v1</html>')
+    first = fetcher.fetch(URL)
+    fetcher.session.body = b'<html>v2</html>'
+    second = fetcher.fetch(URL, stream=True)
+    assert first.path != second.path
+    assert first.path.read_bytes() == b'<html>v1</html>'
+
+    # Whichever commits last is cached, with its own meta
+    fetcher.commit(second)
+    fetcher.commit(first)
+    assert not list(fetcher.cache_dir.glob('*.pending'))
+    fetcher.session.body = b'<html>v1</html>'
+    cached = fetcher.fetch(URL)
+    assert not cached.changed and cached.status == 304 and cached.content == '<html>v1</html>'
+
+
+def test_unchanged_streamed_body_leaves_no_pending_file(tmp_path):
+    fetcher = make_fetcher(tmp_path, b'{"results": []}')
+    fetcher.commit(fetcher.fetch(URL, stream=True))
+    fetcher.session.get = lambda url, headers, timeout, stream=False: \
+        FakeResponse(200, b'{"results": []}')
+    assert not fetcher.fetch(URL, stream=True).changed
+    assert sorted(path.suffix for path in fetcher.cache_dir.iterdir()) == ['.body', '.json']
+
+
+def test_uncommitted_pending_bodies_are_swept(tmp_path, monkeypatch):
+    fetcher = make_fetcher(tmp_path, b'<html>v1</html>')
+    abandoned = fetcher.fetch(URL).path
+    recent = fetcher.fetch(URL).path
+    stale = time.time() - parsers.fetcher.HTTP_PENDING_MAX_AGE - 60
+    os.utime(abandoned, (stale, stale))
+
+    result = fetcher.fetch(URL)
+    assert not abandoned.exists()
+    assert recent.exists()
+    fetcher.commit(result)
+    assert sorted(fetcher.cache_dir.glob('*.pending')) == [recent]
@@ -0,0 +1,143 @@
+import sys
+import threading
+import types
+
+import pytest
+
+import metrics
+from config import INGEST_QUEUE_BATCHES, WRITE_BATCH_SIZE
+from db.ingest import IngestionEngine
+
+# Enough batches per venue-year to fill the writer queue many times over
+BATCHES = 4 * INGEST_QUEUE_BATCHES
+# Venue-year whose download fails
+FAILING_YEAR = 1999
+
+
+class FakeResult:
+    changed = True
+    size = 0
+
+    def __init__(self, venue, year):
+        self.venue = venue
+        self.year = year
+
+
+class FakeParser:
+    def __init__(self, commits):
+        self.commits = commits
+
+    def get_url(self, venue, year):
+        return f'http://example.org/{venue}/{year}'
+
+    def download(self, venue, year):
+        if year == FAILING_YEAR:
+            raise ConnectionError('connection reset by peer')
+        return FakeResult(venue, year)
+
+    def iter_papers(self, result, venue, year):
+        for number in range(BATCHES * WRITE_BATCH_SIZE):
+            yield {'title': f'{venue} {year} {number}'}
+
+    def commit(self, result):
+        self.commits.append((result.venue, result.year))
+
+
+class FakeDB:
+    def __init__(self, record_error=None, store_error_year=None):
+        self.record_error = record_error
+        self.store_error_year = store_error_year
+        self.stored = 0
+        self.crawls = []
+
+    def has_papers(self, venue, year):
+        return False
+
+    def _store_papers(self, venue, year, papers):
+        if year == self.store_error_year:
+            raise RuntimeError('disk I/O error')
+        self.stored += len(papers)
+        return len(papers)
+
+    def _record_crawl(self, venue, year, changed=False, failed=False):
+        if self.record_error is not None:
+            raise self.record_error
+        self.crawls.append((venue, year, changed, failed))
+
+
+@pytest.fixture(autouse=True)
+def commits(monkeypatch):
+    # utils pulls in Streamlit; the engine only needs its parser lookup
+    commits = []
+    monkeypatch.setitem(sys.modules, 'utils',
+                        types.SimpleNamespace(get_parser_for_venue=lambda venue: FakeParser(commits)))
+    return commits
+
+
+def run_with_timeout(engine, jobs, progress_callback=None, timeout=60):
+    """run() in a thread, failing the test instead of hanging if it never returns"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome['stats'] = engine.run(jobs, progress_callback)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'IngestionEngine.run() deadlocked'
+    return outcome
+
+
+JOBS = [('ACL', year) for year in range(2010, 2016)]
+
+
+def test_run_stores_every_batch(commits):
+    db = FakeDB()
+    outcome = run_with_timeout(IngestionEngine(db), JOBS)
+    assert outcome['stats']['papers'] == len(JOBS) * BATCHES * WRITE_BATCH_SIZE
+    assert sorted(db.crawls) == [('ACL', year, True, False) for _, year in JOBS]
+    assert sorted(commits) == JOBS
+
+
+def test_failed_write_keeps_the_download_uncached(commits):
+    db = FakeDB(store_error_year=2012)
+    outcome = run_with_timeout(IngestionEngine(db), JOBS)
+    assert outcome['stats']['failed'] == 1
+    assert ('ACL', 2012, False, True) in db.crawls
+    assert sorted(commits) == [job for job in JOBS if job != ('ACL', 2012)]
+
+
+def test_crawl_state_errors_do_not_stop_the_run():
+    db = FakeDB(record_error=RuntimeError('database is locked'))
+    outcome = run_with_timeout(IngestionEngine(db), JOBS)
+    assert outcome['stats']['papers'] == len(JOBS) * BATCHES * WRITE_BATCH_SIZE
+    assert outcome['stats']['failed'] == 0
+
+
+def test_writer_error_abandons_the_run_without_deadlock():
+    def progress(done, total):
+        raise RuntimeError('progress display went away')
+
+    outcome = run_with_timeout(IngestionEngine(FakeDB()), JOBS, progress)
+    assert isinstance(outcome['error'], RuntimeError)
+
+
+@pytest.fixture
+def collected_metrics():
+    metrics.registry.reset()
+    metrics.enable(dump_path=None)
+    yield metrics.registry
+    metrics.disable()
+    metrics.registry.reset()
+
+
+def test_failed_fetch_is_counted_once(collected_metrics):
+    outcome = run_with_timeout(IngestionEngine(FakeDB()), JOBS + [('ACL', FAILING_YEAR)])
+    assert outcome['stats']['failed'] == 1
+    failures = [counter for counter in collected_metrics.snapshot()['counters']
+                if counter['name'] == 'failures']
+    assert failures == [{'name': 'failures', 'labels': {'stage': 'fetch', 'venue': 'ACL'}, 'value': 1}]
+    assert len(collected_metrics.snapshot()['errors']) == 1
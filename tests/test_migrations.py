@@ -0,0 +1,94 @@
+import sqlite3
+
+from db.connection import ConnectionManager
+from db.migrations import SCHEMA_VERSION
+from db.paper_db import PaperDB
+
+# The schema of the first release, which had no user_version
+BASELINE_SCHEMA = '''
+    CREATE TABLE papers (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        authors TEXT NOT NULL,
+        venue TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        paper_url TEXT,
+        abstract TEXT,
+        last_updated TIMESTAMP,
+        UNIQUE(title, venue, year)
+    );
+    CREATE TABLE initialization_status (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        initialized BOOLEAN NOT NULL,
+        last_updated TIMESTAMP
+    );
+    CREATE VIRTUAL TABLE papers_search
+    USING FTS5(title, abstract, authors, content='papers', content_rowid='id');
+'''
+
+BASELINE_PAPERS = [
+    # Venues were stored as "{venue}-{year}"
+    ('Parsers for Low-Resource Languages', 'Ada Lovelace, Alan Turing', 'ACL-2020', 2020,
+     'http://example.org/1', 'We train dependency parsers.'),
+    ('Translating Speech', 'Grace Hopper', 'EMNLP-2021', 2021, None, ''),
+    ('Scaling Laws', 'Alan Turing', 'NEURIPS-2021', 2021, 'http://example.org/3', 'Bigger is better.'),
+]
+
+
+def make_baseline(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany('INSERT INTO papers (title, authors, venue, year, paper_url, abstract, last_updated)'
+                     " VALUES (?, ?, ?, ?, ?, ?, '2024-01-01T00:00:00')", BASELINE_PAPERS)
+    conn.execute("INSERT INTO papers_search(papers_search) VALUES('rebuild')")
+    conn.execute("INSERT INTO initialization_status VALUES (1, 1, '2024-01-01T00:00:00')")
+    conn.commit()
+    conn.close()
+
+
+def test_migrate_from_baseline(tmp_path):
+    path = tmp_path / 'papers.db'
+    make_baseline(path)
+
+    db = PaperDB(path)
+    with db.connections.reader() as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+        assert [tuple(row) for row in conn.execute('SELECT venue, year FROM papers ORDER BY id')] == \
+            [('ACL', 2020), ('EMNLP', 2021), ('NEURIPS', 2021)]
+        assert [row[0] for row in conn.execute('''
+            SELECT a.name FROM paper_authors pa JOIN authors a ON a.id = pa.author_id
+            WHERE pa.paper_id = 1 ORDER BY pa.position''')] == ['Ada Lovelace', 'Alan Turing']
+        assert sorted(tuple(row) for row in conn.execute('SELECT venue, year, paper_count FROM venue_year_stats')) == \
+            [('ACL', 2020, 1), ('EMNLP', 2021, 1), ('NEURIPS', 2021, 1)]
+    with db.connections.writer() as conn:
+        conn.execute("INSERT INTO papers_search(papers_search) VALUES('integrity-check')")
+
+    assert not db.needs_initialization()
+    assert db.get_paper_count() == 3
+    # The rebuilt index stems words and indexes prefixes
+    assert [paper['title'] for paper in db.search_papers_page('translation')['papers']] == \
+        ['Translating Speech']
+    assert db.search_papers_page('tur*')['total'] == 2
+    assert db.search_papers_page('venue:acl year:2020')['total'] == 1
+
+    # New papers reach the index and the stats through the triggers
+    db._store_papers('ACL', 2020, [{'title': 'Parser Evaluation', 'authors': 'Ada Lovelace', 'abstract': ''}])
+    assert db.search_papers_page('parser')['total'] == 2
+    assert db.get_paper_count() == 4
+
+
+def test_migrate_is_idempotent(tmp_path):
+    path = tmp_path / 'papers.db'
+    make_baseline(path)
+    PaperDB(path).connections.close()
+    conn = sqlite3.connect(path)
+    schema = conn.execute('SELECT type, name, sql FROM sqlite_master ORDER BY name').fetchall()
+    conn.close()
+    ConnectionManager.discard(path)
+
+    # A second start finds nothing to migrate
+    db = PaperDB(path)
+    with db.connections.reader() as conn:
+        assert [tuple(row) for row in conn.execute(
+            'SELECT type, name, sql FROM sqlite_master ORDER BY name')] == schema
+    assert db.get_paper_count() == 3
@@ -0,0 +1,92 @@
+import json
+import sys
+import threading
+import types
+from pathlib import Path
+
+import pytest
+
+import parsers.ml_parser
+from db.ingest import IngestionEngine
+from parsers.fetcher import FetchResult
+from parsers.ml_parser import MLConferencePaperParser
+
+DUMP = Path(__file__).resolve().parent.parent / 'benchmarks' / 'fixtures' / 'ml_orals_posters.json'
+
+
+@pytest.fixture(params=['ijson', 'json'])
+def decoder(request, monkeypatch):
+    """Run each test with the streaming decoder and with the json fallback"""
+    if request.param == 'ijson':
+        pytest.importorskip('ijson')
+    else:
+        monkeypatch.setattr(parsers.ml_parser, 'ijson', None)
+    return request.param
+
+
+class CommitRecordingParser(MLConferencePaperParser):
+    """Reads a local dump instead of downloading it and records what is committed"""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.committed = []
+
+    def download(self, venue, year):
+        return FetchResult(self.get_url(venue, year), None, True, 200, self.path)
+
+    def commit(self, result):
+        self.committed.append(result)
+
+
+def write_dump(tmp_path, data):
+    path = tmp_path / 'dump.json'
+    path.write_text(json.dumps(data))
+    return path
+
+
+def test_streams_every_paper(decoder):
+    parser = CommitRecordingParser(DUMP)
+    papers = list(parser.iter_papers(parser.download('NEURIPS', 2023), 'NEURIPS', 2023))
+    assert papers == parser.parse(DUMP.read_text(), 'NEURIPS', 2023)
+    assert len(papers) == 3
+
+
+def test_empty_results_are_no_error(decoder, tmp_path):
+    parser = CommitRecordingParser(write_dump(tmp_path, {'count': 0, 'results': []}))
+    assert parser.fetch_papers('ICML', 2024) == []
+    assert len(parser.committed) == 1
+
+
+@pytest.mark.parametrize('data', [{'count': 0, 'detail': 'Not found.'}, []])
+def test_missing_results_are_an_error(decoder, tmp_path, data):
+    parser = CommitRecordingParser(write_dump(tmp_path, data))
+    with pytest.raises(ValueError, match='No results found'):
+        list(parser.iter_papers(parser.download('ICML', 2024), 'ICML', 2024))
+    # Reported, and the download is not cached, so the next crawl tries it again
+    assert parser.fetch_papers('ICML', 2024) == []
+    assert parser.committed == []
+
+
+class FakeDB:
+    def has_papers(self, venue, year):
+        return False
+
+    def _store_papers(self, venue, year, papers):
+        return len(papers)
+
+    def _record_crawl(self, venue, year, changed=False, failed=False):
+        pass
+
+
+def test_ingestion_does_not_commit_a_dump_without_results(decoder, tmp_path, monkeypatch):
+    parser = CommitRecordingParser(write_dump(tmp_path, {'detail': 'Not found.'}))
+    monkeypatch.setitem(sys.modules, 'utils',
+                        types.SimpleNamespace(get_parser_for_venue=lambda venue: parser))
+    stats = {}
+    thread = threading.Thread(target=lambda: stats.update(IngestionEngine(FakeDB()).run([('ICML', 2024)])),
+                              daemon=True)
+    thread.start()
+    thread.join(60)
+    assert stats['failed'] == 1
+    assert parser.committed == []
@@ -0,0 +1,102 @@
+import sqlite3
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+import db.paper_db
+from db.paper_db import PaperDB
+
+SHARED = {'title': 'Cross-lingual transfer for low-resource dependency parsing',
+          'authors': 'Ada Lovelace, Alan Turing', 'paper_url': 'http://example.org/shared',
+          'abstract': 'We study cross-lingual transfer for dependency parsing of '
+                      'low-resource languages with multilingual encoders.'}
+
+
+class FakeResult:
+    changed = True
+    size = 0
+
+
+class FakeParser:
+    def get_url(self, venue, year):
+        return f'http://example.org/{venue}/{year}'
+
+    def download(self, venue, year):
+        return FakeResult()
+
+    def iter_papers(self, result, venue, year):
+        if venue in ('ACL', 'Findings'):
+            yield dict(SHARED, paper_url=f'http://example.org/{venue}')
+            yield {'title': f'Something only {venue} published this year', 'authors': 'Someone',
+                   'paper_url': None, 'abstract': ''}
+
+    def commit(self, result):
+        pass
+
+
+class FakeProgressBar:
+    def progress(self, value, text=None):
+        pass
+
+
+@pytest.fixture
+def fake_parsers(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'utils',
+                        types.SimpleNamespace(get_parser_for_venue=lambda venue: FakeParser()))
+    monkeypatch.setattr(db.paper_db, 'INGEST_YEARS', range(2020, 2021))
+
+
+def test_initial_load_links_duplicates(tmp_path, fake_parsers):
+    papers = PaperDB(tmp_path / 'papers.db')
+    assert papers.load_initial_papers(FakeProgressBar())
+    assert papers.get_paper_count() == 4
+
+    page = papers.search_papers_page('dependency parsing')
+    assert page['total'] == 1
+    assert page['papers'][0]['duplicates'] == 1
+    assert not papers.needs_initialization()
+
+
+def test_search_by_excluded_words_only(tmp_path):
+    papers = PaperDB(tmp_path / 'papers.db')
+    papers._store_papers('ACL', 2020, [
+        {'title': 'Neural parsing', 'authors': 'A', 'abstract': ''},
+        {'title': 'Neural translation', 'authors': 'B', 'abstract': ''},
+        {'title': 'Statistical parsing', 'authors': 'C', 'abstract': ''},
+    ])
+    titles = [paper['title'] for paper in papers.search_papers_page('-parsing')['papers']]
+    assert titles == ['Neural translation']
+    assert papers.get_facets('-parsing')['total'] == 1
+    assert papers.search_papers_page('-parsing venue:EMNLP')['total'] == 0
+
+
+def test_refresh_worker_survives_crawl_state_errors(tmp_path, monkeypatch):
+    papers = PaperDB(tmp_path / 'papers.db')
+    fetched = []
+
+    def fetch_and_store(venue, year):
+        fetched.append((venue, year))
+        if year == 2020:
+            raise ConnectionError('connection reset by peer')
+        return 0
+
+    def record_crawl(venue, year, changed=False, failed=False):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(papers, '_fetch_and_store_papers', fetch_and_store)
+    monkeypatch.setattr(papers, '_record_crawl', record_crawl)
+    papers.fetch_thread = threading.Thread(target=papers._background_fetch_worker, daemon=True)
+    papers.fetch_thread.start()
+    papers.queue_fetch('ACL', 2020)
+    papers.queue_fetch('ACL', 2021)
+    deadline = time.monotonic() + 10
+    while papers.fetch_queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert fetched == [('ACL', 2020), ('ACL', 2021)]
+    assert papers.fetch_thread.is_alive()
+    papers.stop_background_fetch(timeout=10)
+    assert not papers.fetch_thread.is_alive()
@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+from config import FTS_TOKENIZE
+from db.query import CompiledQuery, compile_query
+
+CASES = [
+    # text, match, venue, year, exclude
+    ('parsing', '"parsing"', None, None, None),
+    ('neural parsing', '"neural" AND "parsing"', None, None, None),
+    ('"neural parsing"', '"neural parsing"', None, None, None),
+    ('"unterminated quote', '"unterminated quote"', None, None, None),
+    ('""', None, None, None, None),
+    ('transf*', '"transf"*', None, None, None),
+    ('pre-training', '"pre training"', None, None, None),
+    ('c++', '"c"', None, None, None),
+    ('NEAR(', '"near"', None, None, None),
+    ('NEAR(a b)', '"near a" AND "b"', None, None, None),
+    ('a AND b', '"a" AND "and" AND "b"', None, None, None),
+    ('NOT a', '"not" AND "a"', None, None, None),
+    ('a OR b', '("a" OR "b")', None, None, None),
+    ('a OR', '"a"', None, None, None),
+    ('OR a', '"a"', None, None, None),
+    ('bar -foo', '"bar" NOT "foo"', None, None, None),
+    ('-foo', None, None, None, '"foo"'),
+    ('-foo -bar venue:acl', None, 'ACL', None, '"foo" OR "bar"'),
+    ('-', None, None, None, None),
+    ('x -', '"x"', None, None, None),
+    ('title:parsing', 'title : "parsing"', None, None, None),
+    ('author:"li wei', 'authors : "li wei"', None, None, None),
+    ('abstract:"graph neural"', 'abstract : "graph neural"', None, None, None),
+    ('title:', None, None, None, None),
+    ('title: parsing', '"parsing"', None, None, None),
+    ('parsing author:', '"parsing"', None, None, None),
+    ('foo:bar', '"foo bar"', None, None, None),
+    ('foo:', '"foo"', None, None, None),
+    ('venue:acl', None, 'ACL', None, None),
+    ('venue:"(Star)*SEM" parsing', '"parsing"', '(Star)*SEM', None, None),
+    ('venue:unknown', None, 'unknown', None, None),
+    ('year:2020', None, None, 2020, None),
+    ('year:"2020" parsing', '"parsing"', None, 2020, None),
+    ('year:abc', '"year abc"', None, None, None),
+    ('', None, None, None, None),
+    (None, None, None, None, None),
+]
+
+
+@pytest.mark.parametrize('text, match, venue, year, exclude', CASES, ids=[repr(case[0]) for case in CASES])
+def test_compile_query(text, match, venue, year, exclude):
+    compiled = compile_query(text)
+    assert (compiled.match, compiled.venue, compiled.year, compiled.exclude) == \
+        (match, venue, year, exclude)
+
+
+@pytest.mark.parametrize('text, match', [
+    ('pars', '"pars"*'),
+    ('neural pars', '"neural" AND "pars"*'),
+    ('neural pars ', '"neural" AND "pars"'),
+    ('"neural pars', '"neural pars"'),
+    ('title:', None),
+])
+def test_compile_query_prefix_last(text, match):
+    assert compile_query(text, prefix_last=True).match == match
+
+
+@pytest.fixture(scope='module')
+def fts():
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"CREATE VIRTUAL TABLE t USING FTS5(title, abstract, authors, tokenize='{FTS_TOKENIZE}')")
+    conn.execute("INSERT INTO t VALUES ('C++ templates', 'near duplicates', 'Li Wei')")
+    return conn
+
+
+@pytest.mark.parametrize('text', [case[0] for case in CASES if case[0]] + [
+    'title:(', '")', 'a OR OR b', '* foo', 'foo *', '^start', 'col:"x" NOT', 'AND OR NOT'])
+def test_compiled_query_is_valid_fts5(fts, text):
+    """Whatever the user types, FTS5 accepts the expression"""
+    compiled = compile_query(text)
+    for expression in (compiled.match, compiled.exclude):
+        if expression is not None:
+            fts.execute('SELECT COUNT(*) FROM t WHERE t MATCH ?', (expression,)).fetchone()
+
+
+def test_defaults():
+    assert compile_query('parsing') == CompiledQuery('"parsing"', None, None, ['parsing'], None)
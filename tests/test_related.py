@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from config import RELATED_MIN_SCORE, RELATED_TOP_N
+from db.paper_db import PaperDB
+from db.related import RelatedPapers
+from db.vectors import VectorIndex
+
+TOPICS = ['neural machine translation', 'dependency parsing', 'speech recognition',
+          'question answering', 'image segmentation', 'reinforcement learning']
+WORDS = ['robust', 'multilingual', 'efficient', 'sparse', 'contrastive', 'adaptive',
+         'hierarchical', 'streaming', 'latent', 'bayesian']
+LONER = {'title': 'Medieval tapestry conservation', 'authors': 'Nobody',
+         'abstract': 'Dyeing wool threads for cathedral archives.'}
+
+
+def make_papers(count, offset=0):
+    rng = np.random.default_rng(offset)
+    return [{'title': f'{" ".join(rng.choice(WORDS, 2))} {TOPICS[number % len(TOPICS)]} {number}',
+             'authors': f'Author {number}', 'paper_url': f'http://example.org/{number}',
+             'abstract': f'We study {TOPICS[number % len(TOPICS)]} with '
+                         f'{" ".join(rng.choice(WORDS, 3))} methods.'}
+            for number in range(offset, offset + count)]
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = PaperDB(tmp_path / 'papers.db')
+    db._store_papers('ACL', 2020, make_papers(120))
+    db._store_papers('EMNLP', 2021, make_papers(60, offset=120) + [LONER])
+    yield db
+    VectorIndex.discard(db.db_path)
+
+
+@pytest.fixture
+def related(db):
+    index = VectorIndex.for_db(db)
+    index.build()
+    related = RelatedPapers(db, index)
+    related.build()
+    return related
+
+
+def neighbours(db):
+    result = {}
+    with db.connections.reader() as conn:
+        for paper_id, neighbor_id, score in conn.execute(
+                'SELECT paper_id, neighbor_id, score FROM related'):
+            result.setdefault(paper_id, {})[neighbor_id] = score
+    return result
+
+
+def paper_id(db, title):
+    with db.connections.reader() as conn:
+        return conn.execute('SELECT id FROM papers WHERE title = ?', (title,)).fetchone()[0]
+
+
+def test_neighbours_are_the_top_n_above_the_minimum(db, related):
+    vectors = np.asarray(related.index.vectors)
+    corpus = related._corpus()
+    found = neighbours(db)
+    assert found
+    for paper in corpus:
+        scores = vectors[corpus] @ vectors[paper]
+        scores[corpus == paper] = -np.inf
+        expected = {int(corpus[i]) for i in np.flatnonzero(scores >= RELATED_MIN_SCORE)}
+        got = found.get(int(paper), {})
+        assert len(got) <= RELATED_TOP_N
+        assert paper not in got
+        assert all(score >= RELATED_MIN_SCORE for score in got.values())
+        assert set(got) <= expected
+        if len(expected) <= RELATED_TOP_N:
+            assert set(got) == expected
+        else:
+            assert len(got) == RELATED_TOP_N
+            # Nothing left out scores better than the weakest kept
+            weakest = min(got.values())
+            left_out = [scores[corpus == other][0] for other in expected - set(got)]
+            assert max(left_out) <= weakest + 1e-4
+
+
+def test_unrelated_paper_has_no_neighbours(db, related):
+    loner = paper_id(db, LONER['title'])
+    assert loner not in neighbours(db)
+    assert db.get_related_papers(loner) == []
+
+
+def test_nothing_pending_after_build(related):
+    assert related.is_built()
+    assert related.pending() == []
+    assert related.update() == 0
+
+
+def test_new_papers_are_pending(db, related):
+    db._store_papers('ACL', 2020, make_papers(3, offset=500))
+    related.index.update()
+    assert related.pending() == [('ACL', 2020)]
+    assert related.update() == 123
+    assert related.pending() == []
+
+
+def test_edited_papers_are_pending(db, related):
+    edited = make_papers(1)[0]
+    edited['abstract'] = 'Hierarchical speech recognition with streaming latent methods.'
+    assert db._store_papers('ACL', 2020, [edited]) == 1
+
+    # Not before the index has embedded the edit
+    assert related.pending() == []
+    related.index.update()
+    assert related.pending() == [('ACL', 2020)]
+    assert related.update() == 120
+    assert related.pending() == []
+
+    # Recomputed against the new abstract
+    edited_id = paper_id(db, edited['title'])
+    vectors = np.asarray(related.index.vectors)
+    corpus = related._corpus()
+    scores = vectors[corpus] @ vectors[edited_id]
+    scores[corpus == edited_id] = -np.inf
+    best = int(corpus[np.argmax(scores)])
+    assert best in neighbours(db)[edited_id]
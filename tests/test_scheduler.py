@@ -0,0 +1,134 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import db.scheduler
+from config import REFRESH_INTERVALS
+from db.paper_db import PaperDB
+from db.scheduler import RefreshScheduler
+
+NOW = datetime(2024, 6, 1, 12, 0)
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+class FakeDB:
+    def __init__(self, state=None):
+        self.state = state or {}
+        self.queued = []
+
+    def get_crawl_state(self):
+        return self.state
+
+    def queue_fetch(self, venue, year, priority=0):
+        if (venue, year) in [(v, y) for _, v, y in self.queued]:
+            return False
+        self.queued.append((priority, venue, year))
+        return True
+
+
+def crawl(last_fetched, failure_count=0):
+    return {'last_fetched': last_fetched.isoformat(), 'failure_count': failure_count}
+
+
+@pytest.fixture(autouse=True)
+def few_venues(monkeypatch):
+    monkeypatch.setattr(db.scheduler, 'VENUE_GROUPS', {'ACL': ['ACL'], 'ML': ['ICML']})
+    monkeypatch.setattr(db.scheduler, 'INGEST_YEARS', range(2020, 2025))
+
+
+@pytest.mark.parametrize('year, interval', [
+    (2025, REFRESH_INTERVALS['current']),  # upcoming
+    (2024, REFRESH_INTERVALS['current']),
+    (2023, REFRESH_INTERVALS['recent']),
+    (2022, REFRESH_INTERVALS['archive']),
+    (2010, REFRESH_INTERVALS['archive']),
+])
+def test_interval_by_age(year, interval):
+    assert RefreshScheduler(FakeDB()).refresh_interval(year, 0, NOW) == interval
+
+
+def test_failures_back_off_up_to_the_archive_interval():
+    scheduler = RefreshScheduler(FakeDB())
+    intervals = [scheduler.refresh_interval(2024, failures, NOW) for failures in range(12)]
+    assert intervals[:4] == [REFRESH_INTERVALS['current'] * factor for factor in (1, 2, 4, 8)]
+    assert intervals == sorted(intervals)
+    assert max(intervals) == REFRESH_INTERVALS['archive'] == timedelta(days=30)
+    assert scheduler.refresh_interval(2024, 1000, NOW) == REFRESH_INTERVALS['archive']
+    assert scheduler.refresh_interval(2010, 5, NOW) == REFRESH_INTERVALS['archive']
+
+
+def test_due_jobs():
+    scheduler = RefreshScheduler(FakeDB({
+        ('ACL', 2024): crawl(NOW - 2 * HOUR),       # fresh for 6 hours
+        ('ICML', 2024): crawl(NOW - 7 * HOUR),      # stale
+        ('ACL', 2023): crawl(NOW - 12 * HOUR),      # fresh for a day
+        ('ICML', 2023): crawl(NOW - 2 * DAY),       # stale
+        ('ACL', 2020): crawl(NOW - 29 * DAY),       # fresh for 30 days
+        ('ICML', 2020): crawl(NOW - 31 * DAY),      # stale
+        ('ACL', 2025): crawl(NOW - 10 * HOUR, 1),   # failed once: fresh for 12 hours
+        ('ICML', 2025): crawl(NOW - 13 * HOUR, 1),  # ...and now stale
+        ('ACL', 2021): crawl(NOW - 29 * DAY, 3),    # backed off, but never past 30 days
+        ('ICML', 2021): crawl(NOW - 31 * DAY, 3),
+        ('ACL', 2022): {'last_fetched': None, 'failure_count': 0},
+    }))
+    # Current and upcoming years first, then by age; never crawled ones are due
+    assert scheduler.due_jobs(NOW) == [
+        (0, 'ICML', 2024), (0, 'ICML', 2025),
+        (1, 'ICML', 2023),
+        (2, 'ACL', 2022), (2, 'ICML', 2022),
+        (3, 'ICML', 2021),
+        (4, 'ICML', 2020),
+    ]
+    # Half a day later the current year is due again, the archive not yet
+    assert [(venue, year) for _, venue, year in scheduler.due_jobs(NOW + 12 * HOUR)
+            if (venue, year) in (('ACL', 2020), ('ACL', 2024))] == [('ACL', 2024)]
+
+
+def test_run_once_queues_each_job_once():
+    fake = FakeDB()
+    scheduler = RefreshScheduler(fake)
+    queued = scheduler.run_once()
+    assert queued == len(fake.queued) > 0
+    assert scheduler.run_once() == 0
+
+
+def test_stop_ends_the_scheduler_thread():
+    fake = FakeDB()
+    scheduler = RefreshScheduler(fake, check_interval=3600)
+    scheduler.start()
+    scheduler.stop(timeout=10)
+    assert not scheduler._thread.is_alive()
+    assert fake.queued  # it ran once before waiting
+
+
+def test_stop_sentinel_goes_ahead_of_queued_jobs(tmp_path, monkeypatch):
+    papers = PaperDB(tmp_path / 'papers.db')
+    started = threading.Event()
+    release = threading.Event()
+    fetched = []
+
+    def fetch_and_store(venue, year):
+        fetched.append((venue, year))
+        started.set()
+        release.wait(10)
+        return 0
+
+    monkeypatch.setattr(papers, '_fetch_and_store_papers', fetch_and_store)
+    papers.fetch_thread = threading.Thread(target=papers._background_fetch_worker, daemon=True)
+    papers.fetch_thread.start()
+    papers.queue_fetch('ACL', 2024)
+    assert started.wait(10)
+    papers.queue_fetch('ACL', 2023, priority=0)
+    papers.queue_fetch('ACL', 2022, priority=0)
+
+    stopping = threading.Thread(target=papers.stop_background_fetch, kwargs={'timeout': 10})
+    stopping.start()
+    release.set()
+    stopping.join(10)
+
+    # The job under way finishes; the queued ones are left for the next start
+    assert not papers.fetch_thread.is_alive()
+    assert fetched == [('ACL', 2024)]
+    assert papers.fetch_queue.qsize() == 2
@@ -0,0 +1,37 @@
+import threading
+
+from config import SEARCH_FANOUT_WORKERS
+from search import UnifiedSearch
+
+
+class FakeDB:
+    def search_papers_page(self, query, limit):
+        return {'papers': [{'id': 1, 'title': 'Neural translation', 'rank': -2.0}]}
+
+
+class StuckArXiv:
+    """An arXiv API that does not answer until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def search(self, query, categories, start, limit):
+        self.release.wait(30)
+        return []
+
+
+def test_slow_remote_source_does_not_starve_local_searches():
+    arxiv = StuckArXiv()
+    unified = UnifiedSearch(FakeDB(), arxiv, timeouts={'local': 1.0, 'arxiv': 0.05})
+    try:
+        # More searches than there are workers of all sources together
+        results = [unified.search('translation') for _ in range(3 * SEARCH_FANOUT_WORKERS['arxiv'])]
+    finally:
+        arxiv.release.set()
+
+    assert all(result['sources']['local']['status'] == 'ok' for result in results)
+    assert [paper['title'] for paper in results[-1]['papers']] == ['Neural translation']
+    statuses = [result['sources']['arxiv']['status'] for result in results]
+    # Each stuck call holds an arXiv worker; later searches skip arXiv instead of queueing
+    assert statuses.count('timeout') == SEARCH_FANOUT_WORKERS['arxiv']
+    assert set(statuses[SEARCH_FANOUT_WORKERS['arxiv']:]) == {'busy'}
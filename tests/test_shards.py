@@ -0,0 +1,95 @@
+import os
+import signal
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from db.paper_db import PaperDB
+from db.shards import ShardedIndex
+
+TOPICS = ['neural translation', 'parsing', 'speech recognition', 'question answering']
+
+
+def make_papers(count, offset=0):
+    return [{'title': f'{TOPICS[number % len(TOPICS)]} study {number}',
+             'authors': f'Author {number}', 'paper_url': f'http://example.org/{number}',
+             'abstract': f'We report on {TOPICS[number % len(TOPICS)]} experiment {number}.'}
+            for number in range(offset, offset + count)]
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = PaperDB(tmp_path / 'papers.db')
+    db._store_papers('ACL', 2020, make_papers(40))
+    yield db
+    # Stops the worker processes of the shards built by the test
+    ShardedIndex.discard(db.db_path)
+
+
+@pytest.fixture
+def shards(db):
+    shards = ShardedIndex.for_db(db)
+    shards.build(shards=2)
+    return shards
+
+
+def test_search_matches_the_single_index(db, shards):
+    page = db.search_papers_page('parsing', limit=50)
+    assert page['total'] == 10
+    ids, total = shards.search('parsing', k=50, count=True)
+    assert total == 10
+    assert sorted(paper_id for _, paper_id in ids) == sorted(paper['id'] for paper in page['papers'])
+
+
+def test_dead_workers_get_a_fresh_pool(shards):
+    shards.search('parsing')
+    for process in list(shards._executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+    with pytest.raises(BrokenProcessPool):
+        shards.search('parsing')
+    ids, _ = shards.search('parsing', k=50)
+    assert len(ids) == 10
+
+
+def test_failed_routing_survives_a_restart(db, shards, monkeypatch):
+    def fail(conn, papers):
+        raise RuntimeError('disk full')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ShardedIndex, '_write', staticmethod(fail))
+        db._store_papers('ACL', 2021, make_papers(8, offset=100))
+    assert shards.behind
+
+    # As after a restart: nothing but meta.json remembers the failure
+    ShardedIndex.discard(db.db_path)
+    restarted = PaperDB(db.db_path)
+    assert restarted.shard_index().behind
+    # Searches use the main index meanwhile, which has the papers
+    assert restarted.search_papers_page('parsing', limit=50)['total'] == 12
+
+    restarted._store_papers('ACL', 2022, make_papers(4, offset=200))
+    shards = restarted.shard_index()
+    assert not shards.behind
+    _, total = shards.search('parsing', count=True)
+    assert total == 13
+
+
+def test_pages_stay_with_the_index_that_ranked_them(db, shards, monkeypatch):
+    first = db.search_papers_page('study', limit=15)
+    assert first['next_cursor'][2:] == ('shards',)
+
+    # Shards failing partway through the pages: the main index starts over
+    monkeypatch.setattr(ShardedIndex, 'search', lambda *args, **kwargs: 1 / 0)
+    restarted = db._search_papers_page('study', cursor=first['next_cursor'], limit=15)
+    assert [paper['id'] for paper in restarted['papers']] == \
+        [paper['id'] for paper in db._search_papers_page('study', limit=15)['papers']]
+    assert len(restarted['next_cursor']) == 2
+
+
+def test_main_index_cursor_is_not_handed_to_the_shards(db, shards, monkeypatch):
+    monkeypatch.setattr(ShardedIndex, 'search', lambda *args, **kwargs: 1 / 0)
+    first = db._search_papers_page('study', limit=15)
+    monkeypatch.undo()
+    second = db._search_papers_page('study', cursor=first['next_cursor'], limit=50)
+    ids = [paper['id'] for paper in first['papers'] + second['papers']]
+    assert sorted(ids) == sorted(set(ids)) and len(ids) == 40
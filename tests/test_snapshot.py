@@ -0,0 +1,52 @@
+import json
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import db.snapshot
+from config import SNAPSHOT_COMPRESSION
+from db.paper_db import PaperDB
+from db.snapshot import export_snapshot, import_snapshot
+from db.vectors import VectorIndex
+
+
+def make_paper(number):
+    return {'title': f'Paper number {number} on neural translation', 'authors': 'Ada Lovelace',
+            'abstract': f'Abstract {number} about translation models.'}
+
+
+def test_vectors_are_never_ahead_of_the_exported_papers(tmp_path, monkeypatch):
+    paper_db = PaperDB(tmp_path / 'papers.db')
+    paper_db._store_papers('ACL', 2020, [make_paper(number) for number in range(20)])
+    index = VectorIndex.for_db(paper_db)
+    index.build()
+    export_vectors = db.snapshot._export_vectors
+    updated = []
+
+    def store():
+        paper_db._store_papers('ACL', 2021, [make_paper(number) for number in range(5)])
+        updated.append(index.update())
+
+    def store_then_export_vectors(db_, directory):
+        # Papers stored and embedded by another thread once the export has begun
+        thread = threading.Thread(target=store)
+        thread.start()
+        thread.join()
+        export_vectors(db_, directory)
+
+    monkeypatch.setattr(db.snapshot, '_export_vectors', store_then_export_vectors)
+    try:
+        manifest = export_snapshot(paper_db, tmp_path / 'snapshot')
+    finally:
+        VectorIndex.discard(paper_db.db_path)
+
+    with pa.CompressedInputStream(str(tmp_path / 'snapshot' / 'vectors' / 'meta.json'), SNAPSHOT_COMPRESSION) as f:
+        vectors_meta = json.loads(f.read())
+    papers = pq.read_table(tmp_path / 'snapshot' / 'papers.parquet')
+    assert updated == [5]
+    assert papers.num_rows == manifest['tables']['papers']['rows'] == 25
+    assert max(papers.column('id').to_pylist()) + 1 >= vectors_meta['rows']
+
+    result = import_snapshot(tmp_path / 'snapshot', tmp_path / 'imported.db')
+    assert result['papers'] == papers.num_rows
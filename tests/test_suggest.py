@@ -0,0 +1,31 @@
+import pytest
+
+from config import SUGGEST_TOP_K
+from db.paper_db import PaperDB
+from db.suggest import Suggester
+
+# More words starting with "ne" than are precomputed for the prefix, each in
+# a different number of titles
+WORDS = ['network', 'neural', 'negation', 'nested', 'news', 'never', 'nexus', 'neighbour',
+         'nebula', 'nectar', 'needle', 'neutral', 'nerve', 'nest', 'netting']
+
+
+@pytest.fixture
+def suggester(tmp_path):
+    db = PaperDB(tmp_path / 'papers.db')
+    papers = [{'title': f'On {word} ({copy})', 'authors': 'Ada Lovelace', 'abstract': ''}
+              for rank, word in enumerate(WORDS) for copy in range(2 + len(WORDS) - rank)]
+    db._store_papers('ACL', 2020, papers)
+    yield Suggester.for_db(db)
+    Suggester.discard(db.db_path)
+
+
+def test_short_prefix_returns_more_than_the_precomputed_top(suggester):
+    suggestions = suggester.suggest('ne', k=len(WORDS))
+    assert [s['text'] for s in suggestions] == WORDS
+
+
+def test_scan_agrees_with_the_precomputed_top(suggester):
+    precomputed = suggester.suggest('ne', k=SUGGEST_TOP_K)
+    assert len(precomputed) == SUGGEST_TOP_K
+    assert suggester.suggest('ne', k=SUGGEST_TOP_K + 4)[:SUGGEST_TOP_K] == precomputed
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from db.paper_db import PaperDB
+from db.vectors import VectorIndex
+
+TOPICS = ['neural machine translation', 'dependency parsing', 'speech recognition',
+          'question answering', 'image segmentation', 'reinforcement learning',
+          'graph neural networks', 'topic modelling']
+WORDS = ['robust', 'multilingual', 'efficient', 'sparse', 'contrastive', 'adaptive',
+         'hierarchical', 'streaming', 'latent', 'bayesian', 'federated', 'curriculum']
+
+
+def make_papers(count, offset=0):
+    rng = np.random.default_rng(offset)
+    return [{'title': f'{" ".join(rng.choice(WORDS, 2))} {TOPICS[number % len(TOPICS)]} {number}',
+             'authors': f'Author {number}', 'paper_url': f'http://example.org/{number}',
+             'abstract': f'We study {TOPICS[(number * 3) % len(TOPICS)]} with '
+                         f'{" ".join(rng.choice(WORDS, 3))} methods.'}
+            for number in range(offset, offset + count)]
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = PaperDB(tmp_path / 'papers.db')
+    db._store_papers('ACL', 2020, make_papers(300))
+    yield db
+    VectorIndex.discard(db.db_path)
+
+
+@pytest.fixture
+def index(db):
+    index = VectorIndex.for_db(db)
+    assert index.build() == 300
+    return index
+
+
+def brute_force(index, query_vector, k):
+    scores = np.asarray(index.vectors) @ query_vector
+    top = np.argsort(-scores, kind='stable')[:k]
+    return top, scores
+
+
+@pytest.mark.parametrize('query', ['dependency parsing', 'robust speech recognition',
+                                   'sparse graph neural networks', 'bayesian topic'])
+def test_search_probing_every_list_is_exact(index, query):
+    query_vector = index.embed_query(query)
+    top, scores = brute_force(index, query_vector, 10)
+    results = index.search(query_vector, 10, nprobe=len(index.centroids))
+    assert [score for _, score in results] == pytest.approx(scores[top].tolist(), abs=1e-5)
+    # Ties aside, the same papers
+    assert {paper_id for paper_id, _ in results} >= {
+        int(paper_id) for paper_id in top if scores[paper_id] > scores[top[-1]] + 1e-5}
+
+
+def test_search_scores_are_cosine_and_best_first(index):
+    query_vector = index.embed_query('question answering')
+    results = index.search(query_vector, 20)
+    assert results
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    ids = [paper_id for paper_id, _ in results]
+    assert scores == pytest.approx(index.similarities(query_vector, ids).tolist(), abs=1e-5)
+
+
+def test_search_recall_at_default_nprobe(index):
+    recalls = []
+    for query in TOPICS:
+        query_vector = index.embed_query(query)
+        top, _ = brute_force(index, query_vector, 10)
+        found = {paper_id for paper_id, _ in index.search(query_vector, 10)}
+        recalls.append(len(found & set(top.tolist())) / 10)
+    assert np.mean(recalls) >= 0.8
+
+
+def test_update_embeds_only_new_and_changed_papers(db, index):
+    watermark = index.meta['watermark']
+    assert index.update() == 0
+
+    edited = make_papers(1)[0]
+    edited['abstract'] = 'An entirely new abstract about federated speech recognition.'
+    db._store_papers('ACL', 2020, [edited] + make_papers(5, offset=300))
+    assert index.update() == 6
+    assert index.meta['watermark'] > watermark
+    assert index.meta['rows'] >= 306
+    with db.connections.reader() as conn:
+        assert index.meta['watermark'] == conn.execute(
+            'SELECT MAX(last_updated) FROM papers').fetchone()[0]
+        edited_id = conn.execute('SELECT id FROM papers WHERE title = ?',
+                                 (edited['title'],)).fetchone()[0]
+
+    # Embedded as a fresh build would, and filed under a list
+    rebuilt = index.embedder.embed([(edited['title'], edited['abstract'])])[0]
+    assert np.asarray(index.vectors[edited_id]) == pytest.approx(rebuilt, abs=1e-6)
+    assert index.assign[edited_id] >= 0
+    new_ids = np.flatnonzero(np.asarray(index.assign) >= 0)
+    assert len(new_ids) == 305
+    assert index.get_stats()['papers'] == 305
+
+    # Nothing left to embed, and the watermark survives a reload
+    assert index.update() == 0
+    VectorIndex.discard(db.db_path)
+    assert VectorIndex.for_db(db).meta['watermark'] == index.meta['watermark']
+
+
+def test_unchanged_upsert_is_not_reembedded(db, index):
+    db._store_papers('ACL', 2020, make_papers(10))
+    assert index.update() == 0
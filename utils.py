@@ -1,6 +1,5 @@
 import streamlit as st
-import math
-from config import PAPERS_PER_PAGE
+import metrics
 from config import VENUE_GROUPS
 from parsers.acl_parser import ACLPaperParser
 from parsers.ml_parser import MLConferencePaperParser
@@ -15,8 +14,17 @@ def initialize_session_state():
         st.session_state.current_page = 1
     if 'search_query' not in st.session_state:
         st.session_state.search_query = ""
-    if 'filtered_papers' not in st.session_state:
-        st.session_state.filtered_papers = []
+    if 'search_page' not in st.session_state:
+        st.session_state.search_page = None
+    if 'page_cursors' not in st.session_state:
+        st.session_state.page_cursors = [None]
+    # Pages of the arXiv tab when it searches the local mirror
+    if 'arxiv_search_page' not in st.session_state:
+        st.session_state.arxiv_search_page = None
+    if 'arxiv_current_page' not in st.session_state:
+        st.session_state.arxiv_current_page = 1
+    if 'arxiv_page_cursors' not in st.session_state:
+        st.session_state.arxiv_page_cursors = [None]
     if 'current_arxiv_query' not in st.session_state:
         st.session_state.current_arxiv_query = ""
     if 'current_arxiv_categories' not in st.session_state:
@@ -86,16 +94,28 @@ def display_paper_card(paper):
 @st.dialog("Abstract")
 def view_abstract(item):
     st.write(item['abstract'])
+    # Local papers also list their precomputed neighbours, if the related job has run
+    related = st.session_state.db.get_related_papers(item['id']) if item.get('id') else []
+    if related:
+        st.markdown("**Similar papers**")
+        for paper in related:
+            st.markdown(f"- [{paper['title']}]({paper['paper_url']}) "
+                        f"<small>{paper['venue']} {paper['year']}</small>", unsafe_allow_html=True)
 
 
-def display_papers():
-    papers_to_display = st.session_state.filtered_papers
-    total_papers = len(papers_to_display)
+@metrics.timed('render', kind='papers')
+def display_papers(prefix: str = ""):
+    """
+    Render the current page of a local search
+    prefix selects the tab's session state (search_page, current_page,
+    page_cursors) and keeps its widget keys apart from other tabs
+    """
+    page = st.session_state[f"{prefix}search_page"]
+    current_page = st.session_state[f"{prefix}current_page"]
 
-    if total_papers > 0:
-        total_pages = math.ceil(total_papers / PAPERS_PER_PAGE)
-        start_idx = (st.session_state.current_page - 1) * PAPERS_PER_PAGE
-        end_idx = min(start_idx + PAPERS_PER_PAGE, total_papers)
+    if page and page['papers']:
+        total = f"{page['total']}+" if page['total_is_estimate'] else page['total']
+        st.caption(f"{total} papers found")
 
         # Create table headers
         col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
@@ -109,35 +129,97 @@ def display_papers():
             st.markdown("**Abstract**")
 
         # Create table rows
-        for paper in papers_to_display[start_idx:end_idx]:
+        for paper in page['papers']:
             col1, col2, col3, col4 = st.columns([3, 2, 1.5, 1])
             with col1:
                 st.markdown(f"[{paper['title']}]({paper['paper_url']})")
             with col2:
                 st.markdown(f"{paper['authors']}")
             with col3:
-                st.markdown(f"{paper['venue']}")
+                # Near duplicates (Findings, workshop or arXiv versions) are collapsed into this row
+                versions = f" (+{paper['duplicates']})" if paper.get('duplicates') else ""
+                st.markdown(f"{paper['venue']} {paper['year']}{versions}")
             with col4:
-                if paper.get('abstract'):
-                    if st.button("View", key=f"abstract_{paper['id']}"):
-                        view_abstract(paper)
+                if paper['has_abstract']:
+                    if st.button("View", key=f"{prefix}abstract_{paper['id']}"):
+                        view_abstract({'id': paper['id'],
+                                       'abstract': st.session_state.db.get_abstract(paper['id'])})
 
         # Pagination
         col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
         with col1:
-            if st.session_state.current_page > 1:
-                if st.button("Previous", type="primary"):
-                    st.session_state.current_page -= 1
+            if current_page > 1:
+                if st.button("Previous", type="primary", key=f"{prefix}prev_page"):
+                    st.session_state[f"{prefix}current_page"] -= 1
                     st.rerun()
         # with col3:
-        #     st.write(f"Page {st.session_state.current_page} of {total_pages}")
+        #     st.write(f"Page {st.session_state.current_page}")
         with col4:
-            if st.session_state.current_page < total_pages:
-                if st.button("Next", type="primary"):
-                    st.session_state.current_page += 1
+            if page['next_cursor'] is not None:
+                if st.button("Next", type="primary", key=f"{prefix}next_page"):
+                    # Remember where the next page starts so Previous can return to it
+                    cursors = st.session_state[f"{prefix}page_cursors"]
+                    del cursors[current_page:]
+                    cursors.append(page['next_cursor'])
+                    st.session_state[f"{prefix}current_page"] += 1
                     st.rerun()
 
 
+def display_suggestions(suggestions, input_key: str):
+    """Show completions as buttons that replace the text of the input input_key"""
+    if not suggestions:
+        return
+
+    def use(query):
+        st.session_state[input_key] = query
+
+    cols = st.columns(len(suggestions))
+    for col, suggestion in zip(cols, suggestions):
+        with col:
+            st.button(suggestion['text'], key=f"{input_key}_suggest_{suggestion['query']}",
+                      help=f"{suggestion['kind']}, {suggestion['count']} papers",
+                      on_click=use, args=(suggestion['query'],))
+
+
+@metrics.timed('render', kind='unified')
+def display_unified_results(result):
+    """Render merged results of a UnifiedSearch, noting sources that were left out"""
+    if not result:
+        return
+
+    for name, source in result['sources'].items():
+        if source['status'] != 'ok':
+            st.caption(f"{name}: {source['status']} after {source['elapsed_ms']:.0f} ms, "
+                       "results are partial")
+    if not result['papers']:
+        st.caption("No papers found")
+        return
+
+    col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+    with col1:
+        st.markdown("**Title**")
+    with col2:
+        st.markdown("**Authors**")
+    with col3:
+        st.markdown("**Venue**")
+    with col4:
+        st.markdown("**Abstract**")
+
+    for position, paper in enumerate(result['papers']):
+        col1, col2, col3, col4 = st.columns([3, 2, 1.5, 1])
+        with col1:
+            st.markdown(f"[{paper['title']}]({paper['paper_url']})")
+        with col2:
+            st.markdown(f"{paper['authors']}")
+        with col3:
+            st.markdown(f"{paper['venue']} {paper['year']}")
+        with col4:
+            if paper['has_abstract']:
+                if st.button("View", key=f"unified_abstract_{position}"):
+                    abstract = paper.get('abstract') or st.session_state.db.get_abstract(paper['id'])
+                    view_abstract({'abstract': abstract})
+
+
 def get_parser_for_venue(venue):
     """Return appropriate parser based on venue"""
     if venue in VENUE_GROUPS["ACL"]:
@@ -148,6 +230,7 @@ def get_parser_for_venue(venue):
         raise ValueError(f"No parser found for venue: {venue}")
 
 
+@metrics.timed('render', kind='arxiv')
 def display_arxiv_papers(papers):
     if not papers:
         return